@@ -0,0 +1,14 @@
+"""Async data access (motor)"""
+from .mongo import (
+    Repositories,
+    Repository,
+    UserRepository,
+    TeamRepository,
+    WalletRepository,
+    TransactionRepository,
+    WithdrawalRepository,
+    TopupRepository,
+    KycRepository,
+    SettingsRepository,
+    UserStatsRepository,
+)
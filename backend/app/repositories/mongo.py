@@ -0,0 +1,233 @@
+"""
+Async repositories on motor
+Request handlers are ``async def`` but pymongo blocks the event loop, so one
+slow query stalls every other request on the worker. These repositories
+wrap motor collections and expose the reads and writes the hot endpoints
+need as coroutines. Each one takes its collection in the constructor, the
+same way the services take pymongo collections, and returns plain
+documents (no serialization).
+
+Bulk and set-based work (EOD, reports, rebuilds) stays on pymongo in
+worker threads or processes; the repositories are for the
+request/response path.
+"""
+from typing import Dict, Iterable, List, Optional
+from bson import ObjectId
+from pymongo import DESCENDING
+
+from app.services.tree_service import (
+    ANCESTOR_PROJECTION,
+    SUBTREE_EDGE_PROJECTION,
+    ancestor_path_steps,
+    collect_subtree_edges,
+    subtree_edges_pipeline,
+)
+from app.services.user_stats import user_stats_view
+
+
+def to_object_id(value) -> Optional[ObjectId]:
+    if isinstance(value, ObjectId):
+        return value
+    return ObjectId(value) if isinstance(value, str) and ObjectId.is_valid(value) else None
+
+
+class Repository:
+    """Common helpers over one motor collection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one(query, projection)
+
+    async def find(self, query: dict, projection: Optional[dict] = None, sort: Optional[list] = None,
+                   skip: int = 0, limit: int = 0) -> List[dict]:
+        cursor = self.collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    async def count(self, query: dict) -> int:
+        return await self.collection.count_documents(query)
+
+    async def aggregate(self, pipeline: list) -> List[dict]:
+        return await self.collection.aggregate(pipeline).to_list(length=None)
+
+    async def insert(self, document: dict) -> ObjectId:
+        result = await self.collection.insert_one(document)
+        return result.inserted_id
+
+
+class UserRepository(Repository):
+
+    async def get(self, user_id, projection: Optional[dict] = None) -> Optional[dict]:
+        object_id = to_object_id(user_id)
+        if object_id is None:
+            return None
+        return await self.collection.find_one({"_id": object_id}, projection)
+
+    async def get_many(self, user_ids: Iterable, projection: Optional[dict] = None) -> Dict[str, dict]:
+        """{str(_id): user} for the given ids (missing users are left out)"""
+        object_ids = [object_id for object_id in map(to_object_id, user_ids) if object_id is not None]
+        if not object_ids:
+            return {}
+        users = await self.find({"_id": {"$in": object_ids}}, projection)
+        return {str(user["_id"]): user for user in users}
+
+    async def get_by_referral_id(self, referral_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"referralId": referral_id}, projection)
+
+    async def get_by_id_or_referral(self, identifier: str, projection: Optional[dict] = None) -> Optional[dict]:
+        """By MongoDB _id first, then by referralId"""
+        user = await self.get(identifier, projection)
+        if user:
+            return user
+        return await self.get_by_referral_id(identifier, projection)
+
+    async def username_taken(self, username: str) -> bool:
+        return await self.collection.find_one({"username": username}, {"_id": 1}) is not None
+
+    async def email_taken(self, email: Optional[str]) -> bool:
+        if not email:
+            return False
+        return await self.collection.find_one({"email": email}, {"_id": 1}) is not None
+
+    async def count_by_mobile(self, mobile: str) -> int:
+        return await self.collection.count_documents({"mobile": mobile})
+
+    async def replace_password_hash(self, user_id, old_hash: str, new_hash: str) -> bool:
+        """Swap in a rehashed password unless the password changed meanwhile"""
+        result = await self.collection.update_one(
+            {"_id": to_object_id(user_id), "password": old_hash},
+            {"$set": {"password": new_hash}}
+        )
+        return result.modified_count == 1
+
+    async def delete(self, user_id) -> None:
+        await self.collection.delete_one({"_id": to_object_id(user_id)})
+
+
+class TeamRepository(Repository):
+
+    async def ancestor_path(self, user_id: str) -> List[dict]:
+        """
+        Materialized ancestor path (nearest first), as
+        tree_service.get_ancestor_path. Legacy records without a path are
+        walked upward and the path is persisted.
+        """
+        steps = ancestor_path_steps(user_id)
+        reply = None
+        try:
+            while True:
+                step = steps.send(reply)
+                if step[0] == "find":
+                    reply = await self.collection.find_one({"userId": step[1]}, ANCESTOR_PROJECTION)
+                else:
+                    await self.collection.update_one({"_id": step[1]}, {"$set": {"ancestors": step[2]}})
+                    reply = None
+        except StopIteration as done:
+            return done.value
+
+    async def subtree_edges(self, root_id: str, max_depth: int) -> List[dict]:
+        """Every team edge below root_id, as tree_service.get_subtree_edges"""
+        if max_depth < 1:
+            return []
+        if max_depth == 1:
+            return [dict(edge, depth=1) for edge in await self.find({"sponsorId": root_id}, SUBTREE_EDGE_PROJECTION)]
+        rows = await self.aggregate(subtree_edges_pipeline(self.collection.name, root_id, max_depth))
+        return collect_subtree_edges(rows)
+
+
+class WalletRepository(Repository):
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"userId": user_id})
+
+    async def create(self, user_id: str, now) -> None:
+        await self.collection.insert_one({
+            "userId": user_id,
+            "balance": 0,
+            "totalEarnings": 0,
+            "totalWithdrawals": 0,
+            "createdAt": now,
+            "updatedAt": now
+        })
+
+    async def delete(self, user_id: str) -> None:
+        await self.collection.delete_one({"userId": user_id})
+
+
+class TransactionRepository(Repository):
+
+    @staticmethod
+    def _user_query(user_id: str, exclude_types: Iterable[str]) -> dict:
+        query = {"userId": user_id}
+        exclude_types = list(exclude_types)
+        if exclude_types:
+            query["type"] = {"$nin": exclude_types}
+        return query
+
+    async def for_user(self, user_id: str, exclude_types: Iterable[str] = (), skip: int = 0,
+                       limit: int = 50) -> List[dict]:
+        """Newest first"""
+        return await self.find(
+            self._user_query(user_id, exclude_types), sort=[("createdAt", DESCENDING)], skip=skip, limit=limit
+        )
+
+    async def count_for_user(self, user_id: str, exclude_types: Iterable[str] = ()) -> int:
+        return await self.count(self._user_query(user_id, exclude_types))
+
+
+class WithdrawalRepository(Repository):
+
+    async def for_user(self, user_id: str) -> List[dict]:
+        return await self.find({"userId": user_id}, sort=[("requestedAt", DESCENDING)])
+
+
+class TopupRepository(Repository):
+
+    async def for_user(self, user_id: str) -> List[dict]:
+        return await self.find({"userId": user_id}, sort=[("requestedAt", DESCENDING)])
+
+    async def pending_for_user(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"userId": user_id, "status": "PENDING"})
+
+
+class KycRepository(Repository):
+
+    async def latest_for_user(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"userId": user_id}, sort=[("createdAt", DESCENDING)])
+
+
+class SettingsRepository(Repository):
+
+    async def get(self) -> dict:
+        return await self.collection.find_one({}) or {}
+
+
+class UserStatsRepository(Repository):
+
+    async def get(self, user_id: str, now) -> dict:
+        """Stats for one user (see user_stats.user_stats_view)"""
+        return user_stats_view(await self.collection.find_one({"userId": user_id}, {"_id": 0}), now)
+
+
+class Repositories:
+    """Every repository over one motor database"""
+
+    def __init__(self, db):
+        self.db = db
+        self.users = UserRepository(db["users"])
+        self.teams = TeamRepository(db["teams"])
+        self.wallets = WalletRepository(db["wallets"])
+        self.transactions = TransactionRepository(db["transactions"])
+        self.withdrawals = WithdrawalRepository(db["withdrawals"])
+        self.topups = TopupRepository(db["topups"])
+        self.kyc = KycRepository(db["kyc_submissions"])
+        self.settings = SettingsRepository(db["settings"])
+        self.user_stats = UserStatsRepository(db["user_stats"])
+        self.cache_versions = Repository(db["cache_versions"])
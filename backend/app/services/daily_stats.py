@@ -0,0 +1,260 @@
+"""
+Daily Stats - Materialized business figures per IST day
+One document per IST calendar date in ``daily_stats`` replaces the
+per-day scans of users, topups, withdrawals and transactions the admin
+reports used to run:
+
+    {date,                                  YYYY-MM-DD (IST), unique
+     newUsers,                              members registered that day
+     topups: {count, amount},               topups approved that day
+     payouts: {count, amount},              withdrawals approved that day
+     transactions: {<type>: {count, amount}},
+     planActivations: {<plan name>: {count, amount}},
+     totalUsers, activeUsers, carryForwardPV,   end-of-day snapshot
+     updatedAt, rolledUpAt}
+
+The write paths (registration, topup / withdrawal approval, plan
+activation, EOD matching) $inc today's document as they go. The nightly
+"dailyStats" EOD stage (eod_pipeline.rollup_daily_stats) then recomputes the
+day from the source collections and $sets the totals, so drift from a
+failed request never outlives the day. rebuild_daily_stats does the same for
+every date in the history (first deploy, or after a data repair).
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import pytz
+from pymongo import UpdateOne
+
+from app.services.user_stats import ist_day
+
+IST = pytz.timezone('Asia/Kolkata')
+
+COUNTER_SECTIONS = ("topups", "payouts")
+MAP_SECTIONS = ("transactions", "planActivations")
+
+
+def _field_key(name: str) -> str:
+    """Plan names become field names: no dots, no leading $"""
+    return str(name).replace(".", "_").lstrip("$") or "_"
+
+
+def _inc(daily_stats_collection, now: datetime, inc: dict, extra_set: Optional[dict] = None):
+    daily_stats_collection.update_one(
+        {"date": ist_day(now)},
+        {"$inc": inc, "$set": {"updatedAt": now, **(extra_set or {})}},
+        upsert=True
+    )
+
+
+def record_registration(daily_stats_collection, created_at: datetime, delta: int = 1):
+    """A member registered (or, with delta=-1, a member created that day was deleted)"""
+    _inc(daily_stats_collection, created_at, {"newUsers": delta})
+
+
+def record_topup(daily_stats_collection, amount, now: datetime):
+    """A topup was approved"""
+    _inc(daily_stats_collection, now, {"topups.count": 1, "topups.amount": amount})
+
+
+def record_payout(daily_stats_collection, amount, now: datetime):
+    """A withdrawal was approved"""
+    _inc(daily_stats_collection, now, {"payouts.count": 1, "payouts.amount": amount})
+
+
+def record_transactions(daily_stats_collection, transaction_type: str, amount, now: datetime, count: int = 1):
+    """``count`` transactions of one type totalling ``amount`` were written"""
+    if not count:
+        return
+    key = _field_key(transaction_type)
+    _inc(daily_stats_collection, now, {f"transactions.{key}.count": count, f"transactions.{key}.amount": amount})
+
+
+def record_plan_activation(daily_stats_collection, plan_name: str, amount, now: datetime):
+    """A plan was activated (also counted as a PLAN_ACTIVATION transaction)"""
+    key = _field_key(plan_name)
+    _inc(daily_stats_collection, now, {
+        f"planActivations.{key}.count": 1,
+        f"planActivations.{key}.amount": amount,
+        "transactions.PLAN_ACTIVATION.count": 1,
+        "transactions.PLAN_ACTIVATION.amount": amount
+    })
+
+
+# ==================== RECOMPUTE ====================
+
+def empty_sections() -> dict:
+    return {
+        "newUsers": 0,
+        "topups": {"count": 0, "amount": 0},
+        "payouts": {"count": 0, "amount": 0},
+        "transactions": {},
+        "planActivations": {}
+    }
+
+
+def _by_date(field: str) -> dict:
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": field, "timezone": "Asia/Kolkata"}}
+
+
+def _date_match(field: str, start_utc: Optional[datetime], end_utc: Optional[datetime]) -> dict:
+    bounds = {"$type": "date"}
+    if start_utc is not None:
+        bounds["$gte"] = start_utc
+    if end_utc is not None:
+        bounds["$lt"] = end_utc
+    return {field: bounds}
+
+
+def compute_daily_totals(users_collection, topups_collection, withdrawals_collection, transactions_collection,
+                         start_utc: Optional[datetime] = None, end_utc: Optional[datetime] = None) -> Dict[str, dict]:
+    """
+    Recompute the incremental sections (newUsers, topups, payouts,
+    transactions, planActivations) per IST date from the source collections,
+    optionally limited to [start_utc, end_utc). Returns {date: fields}.
+    """
+    days: Dict[str, dict] = {}
+
+    def day(date: str) -> dict:
+        if date not in days:
+            days[date] = empty_sections()
+        return days[date]
+
+    for row in users_collection.aggregate([
+        {"$match": {"role": "user", **_date_match("createdAt", start_utc, end_utc)}},
+        {"$group": {"_id": _by_date("$createdAt"), "count": {"$sum": 1}}}
+    ]):
+        day(row["_id"])["newUsers"] = row["count"]
+
+    for row in topups_collection.aggregate([
+        {"$match": {"status": "APPROVED", **_date_match("approvedAt", start_utc, end_utc)}},
+        {"$group": {"_id": _by_date("$approvedAt"), "count": {"$sum": 1}, "amount": {"$sum": "$amount"}}}
+    ]):
+        day(row["_id"])["topups"] = {"count": row["count"], "amount": row["amount"]}
+
+    # Withdrawal approval stamps processedAt
+    for row in withdrawals_collection.aggregate([
+        {"$match": {"status": "APPROVED", **_date_match("processedAt", start_utc, end_utc)}},
+        {"$group": {"_id": _by_date("$processedAt"), "count": {"$sum": 1}, "amount": {"$sum": "$amount"}}}
+    ]):
+        day(row["_id"])["payouts"] = {"count": row["count"], "amount": row["amount"]}
+
+    for row in transactions_collection.aggregate([
+        {"$match": {"type": {"$type": "string"}, **_date_match("createdAt", start_utc, end_utc)}},
+        {"$group": {
+            "_id": {"date": _by_date("$createdAt"), "type": "$type"},
+            "count": {"$sum": 1},
+            "amount": {"$sum": "$amount"}
+        }}
+    ]):
+        day(row["_id"]["date"])["transactions"][_field_key(row["_id"]["type"])] = {
+            "count": row["count"], "amount": row["amount"]
+        }
+
+    for row in transactions_collection.aggregate([
+        {"$match": {"type": "PLAN_ACTIVATION", **_date_match("createdAt", start_utc, end_utc)}},
+        {"$group": {
+            "_id": {"date": _by_date("$createdAt"), "plan": {"$ifNull": ["$planName", "Unknown"]}},
+            "count": {"$sum": 1},
+            "amount": {"$sum": "$amount"}
+        }}
+    ]):
+        day(row["_id"]["date"])["planActivations"][_field_key(row["_id"]["plan"])] = {
+            "count": row["count"], "amount": row["amount"]
+        }
+
+    return days
+
+
+def rebuild_daily_stats(daily_stats_collection, users_collection, topups_collection, withdrawals_collection,
+                        transactions_collection, now: datetime) -> dict:
+    """
+    Recompute the incremental sections of every daily_stats document from
+    the full history. End-of-day snapshot fields are left as they are.
+    """
+    days = compute_daily_totals(users_collection, topups_collection, withdrawals_collection, transactions_collection)
+    operations = [
+        UpdateOne({"date": date}, {"$set": {**fields, "updatedAt": now}}, upsert=True)
+        for date, fields in days.items()
+    ]
+    if operations:
+        daily_stats_collection.bulk_write(operations, ordered=False)
+    # Dates that no longer have any activity
+    cleared = daily_stats_collection.update_many(
+        {"date": {"$nin": list(days)}},
+        {"$set": {**empty_sections(), "updatedAt": now}}
+    ).modified_count
+    return {"days": len(days), "cleared": cleared}
+
+
+# ==================== READ ====================
+
+def _normalize(date: str, doc: Optional[dict]) -> dict:
+    doc = doc or {}
+    row = {"date": date, **empty_sections()}
+    row["newUsers"] = doc.get("newUsers", 0)
+    for section in COUNTER_SECTIONS:
+        counter = doc.get(section) or {}
+        row[section] = {"count": counter.get("count", 0), "amount": counter.get("amount", 0)}
+    for section in MAP_SECTIONS:
+        row[section] = {
+            key: {"count": value.get("count", 0), "amount": value.get("amount", 0)}
+            for key, value in (doc.get(section) or {}).items()
+        }
+    return row
+
+
+def get_daily_stats(daily_stats_collection, start_date: str, end_date: str) -> List[dict]:
+    """
+    One row per IST date in [start_date, end_date] (YYYY-MM-DD, inclusive),
+    oldest first; dates without a document are zero.
+    """
+    docs = {
+        doc["date"]: doc
+        for doc in daily_stats_collection.find({"date": {"$gte": start_date, "$lte": end_date}}, {"_id": 0})
+    }
+    rows = []
+    current = datetime.strptime(start_date, "%Y-%m-%d")
+    last = datetime.strptime(end_date, "%Y-%m-%d")
+    while current <= last:
+        date = current.strftime("%Y-%m-%d")
+        rows.append(_normalize(date, docs.get(date)))
+        current += timedelta(days=1)
+    return rows
+
+
+def lifetime_totals(daily_stats_collection, before_date: Optional[str] = None) -> dict:
+    """
+    Sums over every daily_stats document (or those before ``before_date``):
+    {newUsers, topups, payouts, transactions: {type: {count, amount}}}
+    """
+    match = {"date": {"$lt": before_date}} if before_date else {}
+    scalars = next(iter(daily_stats_collection.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": None,
+            "newUsers": {"$sum": "$newUsers"},
+            "topupCount": {"$sum": "$topups.count"},
+            "topupAmount": {"$sum": "$topups.amount"},
+            "payoutCount": {"$sum": "$payouts.count"},
+            "payoutAmount": {"$sum": "$payouts.amount"}
+        }}
+    ])), {})
+    by_type = {
+        row["_id"]: {"count": row["count"], "amount": row["amount"]}
+        for row in daily_stats_collection.aggregate([
+            {"$match": match},
+            {"$project": {"transactions": {"$objectToArray": {"$ifNull": ["$transactions", {}]}}}},
+            {"$unwind": "$transactions"},
+            {"$group": {
+                "_id": "$transactions.k",
+                "count": {"$sum": "$transactions.v.count"},
+                "amount": {"$sum": "$transactions.v.amount"}
+            }}
+        ])
+    }
+    return {
+        "newUsers": scalars.get("newUsers", 0),
+        "topups": {"count": scalars.get("topupCount", 0), "amount": scalars.get("topupAmount", 0)},
+        "payouts": {"count": scalars.get("payoutCount", 0), "amount": scalars.get("payoutAmount", 0)},
+        "transactions": by_type
+    }
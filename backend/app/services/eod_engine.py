@@ -0,0 +1,670 @@
+"""
+EOD Engine - Vectorized binary matching
+Eligible users are read once through a projected cursor into NumPy arrays,
+matched / capped PV and income are computed for everyone at once, and the
+wallet credits, transactions and PV flushes are written back in chunked
+``bulk_write`` / ``insert_many`` batches.
+
+Matching rules (unchanged from the per-user implementation):
+    matched_pv = min(leftPV, rightPV)
+    max_pv_per_day = plan.dailyCapping // MATCHING_INCOME_RATE
+    today_pv = min(matched_pv, max_pv_per_day - dailyPVUsed)
+    income = today_pv * MATCHING_INCOME_RATE
+The full matched_pv is flushed from both legs even when capping limits
+today_pv; totalPV records lifetime matched PV.
+
+simulate_matching runs the same kernel over a snapshot with what-if capping
+and rate values and only returns aggregates; it never writes.
+
+Runs keyed by a run date are idempotent per (user, run date), and
+run_sharded_matching splits a run into _id-range shards that are processed
+by a process pool and checkpointed on the eod_runs document.
+
+Functions take the collections they operate on so they can be shared by
+server.py and the app.services modules without opening a second client
+(pool workers, which cannot receive collections, open their own).
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+import pytz
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.services.daily_stats import record_transactions
+from app.services.user_stats import record_credits
+
+MATCHING_INCOME_RATE = 25  # ₹25 per PV
+DEFAULT_DAILY_CAPPING = 500
+WRITE_CHUNK_SIZE = 1000
+
+ELIGIBLE_USERS_QUERY = {"isActive": True, "currentPlan": {"$ne": None}}
+
+SNAPSHOT_PROJECTION = {
+    "_id": 1, "name": 1, "referralId": 1,
+    "leftPV": 1, "rightPV": 1, "dailyPVUsed": 1, "lastMatchingDate": 1,
+    "currentPlan": 1, "currentPlanId": 1
+}
+
+SIMULATION_PROJECTION = {
+    "_id": 0,
+    "leftPV": 1, "rightPV": 1, "dailyPVUsed": 1, "lastMatchingDate": 1,
+    "currentPlan": 1, "currentPlanId": 1
+}
+
+
+def normalize_plans(plan_docs) -> List[dict]:
+    """Reduce plan documents to {"id", "name", "dailyCapping"} for the snapshot"""
+    return [
+        {
+            "id": str(plan["_id"]),
+            "name": plan.get("name"),
+            "dailyCapping": plan.get("dailyCapping", DEFAULT_DAILY_CAPPING) or 0
+        }
+        for plan in plan_docs
+    ]
+
+
+def load_plans(plans_collection) -> List[dict]:
+    return normalize_plans(plans_collection.find({}, {"name": 1, "dailyCapping": 1}))
+
+
+def plan_lookup(plans: List[dict]) -> Dict[str, int]:
+    """
+    Map every way a user may reference a plan (id string or name) to its
+    position in ``plans``
+    """
+    lookup = {}
+    for index, plan in enumerate(plans):
+        lookup[plan["id"]] = index
+    for index, plan in enumerate(plans):
+        if plan.get("name"):
+            # Ids take precedence over names if the two ever collide
+            lookup.setdefault(plan["name"], index)
+    return lookup
+
+
+def resolve_plan_index(user: dict, lookup: Dict[str, int]) -> int:
+    """
+    Position of the user's plan, or -1 when the plan cannot be resolved.
+    Lookup order: currentPlanId, then currentPlan as a name, then as an id.
+    """
+    plan_id = user.get("currentPlanId")
+    if plan_id:
+        return lookup.get(str(plan_id), -1)
+    plan_value = user.get("currentPlan")
+    if plan_value:
+        return lookup.get(str(plan_value), -1)
+    return -1
+
+
+def plan_cap_pv(plans: List[dict], rate=MATCHING_INCOME_RATE, daily_capping: Optional[List] = None) -> np.ndarray:
+    """
+    Daily PV cap per plan (dailyCapping // rate), with a trailing -1 so that
+    indexing with a plan index of -1 yields "no plan"
+    """
+    cappings = daily_capping if daily_capping is not None else [plan["dailyCapping"] for plan in plans]
+    caps = np.floor_divide(np.asarray(cappings, dtype=np.float64), rate).astype(np.int64)
+    return np.append(caps, -1)
+
+
+def ist_day_bounds(now: datetime):
+    """
+    Return (today_date, start_utc, end_utc) for the IST day containing ``now``.
+    today_date is the tz-aware IST midnight that is stored as lastMatchingDate;
+    the naive UTC bounds match how pymongo hands stored dates back.
+    """
+    if now.tzinfo is None:
+        now = pytz.utc.localize(now)
+    ist = pytz.timezone('Asia/Kolkata')
+    local_now = now.astimezone(ist)
+    today_date = ist.localize(datetime(local_now.year, local_now.month, local_now.day))
+    start_utc = today_date.astimezone(pytz.utc).replace(tzinfo=None)
+    return today_date, start_utc, start_utc + timedelta(days=1)
+
+
+def _to_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(pytz.utc).replace(tzinfo=None)
+    return value
+
+
+def build_snapshot(users, plans: List[dict], start_utc: datetime, end_utc: datetime, identity: bool = True) -> dict:
+    """
+    Pack user documents into column arrays for the matching kernel.
+    ``users`` is any iterable of documents with SNAPSHOT_PROJECTION fields.
+    With ``identity=False`` ids, names and referral ids are not kept, which
+    is all the simulator needs.
+    """
+    lookup = plan_lookup(plans)
+    ids, names, referral_ids = [], [], []
+    left, right, used, plan_index, same_day = [], [], [], [], []
+
+    for user in users:
+        if identity:
+            ids.append(user["_id"])
+            names.append(user.get("name"))
+            referral_ids.append(user.get("referralId"))
+        left.append(user.get("leftPV", 0) or 0)
+        right.append(user.get("rightPV", 0) or 0)
+        used.append(user.get("dailyPVUsed", 0) or 0)
+        plan_index.append(resolve_plan_index(user, lookup))
+        last = user.get("lastMatchingDate")
+        same_day.append(last is not None and start_utc <= _to_naive_utc(last) < end_utc)
+
+    count = len(left)
+    return {
+        "ids": ids,
+        "names": names,
+        "referralIds": referral_ids,
+        "plans": plans,
+        "leftPV": np.fromiter(left, dtype=np.int64, count=count),
+        "rightPV": np.fromiter(right, dtype=np.int64, count=count),
+        "dailyPVUsed": np.fromiter(used, dtype=np.int64, count=count),
+        "planIndex": np.fromiter(plan_index, dtype=np.int32, count=count),
+        "sameDay": np.fromiter(same_day, dtype=bool, count=count)
+    }
+
+
+def load_snapshot(users_collection, plans_collection, now: datetime, query: Optional[dict] = None,
+                  identity: bool = True) -> dict:
+    """Read every user with PV on both legs that matches ``query`` in one projected cursor"""
+    _, start_utc, end_utc = ist_day_bounds(now)
+    match = dict(query if query is not None else ELIGIBLE_USERS_QUERY)
+    match["leftPV"] = {"$gt": 0}
+    match["rightPV"] = {"$gt": 0}
+    projection = SNAPSHOT_PROJECTION if identity else SIMULATION_PROJECTION
+    cursor = users_collection.find(match, projection, batch_size=WRITE_CHUNK_SIZE * 5)
+    return build_snapshot(cursor, load_plans(plans_collection), start_utc, end_utc, identity)
+
+
+def compute_matching(snapshot: dict, rate=MATCHING_INCOME_RATE, daily_capping: Optional[List] = None) -> dict:
+    """
+    Vectorized matching kernel.
+    ``rate`` and ``daily_capping`` (one value per snapshot plan) default to
+    the live values; the simulator passes what-if values instead.
+    Returns the matched (flushed) PV, capped PV paid today, income, the new
+    dailyPVUsed and the boolean mask of users that get paid.
+    """
+    left = snapshot["leftPV"]
+    right = snapshot["rightPV"]
+    cap = plan_cap_pv(snapshot["plans"], rate, daily_capping)[snapshot["planIndex"]]
+
+    matched_pv = np.minimum(left, right)
+    used = np.where(snapshot["sameDay"], snapshot["dailyPVUsed"], 0)
+    remaining = cap - used
+    today_pv = np.minimum(matched_pv, remaining)
+
+    paid = (cap >= 0) & (left > 0) & (right > 0) & (remaining > 0) & (today_pv > 0)
+
+    return {
+        "matchedPV": matched_pv,
+        "todayPV": today_pv,
+        "income": today_pv * rate,
+        "dailyPVUsed": used + today_pv,
+        "remainingPV": remaining,
+        "paid": paid
+    }
+
+
+def commit_matching(
+    users_collection, wallets_collection, transactions_collection,
+    snapshot: dict, result: dict, now: datetime,
+    description: str = "Binary matching income",
+    chunk_size: int = WRITE_CHUNK_SIZE,
+    run_date: Optional[str] = None,
+    user_stats_collection=None,
+    daily_stats_collection=None
+) -> List[int]:
+    """
+    Write MATCHING_INCOME transactions, wallet credits and PV flushes for
+    every paid user, one chunk at a time. Returns the paid row indices.
+
+    With ``run_date`` every write is idempotent for (user, run date): the
+    transaction carries a unique idempotencyKey, and the wallet and user
+    updates only apply while their lastMatchingRunDate differs. The user
+    update goes last, so a user whose flush is recorded has been paid.
+    When a transaction was already recorded by an earlier attempt, the
+    wallet credit, stats and PV flush use its stored amount / pv /
+    matchedPV rather than values recomputed from PV that may have grown
+    since, so the wallet always matches the ledger.
+    With ``user_stats_collection`` the credits are also added to each
+    user's dashboard stats (guarded by the same run date), and with
+    ``daily_stats_collection`` the newly written transactions to today's
+    business figures.
+    """
+    today_date, _, _ = ist_day_bounds(now)
+    paid_rows = np.flatnonzero(result["paid"]).tolist()
+
+    matched = result["matchedPV"].tolist()
+    today_pv = result["todayPV"].tolist()
+    income = result["income"].tolist()
+    daily_used = result["dailyPVUsed"].tolist()
+    used_before = (result["dailyPVUsed"] - result["todayPV"]).tolist()
+    ids = snapshot["ids"]
+
+    guard = {"lastMatchingRunDate": {"$ne": run_date}} if run_date else {}
+    mark = {"lastMatchingRunDate": run_date} if run_date else {}
+
+    for offset in range(0, len(paid_rows), chunk_size):
+        rows = paid_rows[offset:offset + chunk_size]
+
+        transactions = []
+        for i in rows:
+            transaction = {
+                "userId": str(ids[i]),
+                "type": "MATCHING_INCOME",
+                "amount": income[i],
+                "description": f"{description} - {today_pv[i]} PV @ ₹{MATCHING_INCOME_RATE}/PV",
+                "pv": today_pv[i],
+                "matchedPV": matched[i],
+                "status": "COMPLETED",
+                "createdAt": now
+            }
+            if run_date:
+                transaction["runDate"] = run_date
+                transaction["idempotencyKey"] = f"{ids[i]}:{run_date}"
+            transactions.append(transaction)
+        duplicates = set()
+        try:
+            transactions_collection.insert_many(transactions, ordered=False)
+        except BulkWriteError as e:
+            # Already recorded by an earlier attempt of the same run date
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            duplicates = {error["index"] for error in e.details.get("writeErrors", [])}
+
+        if duplicates:
+            keys = [transactions[index]["idempotencyKey"] for index in duplicates]
+            stored = {
+                doc["idempotencyKey"]: doc
+                for doc in transactions_collection.find(
+                    {"idempotencyKey": {"$in": keys}},
+                    {"idempotencyKey": 1, "amount": 1, "pv": 1, "matchedPV": 1}
+                )
+            }
+            for index in duplicates:
+                i = rows[index]
+                recorded = stored.get(transactions[index]["idempotencyKey"])
+                if recorded is None:
+                    continue
+                income[i] = recorded["amount"]
+                today_pv[i] = recorded["pv"]
+                matched[i] = recorded.get("matchedPV", matched[i])
+                daily_used[i] = used_before[i] + recorded["pv"]
+
+        if daily_stats_collection is not None:
+            written = [transaction["amount"] for index, transaction in enumerate(transactions) if index not in duplicates]
+            record_transactions(daily_stats_collection, "MATCHING_INCOME", sum(written), now, count=len(written))
+
+        wallets_collection.bulk_write([
+            UpdateOne(
+                {"userId": str(ids[i]), **guard},
+                {
+                    "$inc": {"balance": income[i], "totalEarnings": income[i]},
+                    "$set": {"updatedAt": now, **mark}
+                }
+            )
+            for i in rows
+        ], ordered=False)
+
+        if user_stats_collection is not None:
+            record_credits(
+                user_stats_collection, [(str(ids[i]), income[i]) for i in rows],
+                "MATCHING_INCOME", now, run_date
+            )
+
+        users_collection.bulk_write([
+            UpdateOne(
+                {"_id": ids[i], **guard},
+                {
+                    "$inc": {
+                        "leftPV": -matched[i],
+                        "rightPV": -matched[i],
+                        "totalPV": matched[i]
+                    },
+                    "$set": {
+                        "lastMatchingDate": today_date,
+                        "dailyPVUsed": daily_used[i],
+                        "updatedAt": now,
+                        **mark
+                    }
+                }
+            )
+            for i in rows
+        ], ordered=False)
+
+    return paid_rows
+
+
+def matching_details(snapshot: dict, result: dict, rows: List[int]) -> List[dict]:
+    """Per-user payload returned by the admin matching endpoint"""
+    left = snapshot["leftPV"].tolist()
+    right = snapshot["rightPV"].tolist()
+    matched = result["matchedPV"].tolist()
+    today_pv = result["todayPV"].tolist()
+    income = result["income"].tolist()
+    return [
+        {
+            "userId": str(snapshot["ids"][i]),
+            "name": snapshot["names"][i],
+            "referralId": snapshot["referralIds"][i],
+            "matchedPV": today_pv[i],
+            "income": income[i],
+            "leftPV_before": left[i],
+            "rightPV_before": right[i],
+            "leftPV_after": left[i] - matched[i],
+            "rightPV_after": right[i] - matched[i]
+        }
+        for i in rows
+    ]
+
+
+def run_matching(
+    users_collection, wallets_collection, transactions_collection, plans_collection,
+    now: datetime, query: Optional[dict] = None,
+    description: str = "Binary matching income",
+    include_details: bool = True,
+    run_date: Optional[str] = None,
+    user_stats_collection=None,
+    daily_stats_collection=None
+) -> dict:
+    """
+    Run binary matching for every eligible user and persist the results.
+    With ``run_date`` users already matched for that date are skipped and a
+    rerun never pays anyone twice (see commit_matching).
+    Returns {"totalUsersProcessed", "totalIncomePaid", "date", "details"}.
+    """
+    if run_date:
+        query = dict(query if query is not None else ELIGIBLE_USERS_QUERY)
+        query["lastMatchingRunDate"] = {"$ne": run_date}
+    snapshot = load_snapshot(users_collection, plans_collection, now, query)
+    result = compute_matching(snapshot)
+    rows = commit_matching(
+        users_collection, wallets_collection, transactions_collection,
+        snapshot, result, now, description, run_date=run_date,
+        user_stats_collection=user_stats_collection,
+        daily_stats_collection=daily_stats_collection
+    )
+    today_date, _, _ = ist_day_bounds(now)
+    return {
+        "totalUsersProcessed": len(rows),
+        "totalIncomePaid": int(result["income"][result["paid"]].sum()),
+        "date": today_date.strftime("%Y-%m-%d"),
+        "details": matching_details(snapshot, result, rows) if include_details else []
+    }
+
+
+# ==================== SIMULATION ====================
+
+def summarize_matching(snapshot: dict, result: dict, rate, daily_capping: List) -> dict:
+    """
+    Aggregate a kernel result without touching the database: totals plus a
+    per-plan breakdown. A user is "capped" when the daily cap (after PV
+    already used today) is below their matched PV.
+    """
+    plan_index = snapshot["planIndex"]
+    resolved = plan_index >= 0
+    plans = snapshot["plans"]
+    plan_count = len(plans)
+
+    paid = result["paid"]
+    matched = result["matchedPV"]
+    capped = resolved & (matched > 0) & (result["remainingPV"] < matched)
+    # Only paid users are flushed (see commit_matching)
+    flushed = np.where(paid, matched, 0)
+    paid_pv = np.where(paid, result["todayPV"], 0)
+
+    def per_plan(values):
+        return np.bincount(plan_index[resolved], weights=values[resolved], minlength=plan_count)
+
+    users_by_plan = np.bincount(plan_index[resolved], minlength=plan_count)
+    paid_by_plan = per_plan(paid.astype(np.float64))
+    capped_by_plan = per_plan(capped.astype(np.float64))
+    payout_by_plan = per_plan((paid_pv * rate).astype(np.float64))
+    flushed_by_plan = per_plan(flushed.astype(np.float64))
+
+    breakdown = [
+        {
+            "planId": plan["id"],
+            "planName": plan.get("name"),
+            "dailyCapping": daily_capping[index],
+            "maxPVPerDay": int(daily_capping[index] // rate),
+            "users": int(users_by_plan[index]),
+            "paidUsers": int(paid_by_plan[index]),
+            "cappedUsers": int(capped_by_plan[index]),
+            "totalPayout": float(payout_by_plan[index]),
+            "flushedPV": int(flushed_by_plan[index])
+        }
+        for index, plan in enumerate(plans)
+    ]
+
+    total_flushed = int(flushed.sum())
+    total_paid_pv = int(paid_pv.sum())
+    return {
+        "matchingIncomeRate": rate,
+        "users": int(len(plan_index)),
+        "unresolvedPlanUsers": int((~resolved).sum()),
+        "paidUsers": int(paid.sum()),
+        "cappedUsers": int(capped.sum()),
+        "totalPayout": float(total_paid_pv * rate),
+        "paidPV": total_paid_pv,
+        "flushedPV": total_flushed,
+        "cappedAwayPV": total_flushed - total_paid_pv,
+        "plans": breakdown
+    }
+
+
+def simulate_matching(snapshot: dict, rate=None, daily_capping: Optional[Dict[str, float]] = None) -> dict:
+    """
+    Read-only what-if over a snapshot: project the EOD payout under the
+    live parameters and under ``rate`` / ``daily_capping`` (plan id or name
+    -> dailyCapping). Nothing is written anywhere.
+    Raises ValueError for unknown plans or non-positive values.
+    """
+    plans = snapshot["plans"]
+    current_capping = [plan["dailyCapping"] for plan in plans]
+    simulated_capping = list(current_capping)
+
+    if daily_capping:
+        lookup = plan_lookup(plans)
+        for key, value in daily_capping.items():
+            if key not in lookup:
+                raise ValueError(f"Unknown plan: {key}")
+            if value is None or value < 0:
+                raise ValueError(f"Invalid dailyCapping for {key}: {value}")
+            simulated_capping[lookup[key]] = value
+
+    simulated_rate = rate if rate is not None else MATCHING_INCOME_RATE
+    if simulated_rate <= 0:
+        raise ValueError("matchingIncomeRate must be positive")
+
+    current = summarize_matching(
+        snapshot, compute_matching(snapshot, MATCHING_INCOME_RATE, current_capping),
+        MATCHING_INCOME_RATE, current_capping
+    )
+    simulated = summarize_matching(
+        snapshot, compute_matching(snapshot, simulated_rate, simulated_capping),
+        simulated_rate, simulated_capping
+    )
+    return {
+        "current": current,
+        "simulated": simulated,
+        "delta": {
+            key: simulated[key] - current[key]
+            for key in ("totalPayout", "paidUsers", "cappedUsers", "paidPV", "flushedPV", "cappedAwayPV")
+        }
+    }
+
+
+# ==================== SHARDED RUNS ====================
+
+SHARD_PENDING = "PENDING"
+SHARD_DONE = "DONE"
+
+# Below this many eligible users a run is a single in-process shard
+MIN_USERS_PER_SHARD = 5000
+SHARDS_PER_WORKER = 4
+
+_worker_clients = {}
+
+
+def run_date_for(now: datetime) -> str:
+    """IST calendar date used as the matching run date"""
+    return ist_day_bounds(now)[0].strftime("%Y-%m-%d")
+
+
+def ensure_matching_indexes(transactions_collection):
+    transactions_collection.create_index(
+        [("idempotencyKey", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"idempotencyKey": {"$exists": True}},
+        name="idempotencyKey_unique"
+    )
+    transactions_collection.create_index(
+        [("runDate", ASCENDING), ("type", ASCENDING)],
+        partialFilterExpression={"runDate": {"$exists": True}},
+        name="runDate_type"
+    )
+
+
+def plan_shards(users_collection, query: dict, shard_count: int) -> List[dict]:
+    """
+    Split the users matching ``query`` into contiguous _id ranges of roughly
+    equal size. The first and last ranges are open so nothing is missed.
+    """
+    if shard_count <= 1:
+        return [{"index": 0, "lo": None, "hi": None, "status": SHARD_PENDING}]
+
+    buckets = list(users_collection.aggregate([
+        {"$match": query},
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": shard_count}}
+    ], allowDiskUse=True))
+    bounds = [bucket["_id"]["min"] for bucket in buckets[1:]]
+
+    shards = []
+    lo = None
+    for index, hi in enumerate(bounds + [None]):
+        shards.append({"index": index, "lo": lo, "hi": hi, "status": SHARD_PENDING})
+        lo = hi
+    return shards
+
+
+def shard_query(query: dict, shard: dict) -> dict:
+    id_range = {}
+    if shard.get("lo") is not None:
+        id_range["$gte"] = shard["lo"]
+    if shard.get("hi") is not None:
+        id_range["$lt"] = shard["hi"]
+    scoped = dict(query)
+    if id_range:
+        scoped["_id"] = id_range
+    return scoped
+
+
+def match_shard(mongo_url: str, db_name: str, shard: dict, now: datetime, run_date: str,
+                query: Optional[dict] = None, description: str = "Binary matching income") -> dict:
+    """
+    Process one shard. Runs in a pool worker, so it opens (and caches) its
+    own client instead of receiving collections.
+    """
+    client = _worker_clients.get(mongo_url)
+    if client is None:
+        client = _worker_clients[mongo_url] = MongoClient(mongo_url)
+    db = client[db_name]
+
+    started = time.monotonic()
+    result = run_matching(
+        db["users"], db["wallets"], db["transactions"], db["plans"], now,
+        query=shard_query(query if query is not None else ELIGIBLE_USERS_QUERY, shard),
+        description=description,
+        include_details=False,
+        run_date=run_date,
+        user_stats_collection=db["user_stats"],
+        daily_stats_collection=db["daily_stats"]
+    )
+    return {
+        "index": shard["index"],
+        "paidUsers": result["totalUsersProcessed"],
+        "income": result["totalIncomePaid"],
+        "durationMs": int((time.monotonic() - started) * 1000)
+    }
+
+
+def run_sharded_matching(
+    db, mongo_url: str, db_name: str, runs_collection, run_id,
+    now: datetime, run_date: str, workers: int = 1,
+    query: Optional[dict] = None, description: str = "Binary matching income"
+) -> dict:
+    """
+    Checkpointed matching for one EOD run (an eod_runs document).
+
+    The shard plan is stored on the run as ``matching.shards`` and every shard
+    is marked DONE as it finishes, so calling this again for the same run
+    only processes unfinished shards. Shards run in a spawn-based process
+    pool when ``workers`` > 1; the idempotent writes make a shard that was
+    interrupted halfway safe to repeat.
+    """
+    query = query if query is not None else ELIGIBLE_USERS_QUERY
+    run = runs_collection.find_one({"_id": run_id}, {"matching": 1}) or {}
+    shards = (run.get("matching") or {}).get("shards")
+
+    if not shards:
+        eligible = db["users"].count_documents(query)
+        shard_count = max(1, min(workers * SHARDS_PER_WORKER, eligible // MIN_USERS_PER_SHARD))
+        shards = plan_shards(db["users"], query, shard_count)
+        runs_collection.update_one(
+            {"_id": run_id},
+            {"$set": {"matching": {"runDate": run_date, "workers": workers, "shards": shards}}}
+        )
+
+    pending = [shard for shard in shards if shard["status"] != SHARD_DONE]
+    resumed = len(shards) - len(pending)
+
+    def checkpoint(done: dict):
+        index = done["index"]
+        runs_collection.update_one({"_id": run_id}, {"$set": {
+            f"matching.shards.{index}.status": SHARD_DONE,
+            f"matching.shards.{index}.paidUsers": done["paidUsers"],
+            f"matching.shards.{index}.income": done["income"],
+            f"matching.shards.{index}.durationMs": done["durationMs"],
+            f"matching.shards.{index}.finishedAt": datetime.utcnow()
+        }})
+
+    if workers <= 1 or len(pending) <= 1:
+        for shard in pending:
+            checkpoint(match_shard(mongo_url, db_name, shard, now, run_date, query, description))
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=context) as pool:
+            futures = [
+                pool.submit(match_shard, mongo_url, db_name, shard, now, run_date, query, description)
+                for shard in pending
+            ]
+            for future in as_completed(futures):
+                checkpoint(future.result())
+
+    # Totals come from the ledger so shards repeated after a crash are not
+    # under- or double-counted
+    totals = list(db["transactions"].aggregate([
+        {"$match": {"runDate": run_date, "type": "MATCHING_INCOME"}},
+        {"$group": {"_id": None, "users": {"$sum": 1}, "income": {"$sum": "$amount"}}}
+    ]))
+    paid_users = totals[0]["users"] if totals else 0
+    income = totals[0]["income"] if totals else 0
+    runs_collection.update_one({"_id": run_id}, {"$set": {
+        "matching.complete": True,
+        "matching.paidUsers": paid_users,
+        "matching.income": income
+    }})
+    return {
+        "runDate": run_date,
+        "shards": len(shards),
+        "resumedShards": resumed,
+        "workers": workers,
+        "paidUsers": paid_users,
+        "income": income
+    }
@@ -0,0 +1,190 @@
+"""
+EOD Pipeline - Ordered, timed end-of-day stages
+A pipeline is a list of named stages run in order for one eod_runs
+document. Each stage receives a context dict ({"run", "runDate", "now"})
+and returns a dict with at least ``touched`` (documents written). Its
+outcome is recorded on the run as
+
+    stages.<name>: {status, startedAt, finishedAt, durationMs, touched,
+                    result, error}
+
+so the slowest stage of the nightly window is visible in eod_runs. A failed
+stage stops the pipeline; when the run is resumed (see eod_scheduler) the
+stages that already COMPLETED are skipped.
+
+The stage implementations below are set-based: one update_many, a handful
+of bulk updates or a server-side aggregation each, never a per-user loop.
+"""
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+import pytz
+from pymongo import ASCENDING, DESCENDING
+
+from app.services.daily_stats import compute_daily_totals, empty_sections
+from app.services.eod_engine import ELIGIBLE_USERS_QUERY, ist_day_bounds
+
+IST = pytz.timezone('Asia/Kolkata')
+
+STAGE_RUNNING = "RUNNING"
+STAGE_COMPLETED = "COMPLETED"
+STAGE_FAILED = "FAILED"
+
+
+class EODStageError(Exception):
+    """A pipeline stage failed; the run is recorded as FAILED"""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+
+
+class EODPipeline:
+    """Ordered stages recorded on an eod_runs document"""
+
+    def __init__(self, runs_collection, get_now: Callable[[], datetime]):
+        self.runs = runs_collection
+        self.get_now = get_now
+        self.stages: List[Tuple[str, Callable[[dict], dict]]] = []
+
+    def add_stage(self, name: str, fn: Callable[[dict], dict]) -> "EODPipeline":
+        if any(existing == name for existing, _ in self.stages):
+            raise ValueError(f"Duplicate EOD stage: {name}")
+        self.stages.append((name, fn))
+        return self
+
+    def stage_names(self) -> List[str]:
+        return [name for name, _ in self.stages]
+
+    def run(self, run: dict) -> dict:
+        """
+        Run every stage that has not completed on this run yet.
+        Returns {stage name: stage result}; raises EODStageError on failure.
+        """
+        run_id = run["_id"]
+        recorded = run.get("stages") or {}
+        context = {"run": run, "runDate": run["runDate"], "now": self.get_now()}
+        results = {}
+
+        for name, fn in self.stages:
+            previous = recorded.get(name) or {}
+            if previous.get("status") == STAGE_COMPLETED:
+                results[name] = previous.get("result")
+                continue
+
+            started = self.get_now()
+            self.runs.update_one({"_id": run_id}, {"$set": {
+                f"stages.{name}": {"status": STAGE_RUNNING, "startedAt": started}
+            }})
+            clock = time.monotonic()
+            try:
+                result = fn(context) or {}
+            except Exception as e:
+                self.runs.update_one({"_id": run_id}, {"$set": {
+                    f"stages.{name}.status": STAGE_FAILED,
+                    f"stages.{name}.finishedAt": self.get_now(),
+                    f"stages.{name}.durationMs": int((time.monotonic() - clock) * 1000),
+                    f"stages.{name}.error": str(e)
+                }})
+                raise EODStageError(name, e)
+
+            self.runs.update_one({"_id": run_id}, {"$set": {
+                f"stages.{name}.status": STAGE_COMPLETED,
+                f"stages.{name}.finishedAt": self.get_now(),
+                f"stages.{name}.durationMs": int((time.monotonic() - clock) * 1000),
+                f"stages.{name}.touched": int(result.get("touched", 0)),
+                f"stages.{name}.result": result
+            }})
+            results[name] = result
+
+        return results
+
+
+# ==================== STAGES ====================
+
+def reset_carry_forward(users_collection, now: datetime, query: Optional[dict] = None) -> dict:
+    """
+    Start the next day: reset dailyPVUsed for every eligible user in one
+    update_many. Unmatched PV stays on the stronger leg (carry forward).
+    """
+    result = users_collection.update_many(
+        query if query is not None else ELIGIBLE_USERS_QUERY,
+        {"$set": {"dailyPVUsed": 0, "lastEODProcessed": now, "updatedAt": now}}
+    )
+    return {"touched": result.modified_count, "matched": result.matched_count}
+
+
+def rollup_daily_stats(daily_stats_collection, users_collection, topups_collection, withdrawals_collection,
+                       transactions_collection, run_date: str, now: datetime) -> dict:
+    """
+    Finalize the daily_stats document for the IST day ``run_date``: replace
+    the figures the write paths incremented during the day with totals
+    recomputed from the source collections, and add the end-of-day user
+    snapshot.
+    """
+    _, start_utc, end_utc = ist_day_bounds(IST.localize(datetime.strptime(run_date, "%Y-%m-%d")))
+
+    day = compute_daily_totals(
+        users_collection, topups_collection, withdrawals_collection, transactions_collection,
+        start_utc, end_utc
+    ).get(run_date) or empty_sections()
+    user_totals = next(iter(users_collection.aggregate([
+        {"$match": {"role": "user"}},
+        {"$group": {
+            "_id": None,
+            "totalUsers": {"$sum": 1},
+            "activeUsers": {"$sum": {"$cond": [{"$eq": ["$isActive", True]}, 1, 0]}},
+            "leftPV": {"$sum": "$leftPV"},
+            "rightPV": {"$sum": "$rightPV"}
+        }}
+    ])), {})
+
+    stats = {
+        "date": run_date,
+        **day,
+        "totalUsers": user_totals.get("totalUsers", 0),
+        "activeUsers": user_totals.get("activeUsers", 0),
+        "carryForwardPV": user_totals.get("leftPV", 0) + user_totals.get("rightPV", 0),
+        "updatedAt": now,
+        "rolledUpAt": now
+    }
+    daily_stats_collection.update_one({"date": run_date}, {"$set": stats}, upsert=True)
+    return {"touched": 1, "transactionTypes": len(day["transactions"]), "newUsers": stats["newUsers"]}
+
+
+def snapshot_pv(users_collection, snapshots_collection_name: str, run_date: str, now: datetime) -> dict:
+    """
+    Copy every user's post-EOD PV and leg counts into the snapshots
+    collection (one document per user and date), entirely server-side with
+    $merge. Re-running the same date replaces that date's snapshot.
+    """
+    users_collection.aggregate([
+        {"$match": {"role": "user"}},
+        {"$project": {
+            "_id": 0,
+            "userId": {"$toString": "$_id"},
+            "date": run_date,
+            "leftPV": {"$ifNull": ["$leftPV", 0]},
+            "rightPV": {"$ifNull": ["$rightPV", 0]},
+            "totalPV": {"$ifNull": ["$totalPV", 0]},
+            "leftCount": {"$ifNull": ["$leftCount", 0]},
+            "rightCount": {"$ifNull": ["$rightCount", 0]},
+            "isActive": {"$ifNull": ["$isActive", False]},
+            "snapshotAt": {"$literal": now}
+        }},
+        {"$merge": {
+            "into": snapshots_collection_name,
+            "on": ["userId", "date"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ], allowDiskUse=True)
+    snapshots = users_collection.database[snapshots_collection_name]
+    return {"touched": snapshots.count_documents({"date": run_date})}
+
+
+def ensure_pipeline_indexes(daily_stats_collection, snapshots_collection):
+    daily_stats_collection.create_index([("date", DESCENDING)], unique=True)
+    # $merge on (userId, date) requires this unique index
+    snapshots_collection.create_index([("userId", ASCENDING), ("date", ASCENDING)], unique=True)
+    snapshots_collection.create_index([("date", ASCENDING)])
@@ -0,0 +1,357 @@
+"""
+EOD Scheduler - In-process end-of-day runner
+An asyncio task started with the API. Every uvicorn worker starts one, but
+only the holder of the ``eod-scheduler`` lease document acts on it, so the
+EOD pipeline fires once per IST day at the configured eodTime. A date stays
+due until its scheduled run completes, so a run missed or failed just
+before midnight is caught up (for its own runDate) after midnight.
+
+Leases live in the ``scheduler_leases`` collection:
+    {_id: <lease name>, owner: <worker id>, expiresAt: <utc datetime>}
+A lease is taken when it is missing or expired and renewed by its owner
+every ``lease_ttl / 3`` seconds; a worker that dies loses it after
+``lease_ttl``. A second lease, ``eod-run``, is held for the duration of any
+run (scheduled or manual) so two runs never overlap across workers.
+With ``enabled=False`` the worker never takes the scheduler lease but still
+accepts manual runs.
+
+Every run is recorded in ``eod_runs``:
+    {runDate, trigger: "scheduler"|"manual",
+     status: RUNNING|COMPLETED|FAILED|INTERRUPTED, attempts,
+     owner, startedAt, finishedAt, durationMs, result, error}
+A partial unique index on runDate for scheduler runs makes the daily run
+fire at most once even if two leaders briefly overlap. A run that failed
+or died is resumed under the same document (and _id) by the next attempt,
+so the pipeline can pick up from the checkpoints it stored there.
+
+The pipeline itself is a blocking callable and is executed with
+asyncio.to_thread so the event loop keeps serving requests during EOD.
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+SCHEDULER_LEASE = "eod-scheduler"
+RUN_LEASE = "eod-run"
+
+TRIGGER_SCHEDULER = "scheduler"
+TRIGGER_MANUAL = "manual"
+
+STATUS_RUNNING = "RUNNING"
+STATUS_COMPLETED = "COMPLETED"
+STATUS_FAILED = "FAILED"
+STATUS_INTERRUPTED = "INTERRUPTED"
+
+# A scheduled run that keeps failing is retried at most this many times a day
+MAX_ATTEMPTS = 3
+
+# How many earlier dates are checked for a scheduled run that never completed
+CATCH_UP_DAYS = 1
+
+
+def parse_eod_time(value: str):
+    """Parse an "HH:MM" setting, falling back to 23:59"""
+    try:
+        hour, minute = (int(part) for part in str(value).split(":")[:2])
+        if 0 <= hour < 24 and 0 <= minute < 60:
+            return hour, minute
+    except (TypeError, ValueError):
+        pass
+    return 23, 59
+
+
+def eod_moment(now: datetime, eod_time: str) -> datetime:
+    """The EOD instant on the same calendar day as ``now``"""
+    hour, minute = parse_eod_time(eod_time)
+    return now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+
+class MongoLease:
+    """Expiring ownership record in a MongoDB collection"""
+
+    def __init__(self, collection, name: str, owner: str, ttl: float):
+        self.collection = collection
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+
+    def acquire(self) -> bool:
+        """Take or renew the lease; False when another owner holds it"""
+        now = datetime.utcnow()
+        try:
+            self.collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [{"owner": self.owner}, {"expiresAt": {"$lt": now}}]
+                },
+                {"$set": {
+                    "owner": self.owner,
+                    "expiresAt": now + timedelta(seconds=self.ttl),
+                    "renewedAt": now
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return True
+        except DuplicateKeyError:
+            # Document exists, is unexpired and belongs to someone else
+            return False
+
+    def release(self):
+        self.collection.delete_one({"_id": self.name, "owner": self.owner})
+
+    def holder(self) -> Optional[dict]:
+        return self.collection.find_one({"_id": self.name})
+
+
+class EODScheduler:
+    """Lease-elected asyncio loop that fires the EOD pipeline once per day"""
+
+    def __init__(
+        self,
+        runs_collection,
+        leases_collection,
+        run_pipeline: Callable[[dict], dict],
+        get_now: Callable[[], datetime],
+        get_eod_time: Callable[[], str],
+        lease_ttl: float = 60.0,
+        poll_interval: float = 15.0,
+        enabled: bool = True
+    ):
+        self.runs = runs_collection
+        self.enabled = enabled
+        self.run_pipeline = run_pipeline
+        self.get_now = get_now
+        self.get_eod_time = get_eod_time
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.leader_lease = MongoLease(leases_collection, SCHEDULER_LEASE, self.owner, lease_ttl)
+        self.run_lease = MongoLease(leases_collection, RUN_LEASE, self.owner, lease_ttl)
+        self.is_leader = False
+        self.current_run_id = None
+        self._task = None
+        self._heartbeat_task = None
+        self._stopping = False
+
+    def ensure_indexes(self):
+        self.runs.create_index([("startedAt", DESCENDING)])
+        self.runs.create_index(
+            [("runDate", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"trigger": TRIGGER_SCHEDULER},
+            name="runDate_scheduler_unique"
+        )
+
+    # ---- lifecycle ----
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._loop())
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        self._stopping = True
+        for task in (self._task, self._heartbeat_task):
+            if task:
+                task.cancel()
+        for task in (self._task, self._heartbeat_task):
+            if task:
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._task = self._heartbeat_task = None
+        try:
+            await asyncio.to_thread(self.leader_lease.release)
+        except Exception as e:
+            print(f"⚠️ EOD scheduler lease release failed: {e}")
+        self.is_leader = False
+
+    async def _heartbeat(self):
+        """Keep the leader lease (and the run lease during a run) alive"""
+        interval = max(self.leader_lease.ttl / 3, 1)
+        while not self._stopping:
+            try:
+                if self.enabled:
+                    self.is_leader = await asyncio.to_thread(self.leader_lease.acquire)
+                if self.current_run_id is not None:
+                    await asyncio.to_thread(self.run_lease.acquire)
+            except Exception as e:
+                self.is_leader = False
+                print(f"⚠️ EOD scheduler heartbeat failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def _loop(self):
+        while not self._stopping:
+            await asyncio.sleep(self.poll_interval)
+            if not self.is_leader:
+                continue
+            try:
+                run_date = await asyncio.to_thread(self.due_run_date)
+                if run_date:
+                    await self.run(TRIGGER_SCHEDULER, run_date=run_date)
+            except Exception as e:
+                print(f"⚠️ EOD scheduler tick failed: {e}")
+
+    # ---- scheduling ----
+
+    def _date_pending(self, run_date: str) -> bool:
+        """The scheduled run of run_date has not completed and has attempts left"""
+        run = self.runs.find_one(
+            {"runDate": run_date, "trigger": TRIGGER_SCHEDULER},
+            {"status": 1, "attempts": 1}
+        )
+        return run is None or (
+            run.get("status") != STATUS_COMPLETED and run.get("attempts", 1) < MAX_ATTEMPTS
+        )
+
+    def due_run_date(self) -> Optional[str]:
+        """
+        Oldest date whose scheduled run is due, or None. A date is due from
+        its eodTime until its scheduled run completes (or runs out of
+        attempts), so a run missed or failed around midnight - leader down,
+        restarting, failing at 23:59:59 - is caught up on the next day.
+        Earlier dates are only caught up when the scheduler already has
+        runs before them, so a first deploy does not replay the past.
+        """
+        now = self.get_now()
+        eod_time = self.get_eod_time()
+        for days_back in range(CATCH_UP_DAYS, 0, -1):
+            day = now - timedelta(days=days_back)
+            run_date = day.strftime("%Y-%m-%d")
+            has_history = self.runs.find_one(
+                {"trigger": TRIGGER_SCHEDULER, "runDate": {"$lt": run_date}}, {"_id": 1}
+            )
+            if has_history and self._date_pending(run_date):
+                return run_date
+        if now >= eod_moment(now, eod_time) and self._date_pending(now.strftime("%Y-%m-%d")):
+            return now.strftime("%Y-%m-%d")
+        return None
+
+    def is_due(self) -> bool:
+        return self.due_run_date() is not None
+
+    def next_run_at(self) -> datetime:
+        now = self.get_now()
+        if self.is_due():
+            return now
+        moment = eod_moment(now, self.get_eod_time())
+        if now >= moment:
+            moment = eod_moment(now + timedelta(days=1), self.get_eod_time())
+        return moment
+
+    # ---- execution ----
+
+    def _claim_run(self, trigger: str, run_date: Optional[str] = None) -> Optional[dict]:
+        """
+        Pick the run document to execute, called while holding the run lease.
+        An unfinished run of the same date (today unless ``run_date`` is
+        given) is resumed under its original id so the pipeline can skip
+        checkpointed work; otherwise a new run is recorded. Returns None
+        when that date's scheduled run already completed.
+        """
+        started = self.get_now()
+        run_date = run_date or started.strftime("%Y-%m-%d")
+
+        # Nobody else holds the run lease, so anything still RUNNING died
+        self.runs.update_many(
+            {"status": STATUS_RUNNING},
+            {"$set": {"status": STATUS_INTERRUPTED, "interruptedAt": started}}
+        )
+
+        unfinished = {"runDate": run_date, "status": {"$in": [STATUS_FAILED, STATUS_INTERRUPTED]}}
+        if trigger == TRIGGER_SCHEDULER:
+            unfinished["trigger"] = TRIGGER_SCHEDULER
+        resume = self.runs.find_one(unfinished, sort=[("startedAt", DESCENDING)])
+
+        if resume:
+            return self.runs.find_one_and_update(
+                {"_id": resume["_id"]},
+                {
+                    "$set": {"status": STATUS_RUNNING, "owner": self.owner, "resumedAt": started},
+                    "$inc": {"attempts": 1},
+                    "$unset": {"error": ""}
+                },
+                return_document=ReturnDocument.AFTER
+            )
+
+        run_doc = {
+            "runDate": run_date,
+            "trigger": trigger,
+            "status": STATUS_RUNNING,
+            "owner": self.owner,
+            "attempts": 1,
+            "startedAt": started,
+            "eodTime": self.get_eod_time()
+        }
+        try:
+            run_doc["_id"] = self.runs.insert_one(run_doc).inserted_id
+        except DuplicateKeyError:
+            return None  # Today's scheduled run already completed
+        return run_doc
+
+    async def run(self, trigger: str = TRIGGER_MANUAL, run_date: Optional[str] = None) -> Optional[dict]:
+        """
+        Execute the pipeline off the event loop and record it in eod_runs,
+        for ``run_date`` (YYYY-MM-DD, default today).
+        The pipeline receives the run document (with its _id and any
+        checkpoints from an earlier attempt).
+        Returns the finished run document, or None when another run holds
+        the run lease (or today's scheduled run already completed).
+        """
+        if self.current_run_id is not None:
+            return None
+        if not await asyncio.to_thread(self.run_lease.acquire):
+            return None
+
+        try:
+            run_doc = await asyncio.to_thread(self._claim_run, trigger, run_date)
+            if run_doc is None:
+                return None
+            run_id = run_doc["_id"]
+            self.current_run_id = run_id
+
+            clock = time.monotonic()
+            update = {}
+            try:
+                result = await asyncio.to_thread(self.run_pipeline, run_doc)
+                update = {"status": STATUS_COMPLETED, "result": result}
+            except Exception as e:
+                print(f"❌ EOD run failed: {e}")
+                update = {"status": STATUS_FAILED, "error": str(e)}
+
+            update["finishedAt"] = self.get_now()
+            update["durationMs"] = int((time.monotonic() - clock) * 1000)
+            await asyncio.to_thread(self.runs.update_one, {"_id": run_id}, {"$set": update})
+            return await asyncio.to_thread(self.runs.find_one, {"_id": run_id})
+        finally:
+            self.current_run_id = None
+            await asyncio.to_thread(self.run_lease.release)
+
+    # ---- reporting ----
+
+    def recent_runs(self, limit: int = 20) -> list:
+        return list(self.runs.find({}).sort("startedAt", DESCENDING).limit(limit))
+
+    def status(self) -> dict:
+        leader = self.leader_lease.holder()
+        running = self.run_lease.holder()
+        return {
+            "worker": self.owner,
+            "enabled": self.enabled,
+            "isLeader": self.is_leader,
+            "leader": leader.get("owner") if leader else None,
+            "leaderLeaseExpiresAt": leader.get("expiresAt") if leader else None,
+            "runInProgress": bool(running and running.get("expiresAt") and running["expiresAt"] > datetime.utcnow()),
+            "runOwner": running.get("owner") if running else None,
+            "eodTime": self.get_eod_time(),
+            "currentTime": self.get_now(),
+            "nextRunAt": self.next_run_at()
+        }
@@ -0,0 +1,141 @@
+"""
+Password Hasher - bcrypt off the event loop
+bcrypt is deliberately slow (~100-300 ms of CPU per hash or verify at the
+usual cost factors). Run inline in an ``async def`` handler it stalls every
+other request on the worker, so a burst of logins freezes the whole API.
+
+PasswordHasher runs hash/verify in a dedicated thread pool of
+``max_workers`` threads (bcrypt releases the GIL, so these run truly in
+parallel while the event loop keeps serving). The pool is bounded twice:
+
+    * at most ``max_workers`` hashes run at once, so a login storm cannot
+      eat every core the worker has;
+    * at most ``max_pending`` calls may be queued or running; beyond that
+      hash()/verify() raise HasherBusy at once instead of piling up
+      requests that would time out anyway (0 = no limit).
+
+Cost factor: every new hash uses ``rounds``. verify() also reports when a
+stored hash was made with a different cost (or an older scheme) and
+returns a fresh hash for the caller to store, so changing BCRYPT_ROUNDS
+migrates members as they log in.
+
+stats() reports counts, the current queue and queue-wait / run-time
+percentiles over the last ``window`` calls.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+
+
+class HasherBusy(Exception):
+    """More than max_pending hash/verify calls are waiting"""
+
+
+def _percentile(ordered: list, pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return round(ordered[index] * 1000, 2)
+
+
+class PasswordHasher:
+    """bcrypt hash/verify in a bounded thread pool with queue-wait metrics"""
+
+    def __init__(self, rounds: int = 12, max_workers: int = 2, max_pending: int = 100, window: int = 1000):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        # min = max = default: hashes at any other cost need an update
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._waits = deque(maxlen=window)
+        self._runs = deque(maxlen=window)
+        self.hashes = 0
+        self.verifies = 0
+        self.rehashes = 0
+        self.rejected = 0
+
+    def _timed(self, queued_at: float, fn, *args):
+        started = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._waits.append(started - queued_at)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._runs.append(time.perf_counter() - started)
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self.max_pending and self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy(f"{self._pending} password checks already queued")
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, time.perf_counter(), fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        result = await self._submit(self.context.hash, password)
+        self.hashes += 1
+        return result
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        (valid, new_hash). new_hash is set only when the password is valid
+        and the stored hash should be replaced (different cost factor).
+        """
+        valid, new_hash = await self._submit(self.context.verify_and_update, password, hashed)
+        self.verifies += 1
+        if new_hash:
+            self.rehashes += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            runs = sorted(self._runs)
+            pending, running = self._pending, self._running
+        return {
+            "rounds": self.rounds,
+            "workers": self.max_workers,
+            "maxPending": self.max_pending,
+            "pending": pending,
+            "running": running,
+            "hashes": self.hashes,
+            "verifies": self.verifies,
+            "rehashes": self.rehashes,
+            "rejected": self.rejected,
+            "queueWaitMs": {
+                "p50": _percentile(waits, 50),
+                "p95": _percentile(waits, 95),
+                "p99": _percentile(waits, 99),
+                "max": round(waits[-1] * 1000, 2) if waits else None
+            },
+            "runMs": {
+                "p50": _percentile(runs, 50),
+                "p95": _percentile(runs, 95),
+                "max": round(runs[-1] * 1000, 2) if runs else None
+            }
+        }
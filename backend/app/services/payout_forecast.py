@@ -0,0 +1,230 @@
+"""
+Payout Forecast - Projected binary matching liability
+Estimates the matching income owed over the next N EODs from the current
+carry-forward PV and recent activation velocity.
+
+Model:
+    * Every PLAN_ACTIVATION in the lookback window is assumed to repeat at
+      the same position, at the same average daily rate (plan PV / lookback
+      days per activation).
+    * Those expected daily PV amounts flow up the binary tree exactly like
+      distribute_pv_upward does: every ancestor receives it on the leg the
+      source sits in. Leg inflow is computed once as subtree sums over the
+      in-process tree index, so the teams collection is not read at all.
+    * Each EOD is then simulated for all earning users at once with the
+      eod_engine rules: match min(leftPV, rightPV), pay up to the plan's
+      daily PV cap at MATCHING_INCOME_RATE and flush the matched PV of paid
+      users. Daily PV usage resets every day (carry forward).
+
+Values are expectations, so PV is kept as floats. Users who become earners
+by activating during the horizon are not added to the earning set. Reads go
+to a secondary when the deployment has one.
+"""
+from datetime import date, datetime, timedelta
+from typing import List
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from pymongo import ReadPreference
+
+from app.services.eod_engine import (
+    ELIGIBLE_USERS_QUERY, MATCHING_INCOME_RATE, SNAPSHOT_PROJECTION,
+    build_snapshot, ist_day_bounds, normalize_plans, plan_cap_pv
+)
+
+FORECAST_USERS_PROJECTION = {key: value for key, value in SNAPSHOT_PROJECTION.items() if key not in ("name", "referralId")}
+
+
+def _secondary(collection):
+    return collection.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+
+
+def load_activation_history(transactions_collection, plans: List[dict], since: datetime) -> pd.DataFrame:
+    """
+    PLAN_ACTIVATION transactions since ``since`` as a frame of
+    (userId, pv, date), where userId is the activating member and date is
+    the IST calendar day
+    """
+    pv_by_plan = {plan["name"]: plan.get("pv", 0) or 0 for plan in plans if plan.get("name")}
+    cursor = transactions_collection.find(
+        {"type": "PLAN_ACTIVATION", "createdAt": {"$gte": since}},
+        {"_id": 0, "userId": 1, "fromUserId": 1, "planName": 1, "createdAt": 1}
+    )
+    frame = pd.DataFrame(list(cursor), columns=["userId", "fromUserId", "planName", "createdAt"])
+    if frame.empty:
+        return pd.DataFrame({"userId": pd.Series(dtype=str), "pv": pd.Series(dtype=float), "date": pd.Series(dtype=object)})
+
+    frame["userId"] = frame["fromUserId"].fillna(frame["userId"]).astype(str)
+    frame["pv"] = frame["planName"].map(pv_by_plan).fillna(0).astype(float)
+    frame["date"] = pd.to_datetime(frame["createdAt"], utc=True).dt.tz_convert("Asia/Kolkata").dt.date
+    return frame[["userId", "pv", "date"]]
+
+
+def activation_summary(history: pd.DataFrame, start: date, lookback_days: int) -> dict:
+    """Per-day activation counts / PV over the lookback window (zero-filled)"""
+    days = pd.date_range(start, periods=lookback_days, freq="D").date
+    daily = history.groupby("date").agg(activations=("pv", "size"), pv=("pv", "sum"))
+    daily = daily.reindex(days, fill_value=0)
+    return {
+        "activations": int(daily["activations"].sum()),
+        "pv": float(daily["pv"].sum()),
+        "avgDailyActivations": round(float(daily["activations"].mean()), 2),
+        "avgDailyPV": round(float(daily["pv"].mean()), 2),
+        "history": [
+            {"date": day.isoformat(), "activations": int(row.activations), "pv": float(row.pv)}
+            for day, row in daily.iterrows()
+        ]
+    }
+
+
+def node_positions(tree_keys: np.ndarray, object_ids) -> np.ndarray:
+    """Tree node index of each ObjectId (-1 when not in the tree)"""
+    keys = np.array([oid.binary for oid in object_ids], dtype="S12")
+    if len(tree_keys) == 0 or len(keys) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    order = np.argsort(tree_keys, kind="stable")
+    sorted_keys = tree_keys[order]
+    found = np.searchsorted(sorted_keys, keys).clip(0, len(sorted_keys) - 1)
+    return np.where(sorted_keys[found] == keys, order[found], -1)
+
+
+def _gather(values: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """values[position] per user, 0 for users outside the tree"""
+    if len(values) == 0:
+        return np.zeros(len(positions), dtype=np.float64)
+    return np.where(positions >= 0, values[np.maximum(positions, 0)], 0.0)
+
+
+def leg_inflow(tree: dict, node_rates: np.ndarray):
+    """
+    Daily PV arriving on each node's LEFT and RIGHT leg: the sum of the
+    source rates in each child's subtree (children accumulated before
+    parents along a BFS order)
+    """
+    parent = tree["parent"].tolist()
+    left = tree["left"].tolist()
+    right = tree["right"].tolist()
+
+    order = [index for index, p in enumerate(parent) if p == -1]
+    position = 0
+    while position < len(order):
+        index = order[position]
+        position += 1
+        if left[index] != -1:
+            order.append(left[index])
+        if right[index] != -1:
+            order.append(right[index])
+
+    sums = node_rates.tolist()
+    for index in reversed(order):
+        p = parent[index]
+        if p != -1:
+            sums[p] += sums[index]
+
+    sums = np.asarray(sums, dtype=np.float64)
+    left_arr, right_arr = tree["left"], tree["right"]
+    left_in = np.where(left_arr >= 0, sums[np.maximum(left_arr, 0)], 0.0)
+    right_in = np.where(right_arr >= 0, sums[np.maximum(right_arr, 0)], 0.0)
+    return left_in, right_in
+
+
+def simulate_liability(snapshot: dict, left_in: np.ndarray, right_in: np.ndarray,
+                       start: date, days: int, rate=MATCHING_INCOME_RATE) -> pd.DataFrame:
+    """Day-by-day EOD simulation for every earning user at once"""
+    left = snapshot["leftPV"].astype(np.float64)
+    right = snapshot["rightPV"].astype(np.float64)
+    cap = plan_cap_pv(snapshot["plans"], rate)[snapshot["planIndex"]].astype(np.float64)
+    first_day_used = np.where(snapshot["sameDay"], snapshot["dailyPVUsed"], 0).astype(np.float64)
+
+    rows = []
+    for day in range(days):
+        left += left_in
+        right += right_in
+        matched = np.minimum(left, right)
+        remaining = cap - (first_day_used if day == 0 else 0.0)
+        today_pv = np.minimum(matched, remaining)
+        paid = (cap >= 0) & (remaining > 0) & (today_pv > 0)
+        capped = (cap >= 0) & (matched > 0) & (remaining < matched)
+        flushed = np.where(paid, matched, 0.0)
+        left -= flushed
+        right -= flushed
+        rows.append({
+            "date": start + timedelta(days=day),
+            "payout": float(np.where(paid, today_pv, 0.0).sum() * rate),
+            "paidUsers": int(paid.sum()),
+            "cappedUsers": int(capped.sum()),
+            "flushedPV": float(flushed.sum()),
+            "carryForwardPV": float(left.sum() + right.sum())
+        })
+
+    curve = pd.DataFrame(rows, columns=["date", "payout", "paidUsers", "cappedUsers", "flushedPV", "carryForwardPV"])
+    curve["cumulativePayout"] = curve["payout"].cumsum()
+    return curve
+
+
+def forecast_payouts(
+    users_collection, transactions_collection, plans_collection, tree_index,
+    now: datetime, start: date, days: int = 30, lookback_days: int = 30
+) -> dict:
+    """
+    Forecast the matching liability for ``days`` EODs starting on ``start``.
+    Returns the activation velocity used and the per-day liability curve.
+    """
+    plan_docs = list(_secondary(plans_collection).find({}, {"name": 1, "pv": 1, "dailyCapping": 1}))
+    plans = normalize_plans(plan_docs)
+
+    today, start_utc, end_utc = ist_day_bounds(now)
+    window_start = today - timedelta(days=lookback_days - 1)
+    history = load_activation_history(_secondary(transactions_collection), plan_docs, window_start)
+    velocity = activation_summary(history, window_start.date(), lookback_days)
+
+    tree = tree_index.export_arrays()
+    tree_keys = np.frombuffer(tree["keys"], dtype="S12")
+    tree_arrays = {
+        "parent": np.frombuffer(tree["parent"], dtype=np.intc).astype(np.int64),
+        "left": np.frombuffer(tree["left"], dtype=np.intc).astype(np.int64),
+        "right": np.frombuffer(tree["right"], dtype=np.intc).astype(np.int64)
+    }
+
+    # Expected PV per day generated at each node
+    node_rates = np.zeros(len(tree_keys), dtype=np.float64)
+    if not history.empty:
+        per_source = history.groupby("userId")["pv"].sum() / lookback_days
+        sources = [(user_id, pv) for user_id, pv in per_source.items() if len(user_id) == 24]
+        if sources:
+            positions = node_positions(tree_keys, [ObjectId(user_id) for user_id, _ in sources])
+            amounts = np.array([pv for _, pv in sources], dtype=np.float64)
+            known = positions >= 0
+            np.add.at(node_rates, positions[known], amounts[known])
+    left_in, right_in = leg_inflow(tree_arrays, node_rates)
+
+    snapshot = build_snapshot(
+        _secondary(users_collection).find(ELIGIBLE_USERS_QUERY, FORECAST_USERS_PROJECTION, batch_size=5000),
+        plans, start_utc, end_utc
+    )
+    positions = node_positions(tree_keys, snapshot["ids"])
+    curve = simulate_liability(
+        snapshot, _gather(left_in, positions), _gather(right_in, positions), start, days
+    )
+
+    return {
+        "generatedAt": now.isoformat(),
+        "startDate": start.isoformat(),
+        "horizonDays": days,
+        "lookbackDays": lookback_days,
+        "earningUsers": int(len(snapshot["leftPV"])),
+        "activationVelocity": velocity,
+        "totalLiability": round(float(curve["payout"].sum()), 2),
+        "curve": [
+            {
+                "date": row.date.isoformat(),
+                "payout": round(row.payout, 2),
+                "cumulativePayout": round(row.cumulativePayout, 2),
+                "paidUsers": int(row.paidUsers),
+                "cappedUsers": int(row.cappedUsers),
+                "flushedPV": round(row.flushedPV, 2),
+                "carryForwardPV": round(row.carryForwardPV, 2)
+            }
+            for row in curve.itertuples(index=False)
+        ]
+    }
@@ -5,6 +5,7 @@ Handles automatic placement of new users in binary tree structure
 from typing import Optional, Tuple
 from bson import ObjectId
 from app.core.database import users_collection, teams_collection
+from app.services.tree_service import find_extreme_leaf
 
 
 def find_deepest_left_position(sponsor_id: str) -> Optional[str]:
@@ -12,47 +13,16 @@ def find_deepest_left_position(sponsor_id: str) -> Optional[str]:
     Find the deepest LEFT-most available position in sponsor's LEFT leg
     
     Algorithm:
-    1. Start at sponsor's left child
-    2. Always go left first (depth-first, left-most)
-    3. If left is filled, check that node's left child
-    4. Continue until finding an empty left position
-    5. Return the user_id where the new user should be placed
+    1. Read the sponsor's maintained leftLeafId pointer (single indexed read)
+    2. The pointer is the last node reached by always going left from the sponsor
+    3. It is advanced whenever a member is placed at the bottom of the left leg
+    4. If the pointer is missing (older data), walk the leg once and store it
     
     Returns:
         user_id (str): The user ID under whom the new user should be placed on LEFT
         None: If sponsor's direct left is empty (place directly under sponsor)
     """
-    # Check if sponsor's direct left child exists
-    left_child = teams_collection.find_one({
-        "sponsorId": sponsor_id,
-        "placement": "LEFT"
-    })
-    
-    # If no left child, new user goes directly under sponsor on LEFT
-    if not left_child:
-        return None
-    
-    # Start traversal from sponsor's left child
-    current_user_id = left_child["userId"]
-    
-    # Traverse down the left leg to find deepest left-most available position
-    max_depth = 100  # Prevent infinite loops
-    for _ in range(max_depth):
-        # Check if current user has a left child
-        left_child = teams_collection.find_one({
-            "sponsorId": current_user_id,
-            "placement": "LEFT"
-        })
-        
-        if not left_child:
-            # Found empty left position! Place new user here
-            return current_user_id
-        
-        # Move to the left child and continue
-        current_user_id = left_child["userId"]
-    
-    # Fallback (should not reach here in normal scenarios)
-    return current_user_id
+    return find_extreme_leaf(users_collection, teams_collection, sponsor_id, "LEFT")
 
 
 def find_deepest_right_position(sponsor_id: str) -> Optional[str]:
@@ -60,47 +30,16 @@ def find_deepest_right_position(sponsor_id: str) -> Optional[str]:
     Find the deepest RIGHT-most available position in sponsor's RIGHT leg
     
     Algorithm:
-    1. Start at sponsor's right child
-    2. Always go right first (depth-first, right-most)
-    3. If right is filled, check that node's right child
-    4. Continue until finding an empty right position
-    5. Return the user_id where the new user should be placed
+    1. Read the sponsor's maintained rightLeafId pointer (single indexed read)
+    2. The pointer is the last node reached by always going right from the sponsor
+    3. It is advanced whenever a member is placed at the bottom of the right leg
+    4. If the pointer is missing (older data), walk the leg once and store it
     
     Returns:
         user_id (str): The user ID under whom the new user should be placed on RIGHT
         None: If sponsor's direct right is empty (place directly under sponsor)
     """
-    # Check if sponsor's direct right child exists
-    right_child = teams_collection.find_one({
-        "sponsorId": sponsor_id,
-        "placement": "RIGHT"
-    })
-    
-    # If no right child, new user goes directly under sponsor on RIGHT
-    if not right_child:
-        return None
-    
-    # Start traversal from sponsor's right child
-    current_user_id = right_child["userId"]
-    
-    # Traverse down the right leg to find deepest right-most available position
-    max_depth = 100  # Prevent infinite loops
-    for _ in range(max_depth):
-        # Check if current user has a right child
-        right_child = teams_collection.find_one({
-            "sponsorId": current_user_id,
-            "placement": "RIGHT"
-        })
-        
-        if not right_child:
-            # Found empty right position! Place new user here
-            return current_user_id
-        
-        # Move to the right child and continue
-        current_user_id = right_child["userId"]
-    
-    # Fallback (should not reach here in normal scenarios)
-    return current_user_id
+    return find_extreme_leaf(users_collection, teams_collection, sponsor_id, "RIGHT")
 
 
 def get_auto_placement_position(sponsor_id: str, preferred_placement: str) -> Tuple[str, str]:
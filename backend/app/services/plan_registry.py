@@ -0,0 +1,78 @@
+"""
+Plan Registry - In-process plan catalog
+users.currentPlan holds either the plan's ObjectId string or, for legacy
+records, the plan name, so every reader used to fetch the whole plans
+collection (or one plan per user) and try both. The registry loads the
+catalog once and keeps two dict indexes:
+
+    by id    str(_id) -> plan document
+    by name  name     -> plan document
+
+so any currentPlan / currentPlanId / planId value resolves in O(1).
+Plan documents are shared between requests and must be treated as
+read-only. create / update / delete plan call invalidate(); reloads and
+cross-worker invalidation are handled by VersionedCache (version id "plans").
+"""
+from typing import List, Optional
+from bson import ObjectId
+
+from app.services.versioned_cache import VersionedCache
+
+# currentPlan strings shorter than this that match no plan are shown as-is
+MAX_LEGACY_PLAN_NAME = 50
+
+
+class PlanRegistry(VersionedCache):
+    """Plans indexed by id and by name"""
+
+    version_id = "plans"
+
+    def __init__(self, plans_collection, versions_collection, ttl: float = 300.0,
+                 version_check_interval: float = 2.0):
+        super().__init__(versions_collection, ttl, version_check_interval)
+        self.plans = plans_collection
+
+    def _fetch(self):
+        plans = list(self.plans.find({}))
+        return {
+            "all": plans,
+            "byId": {str(plan["_id"]): plan for plan in plans},
+            "byName": {plan["name"]: plan for plan in plans if plan.get("name")}
+        }
+
+    def _empty(self):
+        return {"all": [], "byId": {}, "byName": {}}
+
+    def all(self, active_only: bool = False) -> List[dict]:
+        plans = self.current()["all"]
+        return [plan for plan in plans if plan.get("isActive")] if active_only else list(plans)
+
+    def by_id(self, plan_id) -> Optional[dict]:
+        """Plan by ObjectId / id string only (None for names or bad ids)"""
+        if not plan_id:
+            return None
+        return self.current()["byId"].get(str(plan_id))
+
+    def resolve(self, value) -> Optional[dict]:
+        """Plan for a currentPlan / currentPlanId value: id first, then name"""
+        if not value:
+            return None
+        catalog = self.current()
+        if isinstance(value, ObjectId):
+            return catalog["byId"].get(str(value))
+        return catalog["byId"].get(value) or catalog["byName"].get(value)
+
+    def name_for(self, value, default=None) -> Optional[str]:
+        """
+        Display name for a currentPlan value. Unknown short strings are
+        legacy plan names and are returned unchanged; anything else
+        (unknown ids, junk) gives ``default``.
+        """
+        if not value:
+            return default
+        plan = self.resolve(value)
+        if plan:
+            return plan.get("name")
+        if isinstance(value, str) and len(value) < MAX_LEGACY_PLAN_NAME and not ObjectId.is_valid(value):
+            return value
+        return default
@@ -0,0 +1,251 @@
+"""
+Principal Cache - Slim, short-lived auth principals
+get_current_user only needs to know who the caller is and whether they may
+act (isActive / role), yet it used to load and serialize the full user
+document (password hash, kycData, base64 profilePhoto) on every request.
+This cache keeps a slim principal per userId:
+
+    {id, name, role, isActive, kycStatus, sponsorId, referralId}
+
+in an LRU of at most ``max_entries`` entries, each valid for ``ttl``
+seconds.
+
+Invalidation:
+    * invalidate(user_id) drops the entry locally; call it whenever a
+      user's status, role, KYC state or name changes, or the user is deleted.
+    * It also bumps the "principals" sequence in ``cache_versions`` and
+      logs {seq, userId, at} in ``principal_invalidations`` (TTL-indexed).
+      Other workers check the sequence at most every
+      ``version_check_interval`` seconds and drop only the logged users.
+      When entries are missing (not written yet, expired, or too many to
+      replay) they clear the whole cache instead. A change is visible
+      everywhere within that interval, and within ``ttl`` at worst if the
+      sequence cannot be read.
+    * A miss that read the database before an invalidation of the same user
+      was applied here does not store its (possibly old) result: every drop
+      is stamped with a local epoch, and a load only stores when no drop
+      newer than its start exists.
+
+get() reads through pymongo; aget() is the same lookup for async request
+handlers, reading through the motor collections given as ``async_users``,
+``async_versions`` and ``async_invalidations`` so a miss does not block the
+event loop.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, Optional
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+PRINCIPALS_VERSION_ID = "principals"
+
+# Invalidation log entries are kept this long; a worker that falls further
+# behind clears its whole cache
+INVALIDATION_LOG_TTL_SECONDS = 3600
+
+# Replaying more log entries than this at once clears the cache instead
+MAX_REPLAY = 1000
+
+PRINCIPAL_PROJECTION = {
+    "name": 1, "role": 1, "isActive": 1, "kycStatus": 1, "sponsorId": 1, "referralId": 1
+}
+
+
+def to_principal(user: dict) -> dict:
+    return {
+        "id": str(user["_id"]),
+        "name": user.get("name"),
+        "role": user.get("role"),
+        "isActive": user.get("isActive", False),
+        "kycStatus": user.get("kycStatus"),
+        "sponsorId": user.get("sponsorId"),
+        "referralId": user.get("referralId")
+    }
+
+
+def _replay_query(since, until) -> dict:
+    return {"seq": {"$gt": since, "$lte": until}}
+
+
+class PrincipalCache:
+    """LRU + TTL cache of slim user principals keyed by userId"""
+
+    def __init__(self, users_collection, versions_collection, invalidations_collection,
+                 max_entries: int = 10000, ttl: float = 30.0, version_check_interval: float = 2.0,
+                 async_users=None, async_versions=None, async_invalidations=None):
+        self.users = users_collection
+        self.versions = versions_collection
+        self.invalidations = invalidations_collection
+        self.async_users = async_users
+        self.async_versions = async_versions
+        self.async_invalidations = async_invalidations
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()  # user_id -> (expires_at, principal)
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        # Local drop stamps: a load stores only if no drop is newer than its start
+        self._epoch = 0
+        self._dropped = OrderedDict()  # user_id -> epoch of the last drop
+        self._cleared_epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.clears = 0
+
+    def ensure_indexes(self):
+        self.invalidations.create_index([("seq", ASCENDING)])
+        self.invalidations.create_index([("at", ASCENDING)], expireAfterSeconds=INVALIDATION_LOG_TTL_SECONDS)
+
+    # ---- local drops ----
+
+    def _drop(self, user_ids: Iterable[str]):
+        with self._lock:
+            self._epoch += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+                self._dropped[user_id] = self._epoch
+                self._dropped.move_to_end(user_id)
+            while len(self._dropped) > self.max_entries:
+                # Forgetting a stamp must not let an older load store: raise the floor
+                _, epoch = self._dropped.popitem(last=False)
+                self._cleared_epoch = max(self._cleared_epoch, epoch)
+
+    def _clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._dropped.clear()
+            self._cleared_epoch = self._epoch
+            self.clears += 1
+
+    # ---- cross-worker sync ----
+
+    def _version_due(self, now: float) -> bool:
+        if now - self._version_checked_at < self.version_check_interval:
+            return False
+        self._version_checked_at = now
+        return True
+
+    def _apply_log(self, version, entries: Optional[list]):
+        """Drop the users logged between our version and ``version``"""
+        previous = self._version
+        if entries is not None and len({entry["seq"] for entry in entries}) == version - previous:
+            self._drop({entry["userId"] for entry in entries})
+        else:
+            self._clear()
+        self._version = version
+
+    def _needs_replay(self, version) -> bool:
+        return self._version is not None and version > self._version and version - self._version <= MAX_REPLAY
+
+    def _check_version(self, now: float):
+        if not self._version_due(now):
+            return
+        try:
+            doc = self.versions.find_one({"_id": PRINCIPALS_VERSION_ID}, {"version": 1})
+            version = doc.get("version", 0) if doc else 0
+            if version == self._version:
+                return
+            entries = None
+            if self._needs_replay(version):
+                entries = list(self.invalidations.find(_replay_query(self._version, version), {"seq": 1, "userId": 1}))
+        except Exception as e:
+            print(f"⚠️ Principal cache version check failed: {e}")
+            return
+        self._apply_log(version, entries)
+
+    async def _check_version_async(self, now: float):
+        if not self._version_due(now):
+            return
+        try:
+            doc = await self.async_versions.find_one({"_id": PRINCIPALS_VERSION_ID}, {"version": 1})
+            version = doc.get("version", 0) if doc else 0
+            if version == self._version:
+                return
+            entries = None
+            if self._needs_replay(version):
+                entries = await self.async_invalidations.find(
+                    _replay_query(self._version, version), {"seq": 1, "userId": 1}
+                ).to_list(length=None)
+        except Exception as e:
+            print(f"⚠️ Principal cache version check failed: {e}")
+            return
+        self._apply_log(version, entries)
+
+    # ---- lookups ----
+
+    def _cached(self, user_id: str, now: float) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return dict(entry[1])
+        self.misses += 1
+        return None
+
+    def _store(self, user_id: str, user: dict, now: float, started_epoch: int) -> dict:
+        principal = to_principal(user)
+        with self._lock:
+            # Invalidated while we were reading: the document may predate the change
+            if self._dropped.get(user_id, 0) > started_epoch or self._cleared_epoch > started_epoch:
+                return dict(principal)
+            self._entries[user_id] = (now + self.ttl, principal)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dict(principal)
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """
+        Principal for user_id (a copy, safe to modify), or None when the
+        user does not exist
+        """
+        now = time.monotonic()
+        self._check_version(now)
+        principal = self._cached(user_id, now)
+        if principal is not None:
+            return principal
+
+        started_epoch = self._epoch
+        user = self.users.find_one({"_id": ObjectId(user_id)}, PRINCIPAL_PROJECTION)
+        return self._store(user_id, user, now, started_epoch) if user else None
+
+    async def aget(self, user_id: str) -> Optional[dict]:
+        """get() for async handlers (needs the async_* collections)"""
+        now = time.monotonic()
+        await self._check_version_async(now)
+        principal = self._cached(user_id, now)
+        if principal is not None:
+            return principal
+
+        started_epoch = self._epoch
+        user = await self.async_users.find_one({"_id": ObjectId(user_id)}, PRINCIPAL_PROJECTION)
+        return self._store(user_id, user, now, started_epoch) if user else None
+
+    def invalidate(self, user_id: str):
+        """Forget user_id here and make the other workers drop their copies"""
+        self._drop([user_id])
+        doc = self.versions.find_one_and_update(
+            {"_id": PRINCIPALS_VERSION_ID},
+            {"$inc": {"version": 1}, "$set": {"updatedAt": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.invalidations.insert_one({"seq": doc["version"], "userId": user_id, "at": datetime.utcnow()})
+        # Only our own bump since the last check: nothing else to drop here
+        if self._version is not None and doc.get("version") == self._version + 1:
+            self._version = doc["version"]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "clears": self.clears,
+            "version": self._version
+        }
@@ -0,0 +1,80 @@
+"""
+Rank Table - Cached rank thresholds
+A member's rank is the highest rank whose minPV is <= their totalPV; members
+below every threshold get the lowest rank, and with no ranks defined every
+member is a "Member". The ranks collection is loaded once into minPV-sorted
+thresholds, so one rank resolves with bisect and a whole list of members
+with a single numpy.searchsorted.
+
+Rank summaries are shared between requests and must be treated as read-only.
+save_ranks / delete_rank call invalidate(); reloads and cross-worker
+invalidation are handled by VersionedCache (version id "ranks").
+"""
+from bisect import bisect_right
+from typing import Iterable, List
+import numpy as np
+
+from app.services.versioned_cache import VersionedCache
+
+DEFAULT_RANK = {
+    "name": "Member",
+    "icon": "👤",
+    "color": "#6B7280",
+    "minPV": 0
+}
+
+
+def _rank_summary(rank: dict) -> dict:
+    return {
+        "name": rank.get("name"),
+        "icon": rank.get("icon"),
+        "color": rank.get("color"),
+        "minPV": rank.get("minPV")
+    }
+
+
+class RankTable(VersionedCache):
+    """Ranks sorted by minPV with bisect / searchsorted lookups"""
+
+    version_id = "ranks"
+
+    def __init__(self, ranks_collection, versions_collection, ttl: float = 300.0,
+                 version_check_interval: float = 2.0):
+        super().__init__(versions_collection, ttl, version_check_interval)
+        self.ranks = ranks_collection
+
+    def _fetch(self):
+        docs = list(self.ranks.find({}))
+        ordered = sorted(docs, key=lambda rank: rank.get("minPV") or 0)
+        thresholds = [rank.get("minPV") or 0 for rank in ordered]
+        return {
+            "docs": sorted(docs, key=lambda rank: rank.get("order") or 0),
+            "thresholds": thresholds,
+            "thresholdArray": np.asarray(thresholds, dtype=np.float64),
+            "summaries": [_rank_summary(rank) for rank in ordered]
+        }
+
+    def _empty(self):
+        return {"docs": [], "thresholds": [], "thresholdArray": np.zeros(0), "summaries": []}
+
+    def all(self) -> List[dict]:
+        """Rank documents in display order"""
+        return list(self.current()["docs"])
+
+    def rank_for(self, total_pv) -> dict:
+        """Rank summary for one totalPV value"""
+        table = self.current()
+        if not table["summaries"]:
+            return DEFAULT_RANK
+        index = bisect_right(table["thresholds"], total_pv or 0) - 1
+        return table["summaries"][max(index, 0)]
+
+    def rank_for_many(self, total_pvs: Iterable) -> List[dict]:
+        """Rank summary per totalPV value, resolved in one vectorized pass"""
+        table = self.current()
+        values = np.fromiter((pv or 0 for pv in total_pvs), dtype=np.float64)
+        if not table["summaries"]:
+            return [DEFAULT_RANK] * len(values)
+        indexes = np.searchsorted(table["thresholdArray"], values, side="right") - 1
+        summaries = table["summaries"]
+        return [summaries[index] for index in np.maximum(indexes, 0).tolist()]
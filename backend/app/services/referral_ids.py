@@ -0,0 +1,170 @@
+"""
+Referral IDs - Sequence-allocated, obfuscated member IDs
+New referral IDs come from a counter document instead of random strings
+probed against the users collection:
+
+    counters: {_id: "referralId", seq}
+
+Each worker reserves a block of ``block_size`` sequence numbers with one
+atomic $inc and hands them out from memory, so registering a member needs
+no uniqueness lookup. Async handlers call anext_id(), which reserves
+blocks through the motor collection given as ``async_counters``. A sequence number is turned into an ID by a keyed,
+reversible permutation of [0, 36^8) (affine steps mod 36^8 with digit
+rotations in between), written as 8 base-36 characters after the prefix:
+
+    seq 0, 1, 2 ...  ->  VSV4H8TZXZS, VSVR3B6PK5N, VSVDPDJF6BJ, ...
+
+The permutation is a bijection, so distinct sequence numbers can never
+produce the same ID, and decode() maps an ID back to its sequence number.
+
+Compatibility: IDs issued before the counter (random 7 characters, and
+the admin's ADMIN_REFERRAL_ID) are shorter, so they can never collide
+with sequence IDs and stay valid as they are. Do not change the prefix,
+the length or the round keys once IDs have been issued.
+"""
+import asyncio
+import threading
+from typing import Optional
+from pymongo import ReturnDocument
+
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BASE = len(ALPHABET)
+LENGTH = 8
+SPACE = BASE ** LENGTH
+
+# (multiplier, offset, inverse multiplier) per round; multipliers are
+# coprime to 36^8 so every round is invertible
+ROUNDS = (
+    (2284796163365, 1967089140281, 987652972205),
+    (2155554032393, 1893753512195, 2448988025657),
+)
+ROTATION = 3
+
+COUNTER_ID = "referralId"
+
+
+def _rotate(value: int, places: int) -> int:
+    """Rotate the base-36 digits of value left by ``places``"""
+    places %= LENGTH
+    high = BASE ** (LENGTH - places)
+    return (value % high) * BASE ** places + value // high
+
+
+def encode(seq: int, prefix: str = "VSV") -> str:
+    if not 0 <= seq < SPACE:
+        raise ValueError(f"Referral sequence {seq} out of range")
+    value = seq
+    for multiplier, offset, _ in ROUNDS:
+        value = _rotate((value * multiplier + offset) % SPACE, ROTATION)
+    digits = []
+    for _ in range(LENGTH):
+        value, digit = divmod(value, BASE)
+        digits.append(ALPHABET[digit])
+    return prefix + "".join(reversed(digits))
+
+
+def decode(referral_id: str, prefix: str = "VSV") -> Optional[int]:
+    """Sequence number of a counter-issued ID, or None for any other ID"""
+    if not referral_id or not referral_id.startswith(prefix):
+        return None
+    body = referral_id[len(prefix):]
+    if len(body) != LENGTH or any(char not in ALPHABET for char in body):
+        return None
+    value = 0
+    for char in body:
+        value = value * BASE + ALPHABET.index(char)
+    for multiplier, offset, inverse in reversed(ROUNDS):
+        value = ((_rotate(value, -ROTATION) - offset) * inverse) % SPACE
+    return value
+
+
+class ReferralIdAllocator:
+    """Hands out referral IDs from blocks reserved on the counter document"""
+
+    def __init__(self, counters_collection, prefix: str = "VSV", block_size: int = 100,
+                 async_counters=None):
+        self.counters = counters_collection
+        self.async_counters = async_counters
+        self.prefix = prefix
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._refill_lock = None
+        self._next = 0
+        self._end = 0
+
+    def _reserve_block(self):
+        doc = self.counters.find_one_and_update(
+            {"_id": COUNTER_ID},
+            {"$inc": {"seq": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._end = doc["seq"]
+        self._next = self._end - self.block_size
+
+    def _take(self) -> Optional[int]:
+        with self._lock:
+            if self._next >= self._end:
+                return None
+            seq = self._next
+            self._next += 1
+            return seq
+
+    def next_id(self) -> str:
+        with self._lock:
+            if self._next >= self._end:
+                self._reserve_block()
+            seq = self._next
+            self._next += 1
+        return encode(seq, self.prefix)
+
+    async def anext_id(self) -> str:
+        """next_id() for async handlers (needs async_counters)"""
+        seq = self._take()
+        if seq is None:
+            if self._refill_lock is None:
+                self._refill_lock = asyncio.Lock()
+            async with self._refill_lock:
+                # Another coroutine may have refilled while we waited
+                seq = self._take()
+                while seq is None:
+                    doc = await self.async_counters.find_one_and_update(
+                        {"_id": COUNTER_ID},
+                        {"$inc": {"seq": self.block_size}},
+                        upsert=True,
+                        return_document=ReturnDocument.AFTER
+                    )
+                    with self._lock:
+                        # Blocks never overlap, so replacing a block a thread
+                        # refilled meanwhile only leaves a gap
+                        self._end = doc["seq"]
+                        self._next = self._end - self.block_size
+                    seq = self._take()
+        return encode(seq, self.prefix)
+
+    def sync_counter(self, users_collection) -> dict:
+        """
+        Move the counter past every sequence ID already in ``users``, e.g.
+        after restoring users from a backup taken later than the counter.
+        Legacy IDs are left alone. Returns {"seq", "issued", "legacy"}.
+        """
+        highest = -1
+        issued = legacy = 0
+        for user in users_collection.find({"referralId": {"$type": "string"}}, {"referralId": 1}):
+            seq = decode(user["referralId"], self.prefix)
+            if seq is None:
+                legacy += 1
+            else:
+                issued += 1
+                highest = max(highest, seq)
+        doc = self.counters.find_one_and_update(
+            {"_id": COUNTER_ID},
+            {"$max": {"seq": highest + 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        with self._lock:
+            # Drop a block that may overlap IDs found above
+            if self._next <= highest:
+                self._next = self._end = 0
+        return {"seq": doc["seq"], "issued": issued, "legacy": legacy}
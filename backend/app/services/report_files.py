@@ -1,50 +1,69 @@
-"""Report generation utilities"""
+"""
+Report Files - Excel / PDF rendering for the admin reports
+Pure functions of (rows, headers, title) with no database or app state, so
+they can run in a worker process (see report_jobs.py) as well as inline.
+"""
+import os
+from datetime import datetime
 from io import BytesIO
+from typing import Dict, List
+import pytz
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from datetime import datetime
-from typing import List, Dict
-import pytz
 
 IST = pytz.timezone('Asia/Kolkata')
 
+# format -> (media type, file extension)
+REPORT_FORMATS = {
+    "excel": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "pdf": ("application/pdf", "pdf"),
+}
+
+
 def generate_excel_report(data: List[Dict], headers: List[str], title: str) -> BytesIO:
     """Generate Excel file from data"""
     wb = Workbook()
     ws = wb.active
-    ws.title = title[:31]
+    ws.title = title[:31]  # Excel sheet name max 31 chars
     
+    # Header styling
     header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
     header_font = Font(bold=True, color="FFFFFF", size=12)
     header_alignment = Alignment(horizontal="center", vertical="center")
     
+    # Add title
     ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(headers))
     title_cell = ws.cell(row=1, column=1, value=title)
     title_cell.font = Font(bold=True, size=14)
     title_cell.alignment = Alignment(horizontal="center", vertical="center")
     
+    # Add timestamp
     ws.merge_cells(start_row=2, start_column=1, end_row=2, end_column=len(headers))
     timestamp_cell = ws.cell(row=2, column=1, value=f"Generated on: {datetime.now(IST).strftime('%d-%m-%Y %I:%M %p IST')}")
     timestamp_cell.alignment = Alignment(horizontal="center")
     
+    # Add headers
     for col_num, header in enumerate(headers, 1):
         cell = ws.cell(row=4, column=col_num, value=header)
         cell.fill = header_fill
         cell.font = header_font
         cell.alignment = header_alignment
     
+    # Add data
     for row_num, row_data in enumerate(data, 5):
         for col_num, header in enumerate(headers, 1):
             value = row_data.get(header, "")
             ws.cell(row=row_num, column=col_num, value=value)
     
-    for col in ws.columns:
+    # Auto-adjust column widths
+    for col_num, col in enumerate(ws.columns, 1):
         max_length = 0
-        column = col[0].column_letter
+        column = get_column_letter(col_num)  # Row 1 is merged, so col[0] has no column_letter
         for cell in col:
             try:
                 if len(str(cell.value)) > max_length:
@@ -54,11 +73,13 @@ def generate_excel_report(data: List[Dict], headers: List[str], title: str) -> B
         adjusted_width = min(max_length + 2, 50)
         ws.column_dimensions[column].width = adjusted_width
     
+    # Save to BytesIO
     output = BytesIO()
     wb.save(output)
     output.seek(0)
     return output
 
+
 def generate_pdf_report(data: List[Dict], headers: List[str], title: str) -> BytesIO:
     """Generate PDF file from data"""
     output = BytesIO()
@@ -67,28 +88,33 @@ def generate_pdf_report(data: List[Dict], headers: List[str], title: str) -> Byt
     elements = []
     styles = getSampleStyleSheet()
     
+    # Title
     title_style = ParagraphStyle(
         'CustomTitle',
         parent=styles['Heading1'],
         fontSize=16,
         textColor=colors.HexColor('#366092'),
         spaceAfter=12,
-        alignment=1
+        alignment=1  # Center
     )
     elements.append(Paragraph(title, title_style))
     
+    # Timestamp
     timestamp_text = f"Generated on: {datetime.now(IST).strftime('%d-%m-%Y %I:%M %p IST')}"
     timestamp_style = ParagraphStyle('Timestamp', parent=styles['Normal'], fontSize=9, alignment=1)
     elements.append(Paragraph(timestamp_text, timestamp_style))
     elements.append(Spacer(1, 20))
     
+    # Prepare table data
     table_data = [headers]
     for row in data:
         table_data.append([str(row.get(header, "")) for header in headers])
     
+    # Create table
     col_widths = [A4[0] / len(headers) - 10] * len(headers)
     table = Table(table_data, colWidths=col_widths)
     
+    # Table styling
     table.setStyle(TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#366092')),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
@@ -103,6 +129,27 @@ def generate_pdf_report(data: List[Dict], headers: List[str], title: str) -> Byt
     ]))
     
     elements.append(table)
+    
+    # Build PDF
     doc.build(elements)
     output.seek(0)
     return output
+
+
+def render_report(format: str, data: List[Dict], headers: List[str], title: str) -> bytes:
+    """The report file as bytes"""
+    if format == "excel":
+        return generate_excel_report(data, headers, title).getvalue()
+    if format == "pdf":
+        return generate_pdf_report(data, headers, title).getvalue()
+    raise ValueError(f"Unknown report format: {format}")
+
+
+def write_report(format: str, data: List[Dict], headers: List[str], title: str, path: str) -> int:
+    """Render the report to ``path`` (atomically); returns the file size"""
+    content = render_report(format, data, headers, title)
+    partial = f"{path}.part"
+    with open(partial, "wb") as handle:
+        handle.write(content)
+    os.replace(partial, path)
+    return len(content)
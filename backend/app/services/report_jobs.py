@@ -0,0 +1,271 @@
+"""
+Report Jobs - Background Excel / PDF exports
+Rendering a workbook or PDF for a large member list takes long enough to
+time out the request. A report job renders the file in a process pool
+(``max_workers`` processes, so openpyxl / reportlab never hold the API
+worker's GIL) to ``directory`` on local disk, and the client polls for it.
+
+Jobs live in ``report_jobs`` so any API worker can answer status
+requests:
+
+    {_id: job id, key, activeKey, status: QUEUED|RENDERING|DONE|FAILED,
+     format, title, filename, rowCount, size, error, requestedBy, host,
+     createdAt, startedAt, finishedAt}
+
+The file itself is only on the disk of ``host``, the machine that rendered
+it. Every worker on that host can serve it; with API servers on several
+hosts, REPORT_JOBS_DIR must be shared storage (or downloads routed to the
+rendering host) - a download reaching another host is refused with a
+message naming the host rather than reported as expired.
+
+De-duplication: ``key`` is a hash of (format, title, headers, rows).
+While a job is in flight it also carries ``activeKey`` (unique, sparse), so
+submitting an identical report returns the job already running instead of
+rendering it twice. activeKey is removed when the job finishes.
+
+Cleanup: every ``cleanup_interval`` seconds, finished jobs older than
+``ttl`` are deleted along with their files, jobs queued (since createdAt)
+or rendering (since startedAt) for longer than ``stale_after`` are marked
+FAILED (their worker died), and files without a job are removed.
+
+render() is the inline path for small exports: same process pool, the
+bytes come straight back to the request.
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app.services.report_files import REPORT_FORMATS, render_report, write_report
+
+STATUS_QUEUED = "QUEUED"
+STATUS_RENDERING = "RENDERING"
+STATUS_DONE = "DONE"
+STATUS_FAILED = "FAILED"
+
+IN_FLIGHT = (STATUS_QUEUED, STATUS_RENDERING)
+
+PROGRESS = {STATUS_QUEUED: 0, STATUS_RENDERING: 50, STATUS_DONE: 100, STATUS_FAILED: 100}
+
+
+def report_key(format: str, headers: List[str], title: str, data: List[Dict]) -> str:
+    payload = json.dumps([format, title, headers, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def job_view(job: dict) -> dict:
+    """Public fields of a job document"""
+    return {
+        "jobId": job["_id"],
+        "status": job["status"],
+        "progress": PROGRESS.get(job["status"], 0),
+        "format": job["format"],
+        "title": job["title"],
+        "filename": job["filename"],
+        "rowCount": job.get("rowCount", 0),
+        "size": job.get("size"),
+        "error": job.get("error"),
+        "createdAt": job["createdAt"].isoformat() if job.get("createdAt") else None,
+        "startedAt": job["startedAt"].isoformat() if job.get("startedAt") else None,
+        "finishedAt": job["finishedAt"].isoformat() if job.get("finishedAt") else None
+    }
+
+
+class ReportJobQueue:
+    """Process-pool report rendering with MongoDB-tracked jobs"""
+
+    def __init__(
+        self,
+        jobs_collection,
+        directory: str,
+        max_workers: int = 2,
+        ttl: float = 3600.0,
+        stale_after: float = 1800.0,
+        cleanup_interval: float = 300.0
+    ):
+        self.jobs = jobs_collection
+        self.directory = directory
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.cleanup_interval = cleanup_interval
+        self.host = socket.gethostname()
+        self._executor = None
+        self._tasks = set()
+        self._cleanup_task = None
+
+    def ensure_indexes(self):
+        self.jobs.create_index([("activeKey", ASCENDING)], unique=True, sparse=True, name="activeKey_unique")
+        self.jobs.create_index([("status", ASCENDING), ("finishedAt", ASCENDING)])
+        self.jobs.create_index([("createdAt", DESCENDING)])
+
+    # ---- lifecycle ----
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs threads (motor, bcrypt pool) is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self):
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._cleanup_task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                await self.cleanup()
+            except Exception as e:
+                print(f"⚠️ Report job cleanup failed: {e}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    # ---- rendering ----
+
+    async def render(self, format: str, data: List[Dict], headers: List[str], title: str) -> bytes:
+        """Render inline (for small exports) without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool(), render_report, format, data, headers, title)
+
+    def file_path(self, job: dict) -> str:
+        return os.path.join(self.directory, f"{job['_id']}.{REPORT_FORMATS[job['format']][1]}")
+
+    def rendered_elsewhere(self, job: dict) -> bool:
+        """The job's file is on another host's disk (REPORT_JOBS_DIR not shared)"""
+        return bool(job.get("host")) and job["host"] != self.host and not os.path.exists(self.file_path(job))
+
+    async def submit(self, format: str, data: List[Dict], headers: List[str], title: str, filename: str,
+                     requested_by: Optional[str] = None) -> dict:
+        """
+        Queue a report and return its job view; an identical report that is
+        still in flight is returned instead (with ``deduplicated`` set).
+        """
+        if format not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format: {format}")
+        key = report_key(format, headers, title, data)
+        for _ in range(3):
+            job = {
+                "_id": uuid.uuid4().hex,
+                "key": key,
+                "activeKey": key,
+                "status": STATUS_QUEUED,
+                "format": format,
+                "title": title,
+                "filename": filename,
+                "rowCount": len(data),
+                "requestedBy": requested_by,
+                "host": self.host,
+                "createdAt": datetime.utcnow()
+            }
+            try:
+                await asyncio.to_thread(self.jobs.insert_one, job)
+            except DuplicateKeyError:
+                existing = await asyncio.to_thread(self.jobs.find_one, {"activeKey": key})
+                if existing:
+                    return {**job_view(existing), "deduplicated": True}
+                continue  # finished in between; try again
+            task = asyncio.create_task(self._run(job, data, headers))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return {**job_view(job), "deduplicated": False}
+        raise RuntimeError("Could not queue report job")
+
+    async def _run(self, job: dict, data: List[Dict], headers: List[str]):
+        path = self.file_path(job)
+        try:
+            await asyncio.to_thread(
+                self.jobs.update_one,
+                {"_id": job["_id"]},
+                {"$set": {"status": STATUS_RENDERING, "startedAt": datetime.utcnow()}}
+            )
+            loop = asyncio.get_running_loop()
+            size = await loop.run_in_executor(
+                self._pool(), write_report, job["format"], data, headers, job["title"], path
+            )
+            update = {"$set": {"status": STATUS_DONE, "size": size, "finishedAt": datetime.utcnow()}}
+        except Exception as e:
+            print(f"⚠️ Report job {job['_id']} failed: {e}")
+            update = {"$set": {"status": STATUS_FAILED, "error": str(e), "finishedAt": datetime.utcnow()}}
+        update["$unset"] = {"activeKey": ""}
+        try:
+            await asyncio.to_thread(self.jobs.update_one, {"_id": job["_id"]}, update)
+        except Exception as e:
+            print(f"⚠️ Report job {job['_id']} status update failed: {e}")
+
+    # ---- queries ----
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.jobs.find_one, {"_id": job_id})
+
+    async def recent(self, limit: int = 20) -> List[dict]:
+        def load():
+            return list(self.jobs.find({}).sort("createdAt", DESCENDING).limit(limit))
+        return await asyncio.to_thread(load)
+
+    # ---- cleanup ----
+
+    def _cleanup(self, now: datetime) -> dict:
+        expired = 0
+        for job in self.jobs.find(
+            {"status": {"$in": [STATUS_DONE, STATUS_FAILED]}, "finishedAt": {"$lt": now - timedelta(seconds=self.ttl)}},
+            {"format": 1}
+        ):
+            try:
+                os.remove(self.file_path(job))
+            except FileNotFoundError:
+                pass
+            self.jobs.delete_one({"_id": job["_id"]})
+            expired += 1
+
+        stale_before = now - timedelta(seconds=self.stale_after)
+        stale = self.jobs.update_many(
+            {"$or": [
+                {"status": STATUS_QUEUED, "createdAt": {"$lt": stale_before}},
+                {"status": STATUS_RENDERING, "startedAt": {"$lt": stale_before}}
+            ]},
+            {
+                "$set": {"status": STATUS_FAILED, "error": "Interrupted", "finishedAt": now},
+                "$unset": {"activeKey": ""}
+            }
+        ).modified_count
+
+        orphans = 0
+        cutoff = time.time() - self.ttl
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    if os.path.getmtime(path) >= cutoff:
+                        continue
+                    if not self.jobs.find_one({"_id": name.split(".")[0]}, {"_id": 1}):
+                        os.remove(path)
+                        orphans += 1
+                except FileNotFoundError:
+                    pass
+        return {"expired": expired, "stale": stale, "orphans": orphans}
+
+    async def cleanup(self) -> dict:
+        return await asyncio.to_thread(self._cleanup, datetime.utcnow())
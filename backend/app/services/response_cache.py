@@ -0,0 +1,171 @@
+"""
+Response Cache - Memoized JSON bodies with ETag / 304 support
+For read endpoints whose payload only changes on admin edits (plans,
+public settings, tutorials). The serialized body is kept per endpoint path
+and query string, tagged with a strong ETag (hash of the body bytes), and
+a request carrying a matching If-None-Match is answered with 304 and no
+body.
+
+Entries belong to a named group ("plans", "settings", "tutorials"). The
+admin mutation handlers call invalidate(group). That drops the group
+locally and bumps ``responses:<group>`` in ``cache_versions``; other
+workers check the counter at most every ``version_check_interval``
+seconds and drop their copies when it moved.
+
+Bodies built from another in-process cache (plan_registry, settings_cache)
+name it in ``sources``. A miss first syncs those caches with their own
+version counters, so a rebuild never reads a copy older than the edit
+that caused it, and every entry records the source versions it was built
+from: once a source reloads, entries built from the old copy are rebuilt.
+Entries also expire after ``ttl`` seconds as a backstop.
+
+Metrics (per group and total): hits, misses, notModified and bytesSaved.
+bytesSaved counts body bytes that did not go out because of a 304.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Sequence
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+VERSION_PREFIX = "responses:"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison (RFC 7232 3.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+class ResponseCache:
+    """Per-worker cache of serialized JSON responses"""
+
+    def __init__(self, versions_collection, max_entries_per_group: int = 64,
+                 version_check_interval: float = 2.0, ttl: float = 60.0):
+        self.versions = versions_collection
+        self.max_entries_per_group = max_entries_per_group
+        self.version_check_interval = version_check_interval
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._groups: Dict[str, dict] = {}
+
+    def _group(self, name: str) -> dict:
+        group = self._groups.get(name)
+        if group is None:
+            group = self._groups[name] = {
+                "entries": {}, "version": None, "checkedAt": 0.0,
+                "hits": 0, "misses": 0, "notModified": 0, "bytesSaved": 0
+            }
+        return group
+
+    def _read_version(self, name: str):
+        doc = self.versions.find_one({"_id": VERSION_PREFIX + name}, {"version": 1})
+        return doc.get("version", 0) if doc else 0
+
+    def _check_version(self, name: str, group: dict):
+        now = time.monotonic()
+        if now - group["checkedAt"] < self.version_check_interval:
+            return
+        group["checkedAt"] = now
+        try:
+            version = self._read_version(name)
+        except Exception as e:
+            print(f"⚠️ Response cache version check failed: {e}")
+            return
+        if version != group["version"]:
+            group["entries"].clear()
+            group["version"] = version
+
+    def respond(self, request: Request, group_name: str, build: Callable[[], dict],
+                cache_control: str = "no-cache", sources: Sequence = ()) -> Response:
+        """
+        Cached response for this path + query string, building the payload
+        with ``build()`` on a miss. ``sources`` are the VersionedCaches
+        build() reads from. Answers 304 when If-None-Match matches.
+        """
+        key = (request.url.path, request.url.query)
+        with self._lock:
+            group = self._group(group_name)
+            self._check_version(group_name, group)
+            entry = group["entries"].get(key)
+
+        if entry is not None:
+            stamp = tuple(source.loaded_version() for source in sources)
+            if entry["stamp"] != stamp or time.monotonic() - entry["builtAt"] >= self.ttl:
+                entry = None
+
+        if entry is None:
+            stamp = tuple(source.sync() for source in sources)
+            body = JSONResponse(build()).body
+            entry = {
+                "body": body,
+                "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+                "stamp": stamp,
+                "builtAt": time.monotonic()
+            }
+            with self._lock:
+                entries = group["entries"]
+                entries[key] = entry
+                while len(entries) > self.max_entries_per_group:
+                    entries.pop(next(iter(entries)))
+                group["misses"] += 1
+            cache_status = "MISS"
+        else:
+            with self._lock:
+                group["hits"] += 1
+            cache_status = "HIT"
+
+        headers = {"ETag": entry["etag"], "Cache-Control": cache_control, "X-Cache": cache_status}
+        if _etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+            with self._lock:
+                group["notModified"] += 1
+                group["bytesSaved"] += len(entry["body"])
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+    def invalidate(self, group_name: str):
+        """Drop a group here and make the other workers drop it too"""
+        with self._lock:
+            self._group(group_name)["entries"].clear()
+        self.versions.update_one(
+            {"_id": VERSION_PREFIX + group_name},
+            {"$inc": {"version": 1}, "$set": {"updatedAt": datetime.utcnow()}},
+            upsert=True
+        )
+
+    def metrics(self) -> dict:
+        with self._lock:
+            groups = {
+                name: {
+                    "entries": len(group["entries"]),
+                    "hits": group["hits"],
+                    "misses": group["misses"],
+                    "notModified": group["notModified"],
+                    "bytesSaved": group["bytesSaved"],
+                    "hitRate": round(group["hits"] / (group["hits"] + group["misses"]), 4)
+                    if group["hits"] + group["misses"] else None
+                }
+                for name, group in self._groups.items()
+            }
+        hits = sum(group["hits"] for group in groups.values())
+        misses = sum(group["misses"] for group in groups.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hitRate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "notModified": sum(group["notModified"] for group in groups.values()),
+            "bytesSaved": sum(group["bytesSaved"] for group in groups.values()),
+            "groups": groups
+        }
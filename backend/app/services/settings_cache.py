@@ -0,0 +1,65 @@
+"""
+Settings Cache - In-process copy of the settings document
+The settings document is read on almost every request (get_ist_now applies
+systemTimeOffset, withdrawals check minimumWithdrawLimit, the admin page
+polls /api/system/time), so each worker keeps one copy in memory instead of
+calling settings_collection.find_one({}) per use. Reloads and cross-worker
+invalidation are handled by VersionedCache (version id "settings").
+"""
+from app.services.versioned_cache import VersionedCache
+
+DEFAULT_EOD_TIME = "23:59"
+DEFAULT_MINIMUM_WITHDRAW_LIMIT = 1000
+
+PUBLIC_SETTINGS_DEFAULTS = {
+    "companyName": "VSV Unite",
+    "companyEmail": "info@vsvunite.com",
+    "companyPhone": "+91 9999999999",
+    "metaTitle": "VSV Unite - MLM Platform",
+    "metaDescription": "Join VSV Unite for transparent MLM opportunities"
+}
+
+
+class SettingsCache(VersionedCache):
+    """TTL cache of the settings document"""
+
+    version_id = "settings"
+
+    def __init__(self, settings_collection, versions_collection, ttl: float = 60.0,
+                 version_check_interval: float = 2.0):
+        super().__init__(versions_collection, ttl, version_check_interval)
+        self.settings = settings_collection
+
+    def _fetch(self):
+        return self.settings.find_one({}) or {}
+
+    def _empty(self):
+        return {}
+
+    def get(self) -> dict:
+        """
+        The settings document ({} when none exists). Callers must treat it
+        as read-only; it is shared by every request of this worker.
+        """
+        return self.current()
+
+    # ---- typed accessors ----
+
+    def offset_minutes(self) -> int:
+        try:
+            return int(self.get().get("systemTimeOffset") or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def eod_time(self) -> str:
+        return self.get().get("eodTime") or DEFAULT_EOD_TIME
+
+    def minimum_withdraw_limit(self) -> int:
+        try:
+            return int(self.get().get("minimumWithdrawLimit", DEFAULT_MINIMUM_WITHDRAW_LIMIT))
+        except (TypeError, ValueError):
+            return DEFAULT_MINIMUM_WITHDRAW_LIMIT
+
+    def public(self) -> dict:
+        """Settings for /api/settings/public, or the defaults when unset"""
+        return self.get() or PUBLIC_SETTINGS_DEFAULTS
@@ -0,0 +1,402 @@
+"""
+Tree Index - In-process binary tree structure
+Loads the teams collection once into compact parallel arrays so tree
+readers can resolve parents, children and whole subtrees without querying
+MongoDB per node.
+
+Layout (per node, ~39 bytes):
+    _parent[i], _left[i], _right[i]   array('i')  node index or -1
+    _size[i]                          array('i')  nodes in subtree, including i
+    _side[i]                          bytearray   0 root, 1 LEFT, 2 RIGHT, 3 removed
+    _keys[12*i:12*i+12]               bytearray   raw ObjectId bytes
+    _slots                            array('i')  open-addressing hash table key -> index
+"""
+import threading
+import time
+from array import array
+from datetime import timedelta
+from typing import Iterator, List, Optional, Tuple
+from bson import ObjectId
+
+NONE = -1
+
+SIDE_ROOT = 0
+SIDE_LEFT = 1
+SIDE_RIGHT = 2
+SIDE_REMOVED = 3
+
+SIDE_CODES = {"LEFT": SIDE_LEFT, "RIGHT": SIDE_RIGHT}
+SIDE_NAMES = {SIDE_LEFT: "LEFT", SIDE_RIGHT: "RIGHT"}
+
+# Inserts from other workers are picked up by scanning team records whose _id
+# was generated within this window before the newest record already seen
+SYNC_WINDOW_SECONDS = 5
+
+
+def _encode_key(user_id: str) -> Optional[bytes]:
+    """Convert an ObjectId string to its 12 raw bytes (None if not an ObjectId)"""
+    if isinstance(user_id, ObjectId):
+        return user_id.binary
+    try:
+        key = bytes.fromhex(user_id)
+    except (TypeError, ValueError):
+        return None
+    return key if len(key) == 12 else None
+
+
+class BinaryTreeIndex:
+    """Array-backed binary tree keyed by user id strings"""
+
+    def __init__(self, refresh_interval: float = 2.0):
+        self._lock = threading.RLock()
+        self.refresh_interval = refresh_interval
+        self._reset()
+
+    def _reset(self, capacity: int = 1024):
+        self._parent = array('i')
+        self._left = array('i')
+        self._right = array('i')
+        self._size = array('i')
+        self._side = bytearray()
+        self._keys = bytearray()
+        self._slots = array('i', [NONE]) * capacity
+        self._mask = capacity - 1
+        self._removed = 0
+        self._linked = 0
+        self._skipped = set()
+        self._last_team_id = None
+        self._last_refresh = 0.0
+        self.ready = False
+
+    # ---------- interning ----------
+
+    def _key_at(self, index: int) -> bytes:
+        offset = index * 12
+        return bytes(self._keys[offset:offset + 12])
+
+    def _find_slot(self, key: bytes) -> int:
+        """Return the slot holding key, or the empty slot where it would go"""
+        slot = hash(key) & self._mask
+        while True:
+            index = self._slots[slot]
+            if index == NONE or self._key_at(index) == key:
+                return slot
+            slot = (slot + 1) & self._mask
+
+    def _grow(self):
+        capacity = (self._mask + 1) * 2
+        self._slots = array('i', [NONE]) * capacity
+        self._mask = capacity - 1
+        for index in range(len(self._parent)):
+            self._slots[self._find_slot(self._key_at(index))] = index
+
+    def _lookup(self, user_id) -> int:
+        key = _encode_key(user_id)
+        if key is None:
+            return NONE
+        index = self._slots[self._find_slot(key)]
+        if index == NONE or self._side[index] == SIDE_REMOVED:
+            return NONE
+        return index
+
+    def _intern(self, key: bytes) -> int:
+        """Return the node index for key, creating a detached node if needed"""
+        slot = self._find_slot(key)
+        index = self._slots[slot]
+        if index != NONE:
+            return index
+
+        index = len(self._parent)
+        self._parent.append(NONE)
+        self._left.append(NONE)
+        self._right.append(NONE)
+        self._size.append(1)
+        self._side.append(SIDE_ROOT)
+        self._keys += key
+        self._slots[slot] = index
+
+        # Keep the table at most half full
+        if (index + 1) * 2 > self._mask + 1:
+            self._grow()
+        return index
+
+    def _id_at(self, index: int) -> Optional[str]:
+        if index == NONE:
+            return None
+        return self._key_at(index).hex()
+
+    # ---------- mutation ----------
+
+    def _add_to_ancestors(self, index: int, delta: int):
+        """Add delta to the subtree size of every ancestor of index"""
+        current = self._parent[index]
+        # Bounded so corrupt (cyclic) data can't loop forever
+        for _ in range(len(self._parent)):
+            if current == NONE:
+                return
+            self._size[current] += delta
+            current = self._parent[current]
+
+    def _compute_sizes(self):
+        """Recompute every subtree size in one pass (children before parents)"""
+        order = [i for i in range(len(self._parent)) if self._parent[i] == NONE]
+        position = 0
+        while position < len(order):
+            index = order[position]
+            position += 1
+            for child in (self._left[index], self._right[index]):
+                if child != NONE:
+                    order.append(child)
+        for index in range(len(self._size)):
+            self._size[index] = 1
+        for index in reversed(order):
+            parent = self._parent[index]
+            if parent != NONE:
+                self._size[parent] += self._size[index]
+
+    def _link(self, user_id, parent_id, placement: str, propagate: bool = True) -> bool:
+        side = SIDE_CODES.get(placement)
+        child_key = _encode_key(user_id)
+        parent_key = _encode_key(parent_id)
+        if child_key is None:
+            return False
+        if side is None or parent_key is None:
+            # Malformed record (no sponsor or placement): counted, never linked
+            self._skipped.add(child_key)
+            return False
+
+        child = self._intern(child_key)
+        if self._parent[child] != NONE or self._side[child] == SIDE_REMOVED:
+            return False  # Already placed
+        parent = self._intern(parent_key)
+
+        slots = self._left if side == SIDE_LEFT else self._right
+        if slots[parent] != NONE:
+            # Duplicate placement in legacy data: keep the first record, like find_one did
+            print(f"⚠️ Tree index: {parent_id} already has a {placement} child, skipping {user_id}")
+            self._skipped.add(child_key)
+            return False
+
+        self._parent[child] = parent
+        self._side[child] = side
+        slots[parent] = child
+        self._linked += 1
+        if propagate:
+            self._add_to_ancestors(child, self._size[child])
+        return True
+
+    def load(self, teams_collection) -> int:
+        """(Re)build the whole index from the teams collection"""
+        with self._lock:
+            self._reset(max(1024, 1 << (teams_collection.estimated_document_count() * 2 + 2).bit_length()))
+            cursor = teams_collection.find(
+                {}, {"userId": 1, "sponsorId": 1, "placement": 1}
+            ).sort("_id", 1)
+            for team in cursor:
+                self._link(team["userId"], team.get("sponsorId"), team.get("placement"), propagate=False)
+                self._last_team_id = team["_id"]
+            self._compute_sizes()
+            self._last_refresh = time.monotonic()
+            self.ready = True
+            return self._linked
+
+    def add(self, user_id: str, parent_id: str, placement: str) -> bool:
+        """Place user_id under parent_id on the given side"""
+        with self._lock:
+            return self._link(user_id, parent_id, placement)
+
+    def remove(self, user_id: str) -> bool:
+        """
+        Detach a node from its parent and mark it removed
+
+        Its children keep their team records (see delete_user), so they stay
+        linked to the removed node and become unreachable from the upline.
+        """
+        with self._lock:
+            index = self._lookup(user_id)
+            if index == NONE:
+                return False
+
+            parent = self._parent[index]
+            if parent != NONE:
+                self._add_to_ancestors(index, -self._size[index])
+                if self._left[parent] == index:
+                    self._left[parent] = NONE
+                elif self._right[parent] == index:
+                    self._right[parent] = NONE
+                self._linked -= 1
+
+            self._parent[index] = NONE
+            self._side[index] = SIDE_REMOVED
+            self._removed += 1
+            return True
+
+    def refresh(self, teams_collection, force: bool = False) -> None:
+        """
+        Catch up with writes made by other workers
+
+        New team records are picked up incrementally; if the number of
+        placed members no longer matches the collection (a delete happened
+        elsewhere) the index is rebuilt. Throttled to refresh_interval
+        unless force is set.
+        """
+        if not self.ready:
+            self.load(teams_collection)
+            return
+        if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+
+        with self._lock:
+            query = {}
+            if self._last_team_id is not None:
+                since = self._last_team_id.generation_time - timedelta(seconds=SYNC_WINDOW_SECONDS)
+                query = {"_id": {"$gte": ObjectId.from_datetime(since)}}
+
+            for team in teams_collection.find(query, {"userId": 1, "sponsorId": 1, "placement": 1}).sort("_id", 1):
+                if (
+                    not self.contains_placed(team["userId"])
+                    and _encode_key(team["userId"]) not in self._skipped
+                ):
+                    self._link(team["userId"], team.get("sponsorId"), team.get("placement"))
+                if self._last_team_id is None or team["_id"] > self._last_team_id:
+                    self._last_team_id = team["_id"]
+
+            if teams_collection.estimated_document_count() != self._linked + len(self._skipped):
+                self.load(teams_collection)
+            self._last_refresh = time.monotonic()
+
+    # ---------- queries ----------
+
+    def contains(self, user_id) -> bool:
+        with self._lock:
+            return self._lookup(user_id) != NONE
+
+    def contains_placed(self, user_id) -> bool:
+        """True if user_id is in the index and already has a parent"""
+        index = self._lookup(user_id)
+        return index != NONE and self._parent[index] != NONE
+
+    def get_parent(self, user_id) -> Optional[Tuple[str, str]]:
+        """Return (parent_id, side) or None for roots/unknown ids"""
+        with self._lock:
+            index = self._lookup(user_id)
+            if index == NONE or self._parent[index] == NONE:
+                return None
+            return self._id_at(self._parent[index]), SIDE_NAMES[self._side[index]]
+
+    def get_children(self, user_id) -> Tuple[Optional[str], Optional[str]]:
+        """Return (left_child_id, right_child_id)"""
+        with self._lock:
+            index = self._lookup(user_id)
+            if index == NONE:
+                return None, None
+            return self._id_at(self._left[index]), self._id_at(self._right[index])
+
+    def get_child(self, user_id, placement: str) -> Optional[str]:
+        left_id, right_id = self.get_children(user_id)
+        return left_id if placement == "LEFT" else right_id
+
+    def extreme_leaf(self, user_id, placement: str) -> Optional[str]:
+        """
+        Follow placement-side children from user_id to the last node
+
+        Returns None if user_id has no child on that side (matches
+        find_deepest_left_position / find_deepest_right_position).
+        """
+        with self._lock:
+            index = self._lookup(user_id)
+            if index == NONE:
+                return None
+            slots = self._left if placement == "LEFT" else self._right
+            current = slots[index]
+            if current == NONE:
+                return None
+            while slots[current] != NONE:
+                current = slots[current]
+            return self._id_at(current)
+
+    def walk(self, user_id, max_depth: Optional[int] = None) -> Iterator[Tuple[str, int, Optional[str]]]:
+        """
+        Pre-order traversal of user_id's subtree (left before right)
+
+        Yields (node_id, depth, leg) where depth is relative to user_id
+        (0 for user_id itself) and leg is the side of user_id the node
+        sits in (None for user_id itself).
+        """
+        with self._lock:
+            start = self._lookup(user_id)
+            if start == NONE:
+                return
+            result: List[Tuple[str, int, Optional[str]]] = []
+            stack = [(start, 0, None)]
+            while stack:
+                index, depth, leg = stack.pop()
+                result.append((self._id_at(index), depth, leg))
+                if max_depth is not None and depth >= max_depth:
+                    continue
+                right = self._right[index]
+                left = self._left[index]
+                if right != NONE:
+                    stack.append((right, depth + 1, leg or "RIGHT"))
+                if left != NONE:
+                    stack.append((left, depth + 1, leg or "LEFT"))
+        # Yield outside the lock so slow consumers don't block writers
+        yield from result
+
+    def subtree_size(self, user_id) -> int:
+        """Number of nodes in user_id's subtree, excluding user_id"""
+        with self._lock:
+            index = self._lookup(user_id)
+            return self._size[index] - 1 if index != NONE else 0
+
+    def leg_counts(self, user_id) -> Tuple[int, int]:
+        """Return (left_leg_size, right_leg_size) for user_id"""
+        with self._lock:
+            index = self._lookup(user_id)
+            if index == NONE:
+                return 0, 0
+            left = self._left[index]
+            right = self._right[index]
+            return (
+                self._size[left] if left != NONE else 0,
+                self._size[right] if right != NONE else 0
+            )
+
+    def export_arrays(self) -> dict:
+        """
+        Copy of the raw node arrays for bulk numeric work (e.g. forecasting).
+        ``keys`` holds 12 raw ObjectId bytes per node; parent/left/right use
+        -1 for none and ``side`` uses the SIDE_* codes.
+        """
+        with self._lock:
+            return {
+                "keys": bytes(self._keys),
+                "parent": array('i', self._parent),
+                "left": array('i', self._left),
+                "right": array('i', self._right),
+                "side": bytes(self._side)
+            }
+
+    def __len__(self) -> int:
+        return len(self._parent) - self._removed
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the index arrays"""
+        return (
+            self._parent.itemsize * len(self._parent) * 4
+            + len(self._side)
+            + len(self._keys)
+            + self._slots.itemsize * len(self._slots)
+        )
+
+    def stats(self) -> dict:
+        nodes = len(self._parent)
+        memory = self.memory_bytes()
+        return {
+            "ready": self.ready,
+            "nodes": len(self),
+            "placed": self._linked,
+            "removed": self._removed,
+            "memoryBytes": memory,
+            "bytesPerNode": round(memory / nodes, 1) if nodes else 0
+        }
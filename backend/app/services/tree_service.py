@@ -0,0 +1,492 @@
+"""
+Tree Service - Materialized ancestor paths for the binary tree
+Each teams document carries an ``ancestors`` list (nearest first) of
+``{"userId": <str>, "side": "LEFT"|"RIGHT"}`` entries, where ``side`` is the
+leg of that ancestor the member sits in. PV distribution and other upward
+updates can then be issued as a single grouped write instead of a walk.
+
+Users also carry ``leftLeafId`` / ``rightLeafId``: the last node reached by
+following only LEFT (or RIGHT) children, i.e. where auto-placement puts the
+next member on that leg. They are advanced on insert (guarded by the
+``leftLeafDepth`` / ``rightLeafDepth`` of the node they point at), cleared
+on delete and lazily recomputed when missing.
+
+Functions take the collections they operate on so they can be shared by
+server.py and the app.services modules without opening a second client.
+"""
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateMany, UpdateOne
+
+
+ANCESTOR_PROJECTION = {"sponsorId": 1, "placement": 1, "ancestors": 1}
+
+
+def ancestor_path_steps(user_id: str):
+    """
+    The ancestor path lookup, independent of the driver
+
+    A generator that yields ``("find", user_id)`` for each team record it
+    needs (send back the record, read with ANCESTOR_PROJECTION, or None) and
+    ``("save", record_id, ancestors)`` when a legacy record's walked path
+    should be persisted; it returns the path. get_ancestor_path drives it on
+    pymongo, TeamRepository.ancestor_path on motor.
+    """
+    team_record = yield ("find", user_id)
+    if not team_record or not team_record.get("sponsorId"):
+        return []
+
+    if "ancestors" in team_record:
+        return team_record["ancestors"]
+
+    ancestors = []
+    visited = set()
+    current = team_record
+
+    while current and current.get("sponsorId"):
+        sponsor_id = current["sponsorId"]
+        if sponsor_id in visited:
+            raise ValueError(f"Cycle detected in teams collection at {sponsor_id}")
+        visited.add(sponsor_id)
+
+        ancestors.append({"userId": sponsor_id, "side": current.get("placement")})
+
+        current = yield ("find", sponsor_id)
+        # Stop early once we reach a node whose path is already materialized
+        if current and "ancestors" in current:
+            ancestors.extend(current["ancestors"])
+            break
+
+    yield ("save", team_record["_id"], ancestors)
+    return ancestors
+
+
+def get_ancestor_path(teams_collection, user_id: str) -> List[dict]:
+    """
+    Get the materialized ancestor path of a member (nearest ancestor first)
+
+    Team records created before paths were materialized are walked once and
+    the result is persisted, so every later call is a single indexed read.
+    Returns an empty list for the root user (no team record).
+    """
+    steps = ancestor_path_steps(user_id)
+    reply = None
+    try:
+        while True:
+            step = steps.send(reply)
+            if step[0] == "find":
+                reply = teams_collection.find_one({"userId": step[1]}, ANCESTOR_PROJECTION)
+            else:
+                teams_collection.update_one({"_id": step[1]}, {"$set": {"ancestors": step[2]}})
+                reply = None
+    except StopIteration as done:
+        return done.value
+
+
+def build_ancestor_path(teams_collection, parent_id: str, placement: str) -> List[dict]:
+    """Build the ancestor path for a new member placed under parent_id on placement side"""
+    return [{"userId": parent_id, "side": placement}] + get_ancestor_path(teams_collection, parent_id)
+
+
+def split_ancestor_ids(ancestors: List[dict]) -> Tuple[List[ObjectId], List[ObjectId]]:
+    """Split an ancestor path into (left_ids, right_ids) as ObjectIds"""
+    left_ids = []
+    right_ids = []
+    for ancestor in ancestors:
+        if ancestor.get("side") == "LEFT":
+            left_ids.append(ObjectId(ancestor["userId"]))
+        elif ancestor.get("side") == "RIGHT":
+            right_ids.append(ObjectId(ancestor["userId"]))
+    return left_ids, right_ids
+
+
+def distribute_pv_to_ancestors(users_collection, ancestors: List[dict], pv_amount: int, updated_at) -> None:
+    """
+    Add pv_amount to every ancestor's leftPV or rightPV in one bulk_write
+
+    Ancestors are grouped by side so the write is at most two update_many
+    operations regardless of tree depth.
+    """
+    left_ids, right_ids = split_ancestor_ids(ancestors)
+
+    operations = []
+    if left_ids:
+        operations.append(UpdateMany(
+            {"_id": {"$in": left_ids}},
+            {"$inc": {"leftPV": pv_amount}, "$set": {"updatedAt": updated_at}}
+        ))
+    if right_ids:
+        operations.append(UpdateMany(
+            {"_id": {"$in": right_ids}},
+            {"$inc": {"rightPV": pv_amount}, "$set": {"updatedAt": updated_at}}
+        ))
+
+    if operations:
+        users_collection.bulk_write(operations, ordered=False)
+
+
+def truncate_ancestor_paths(teams_collection, user_id: str) -> int:
+    """
+    Cut user_id (and everything above it) out of its descendants' paths
+
+    Used when a member is deleted: their downline is detached from the
+    tree, so PV from it must no longer flow past the removed node.
+    Returns the number of team records updated.
+    """
+    result = teams_collection.update_many(
+        {"ancestors.userId": user_id},
+        [{"$set": {
+            "ancestors": {
+                "$slice": ["$ancestors", {"$indexOfArray": ["$ancestors.userId", user_id]}]
+            }
+        }}]
+    )
+    return result.modified_count
+
+
+def backfill_ancestor_paths(teams_collection, batch_size: int = 1000) -> int:
+    """
+    Materialize the ancestor path on every team record
+
+    Loads all edges once, computes paths top-down and writes them back in
+    chunked bulk writes. Safe to re-run. Returns the number of records written.
+    """
+    edges: Dict[str, dict] = {}
+    for team in teams_collection.find({}, {"userId": 1, "sponsorId": 1, "placement": 1}):
+        edges[team["userId"]] = team
+
+    paths: Dict[str, List[dict]] = {}
+
+    def resolve(user_id: str) -> List[dict]:
+        # Iterative so very deep legs do not hit the recursion limit
+        chain = []
+        seen = set()
+        current = user_id
+        while current in edges and current not in paths:
+            if current in seen:
+                raise ValueError(f"Cycle detected in teams collection at {current}")
+            seen.add(current)
+            chain.append(current)
+            current = edges[current].get("sponsorId")
+
+        above = paths.get(current, [])
+        for member_id in reversed(chain):
+            team = edges[member_id]
+            if team.get("sponsorId"):
+                above = [{"userId": team["sponsorId"], "side": team.get("placement")}] + above
+            else:
+                above = []
+            paths[member_id] = above
+        return paths[user_id]
+
+    written = 0
+    operations = []
+    for user_id, team in edges.items():
+        operations.append(UpdateOne({"_id": team["_id"]}, {"$set": {"ancestors": resolve(user_id)}}))
+        if len(operations) >= batch_size:
+            teams_collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+
+    if operations:
+        teams_collection.bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    return written
+
+
+LEAF_POINTER_FIELDS = {"LEFT": "leftLeafId", "RIGHT": "rightLeafId"}
+
+# Absolute depth of the node a pointer refers to. Pointers only ever move
+# deeper, which keeps concurrent inserts from rolling a pointer back.
+LEAF_DEPTH_FIELDS = {"LEFT": "leftLeafDepth", "RIGHT": "rightLeafDepth"}
+
+
+def _walk_outer_leg(teams_collection, sponsor_id: str, placement: str) -> Tuple[Optional[str], int]:
+    leaf = None
+    steps = 0
+    visited = {sponsor_id}
+    current_id = sponsor_id
+    while True:
+        child = teams_collection.find_one(
+            {"sponsorId": current_id, "placement": placement},
+            {"userId": 1}
+        )
+        if not child:
+            return leaf, steps
+        current_id = child["userId"]
+        if current_id in visited:
+            raise ValueError(f"Cycle detected in {placement} leg at {current_id}")
+        visited.add(current_id)
+        leaf = current_id
+        steps += 1
+
+
+def walk_outer_leg(teams_collection, sponsor_id: str, placement: str) -> Optional[str]:
+    """
+    Follow placement-side children from sponsor_id down to the last node
+
+    Returns None if sponsor_id has no child on that side. The walk is not
+    depth-capped; a cycle in the data raises ValueError instead of
+    returning a filled node.
+    """
+    return _walk_outer_leg(teams_collection, sponsor_id, placement)[0]
+
+
+def find_extreme_leaf(users_collection, teams_collection, sponsor_id: str, placement: str) -> Optional[str]:
+    """
+    Get the last node on sponsor_id's outer placement leg (None if the leg is empty)
+
+    Reads the maintained pointer on the sponsor's user document; members
+    without one are walked once and the result is stored.
+    """
+    field = LEAF_POINTER_FIELDS[placement]
+    depth_field = LEAF_DEPTH_FIELDS[placement]
+    sponsor = users_collection.find_one({"_id": ObjectId(sponsor_id)}, {field: 1})
+    if sponsor and field in sponsor:
+        return sponsor[field]
+
+    leaf, steps = _walk_outer_leg(teams_collection, sponsor_id, placement)
+    if sponsor:
+        sponsor_depth = len(get_ancestor_path(teams_collection, sponsor_id))
+        # Don't overwrite a pointer set by a concurrent insert
+        users_collection.update_one(
+            {"_id": sponsor["_id"], field: {"$exists": False}},
+            {"$set": {field: leaf, depth_field: sponsor_depth + steps}}
+        )
+    return leaf
+
+
+def advance_extreme_leaf_pointers(users_collection, ancestors: List[dict], new_user_id: str) -> None:
+    """
+    Point the outer-leg pointers at a newly placed member
+
+    ancestors is the new member's path. Every ancestor reached through an
+    unbroken run of same-side edges now has the new member as its leaf,
+    unless a concurrent insert already moved the pointer deeper.
+    """
+    if not ancestors:
+        return
+    side = ancestors[0]["side"]
+    field = LEAF_POINTER_FIELDS.get(side)
+    if not field:
+        return
+    depth_field = LEAF_DEPTH_FIELDS[side]
+    depth = len(ancestors)
+
+    ids = []
+    for ancestor in ancestors:
+        if ancestor.get("side") != side:
+            break
+        ids.append(ObjectId(ancestor["userId"]))
+
+    users_collection.update_many(
+        {
+            "_id": {"$in": ids},
+            "$or": [{depth_field: {"$lt": depth}}, {depth_field: {"$exists": False}}]
+        },
+        {"$set": {field: new_user_id, depth_field: depth}}
+    )
+
+
+def clear_extreme_leaf_pointers(users_collection, ancestors: List[dict]) -> None:
+    """Drop the leaf pointers of a removed member's ancestors so they are recomputed"""
+    if not ancestors:
+        return
+    users_collection.update_many(
+        {"_id": {"$in": [ObjectId(a["userId"]) for a in ancestors]}},
+        {"$unset": {"leftLeafId": "", "rightLeafId": "", "leftLeafDepth": "", "rightLeafDepth": ""}}
+    )
+
+
+def subtree_edges_pipeline(teams_collection_name: str, root_id: str, max_depth: int) -> List[dict]:
+    """Aggregation for get_subtree_edges (max_depth >= 2); rows go through collect_subtree_edges"""
+    return [
+        {"$match": {"sponsorId": root_id}},
+        {"$graphLookup": {
+            "from": teams_collection_name,
+            "startWith": "$userId",
+            "connectFromField": "userId",
+            "connectToField": "sponsorId",
+            "as": "descendant",
+            "maxDepth": max_depth - 2,
+            "depthField": "hops"
+        }},
+        {"$unwind": {"path": "$descendant", "preserveNullAndEmptyArrays": True}},
+        {"$project": {
+            "_id": 0,
+            "child": {"userId": "$userId", "sponsorId": "$sponsorId", "placement": "$placement"},
+            "descendant": {
+                "userId": "$descendant.userId",
+                "sponsorId": "$descendant.sponsorId",
+                "placement": "$descendant.placement",
+                "hops": "$descendant.hops"
+            }
+        }}
+    ]
+
+
+def collect_subtree_edges(rows) -> List[dict]:
+    """Flatten subtree_edges_pipeline rows into one edge per member"""
+    edges = {}
+    for row in rows:
+        child = row["child"]
+        edges.setdefault(child["userId"], dict(child, depth=1))
+        descendant = row.get("descendant")
+        if descendant and descendant.get("userId"):
+            edges.setdefault(descendant["userId"], {
+                "userId": descendant["userId"],
+                "sponsorId": descendant["sponsorId"],
+                "placement": descendant["placement"],
+                "depth": int(descendant["hops"]) + 2
+            })
+    return list(edges.values())
+
+
+SUBTREE_EDGE_PROJECTION = {"_id": 0, "userId": 1, "sponsorId": 1, "placement": 1}
+
+
+def get_subtree_edges(teams_collection, root_id: str, max_depth: int) -> List[dict]:
+    """
+    Fetch every team edge below root_id down to max_depth levels in one query
+
+    Returns slim ``{"userId", "sponsorId", "placement", "depth"}`` records,
+    depth being relative to root_id (direct children are depth 1). The
+    $unwind directly after $graphLookup is coalesced by the server, so large
+    downlines don't hit the 16MB document limit.
+    """
+    if max_depth < 1:
+        return []
+
+    if max_depth == 1:
+        return [
+            dict(edge, depth=1)
+            for edge in teams_collection.find({"sponsorId": root_id}, SUBTREE_EDGE_PROJECTION)
+        ]
+
+    return collect_subtree_edges(
+        teams_collection.aggregate(subtree_edges_pipeline(teams_collection.name, root_id, max_depth))
+    )
+
+
+# Per-user leg sizes: members (and active members) in the left/right subtree
+LEG_COUNTER_FIELDS = ("leftCount", "rightCount", "leftActiveCount", "rightActiveCount")
+
+
+def adjust_leg_counters(users_collection, ancestors: List[dict], member_delta: int, active_delta: int) -> None:
+    """
+    Add member_delta / active_delta to the leg counters of every ancestor
+
+    Same grouping as PV distribution: at most two update_many operations.
+    """
+    if not member_delta and not active_delta:
+        return
+    left_ids, right_ids = split_ancestor_ids(ancestors)
+
+    operations = []
+    if left_ids:
+        operations.append(UpdateMany(
+            {"_id": {"$in": left_ids}},
+            {"$inc": {"leftCount": member_delta, "leftActiveCount": active_delta}}
+        ))
+    if right_ids:
+        operations.append(UpdateMany(
+            {"_id": {"$in": right_ids}},
+            {"$inc": {"rightCount": member_delta, "rightActiveCount": active_delta}}
+        ))
+
+    if operations:
+        users_collection.bulk_write(operations, ordered=False)
+
+
+def rebuild_leg_counters(users_collection, teams_collection, batch_size: int = 1000) -> int:
+    """
+    Recompute every user's leg counters from scratch in one O(N) pass
+
+    Children are processed before parents (reverse BFS order), each node
+    adding its subtree totals to its parent's leg. Only documents whose
+    counters changed are written. Returns the number of users updated.
+    """
+    users = {}
+    for user in users_collection.find({}, {"isActive": 1, **{f: 1 for f in LEG_COUNTER_FIELDS}}):
+        users[str(user["_id"])] = user
+
+    children: Dict[str, List[Tuple[str, str]]] = {}
+    has_parent = set()
+    for team in teams_collection.find({}, {"userId": 1, "sponsorId": 1, "placement": 1}):
+        if team["userId"] in users and team.get("sponsorId") in users:
+            children.setdefault(team["sponsorId"], []).append((team["userId"], team.get("placement")))
+            has_parent.add(team["userId"])
+
+    order = [user_id for user_id in users if user_id not in has_parent]
+    position = 0
+    while position < len(order):
+        for child_id, _ in children.get(order[position], []):
+            order.append(child_id)
+        position += 1
+
+    counters = {user_id: dict.fromkeys(LEG_COUNTER_FIELDS, 0) for user_id in users}
+    subtree_total = {}
+    subtree_active = {}
+    for user_id in reversed(order):
+        node = counters[user_id]
+        for child_id, placement in children.get(user_id, []):
+            prefix = "left" if placement == "LEFT" else "right"
+            node[f"{prefix}Count"] += subtree_total[child_id]
+            node[f"{prefix}ActiveCount"] += subtree_active[child_id]
+        subtree_total[user_id] = 1 + node["leftCount"] + node["rightCount"]
+        subtree_active[user_id] = (
+            (1 if users[user_id].get("isActive") else 0)
+            + node["leftActiveCount"] + node["rightActiveCount"]
+        )
+
+    written = 0
+    operations = []
+    for user_id, node in counters.items():
+        if all(users[user_id].get(field) == value for field, value in node.items()):
+            continue
+        operations.append(UpdateOne({"_id": ObjectId(user_id)}, {"$set": node}))
+        if len(operations) >= batch_size:
+            users_collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+
+    if operations:
+        users_collection.bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    return written
+
+
+def compute_downline_counts(edges) -> Dict[str, List[int]]:
+    """
+    Direct and total downline counts for every node in one post-order pass
+
+    edges is an iterable of team records (userId, sponsorId). Returns
+    ``{user_id: [direct_count, total_count]}`` for every id that appears
+    as a member or sponsor.
+    """
+    children: Dict[str, List[str]] = {}
+    has_parent = set()
+    nodes = set()
+    for edge in edges:
+        user_id = edge["userId"]
+        sponsor_id = edge.get("sponsorId")
+        nodes.add(user_id)
+        if sponsor_id:
+            nodes.add(sponsor_id)
+            children.setdefault(sponsor_id, []).append(user_id)
+            has_parent.add(user_id)
+
+    order = [node for node in nodes if node not in has_parent]
+    position = 0
+    while position < len(order):
+        order.extend(children.get(order[position], ()))
+        position += 1
+
+    counts = {node: [0, 0] for node in nodes}
+    for node in reversed(order):
+        direct = children.get(node, ())
+        counts[node][0] = len(direct)
+        counts[node][1] = sum(counts[child][1] + 1 for child in direct)
+    return counts
@@ -0,0 +1,206 @@
+"""
+User Stats - Materialized per-user dashboard figures
+One document per user in ``user_stats`` replaces the transaction and
+withdrawal scans the dashboard used to run on every call:
+
+    {userId,
+     matchingIncome,                    MATCHING_INCOME / MATCHING_BONUS credits
+     totalIncome,                       every positive credit
+     earningsDate, todaysEarnings,      credits on that IST day
+     pendingWithdrawals,                amount held by PENDING withdrawals
+     pendingWithdrawalCount,
+     directReferrals,                   members who joined with this user's referral ID
+     lastMatchingRunDate, updatedAt}
+
+The documents are kept in step incrementally by the code paths that credit
+wallets (EOD matching, plan activation revenue), create or process
+withdrawals and place new members. todaysEarnings rolls over on the first
+credit of a new IST day; readers treat a stale earningsDate as 0.
+
+rebuild_user_stats recomputes every document from users, transactions and
+withdrawals with server-side aggregations ($merge), for the first deploy or
+after drift. Run it when traffic is low: increments that land while a rebuild
+is between stages can be overwritten.
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+import pytz
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+IST = pytz.timezone('Asia/Kolkata')
+
+MATCHING_TYPES = ("MATCHING_INCOME", "MATCHING_BONUS")
+
+STAT_FIELDS = {
+    "matchingIncome": 0,
+    "totalIncome": 0,
+    "earningsDate": None,
+    "todaysEarnings": 0,
+    "pendingWithdrawals": 0,
+    "pendingWithdrawalCount": 0,
+    "directReferrals": 0
+}
+
+
+def ist_day(now: datetime) -> str:
+    """IST calendar date of ``now`` as YYYY-MM-DD"""
+    if now.tzinfo is not None:
+        now = now.astimezone(IST)
+    return now.strftime("%Y-%m-%d")
+
+
+def ensure_user_stats_indexes(user_stats_collection):
+    user_stats_collection.create_index([("userId", ASCENDING)], unique=True)
+
+
+def _credit_pipeline(amount, transaction_type: str, now: datetime, extra_set: Optional[dict] = None) -> list:
+    day = ist_day(now)
+    matching = amount if transaction_type in MATCHING_TYPES else 0
+    return [{"$set": {
+        "todaysEarnings": {"$cond": [
+            {"$eq": ["$earningsDate", day]},
+            {"$add": [{"$ifNull": ["$todaysEarnings", 0]}, amount]},
+            amount
+        ]},
+        "earningsDate": day,
+        "matchingIncome": {"$add": [{"$ifNull": ["$matchingIncome", 0]}, matching]},
+        "totalIncome": {"$add": [{"$ifNull": ["$totalIncome", 0]}, amount]},
+        "updatedAt": now,
+        **(extra_set or {})
+    }}]
+
+
+def record_credit(user_stats_collection, user_id: str, amount, transaction_type: str, now: datetime):
+    """A positive wallet credit (income or revenue) for user_id"""
+    if not user_id or not amount or amount <= 0:
+        return
+    user_stats_collection.update_one(
+        {"userId": user_id}, _credit_pipeline(amount, transaction_type, now), upsert=True
+    )
+
+
+def record_credits(user_stats_collection, credits: Iterable[Tuple[str, float]], transaction_type: str,
+                   now: datetime, run_date: Optional[str] = None):
+    """
+    Bulk form of record_credit for the EOD engine. With ``run_date`` each
+    user is credited at most once per run date (the same guard the wallet
+    update uses), so a resumed run does not count income twice.
+    """
+    guard = {"lastMatchingRunDate": {"$ne": run_date}} if run_date else {}
+    mark = {"lastMatchingRunDate": run_date} if run_date else {}
+    operations = [
+        UpdateOne({"userId": user_id, **guard}, _credit_pipeline(amount, transaction_type, now, mark), upsert=True)
+        for user_id, amount in credits
+        if amount > 0
+    ]
+    if not operations:
+        return
+    try:
+        user_stats_collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Upsert hit the unique userId index: already credited for this run date
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+
+def record_withdrawal(user_stats_collection, user_id: str, amount, now: datetime, pending: bool = True):
+    """A withdrawal was requested (pending=True) or approved / rejected (pending=False)"""
+    sign = 1 if pending else -1
+    user_stats_collection.update_one(
+        {"userId": user_id},
+        {
+            "$inc": {"pendingWithdrawals": sign * amount, "pendingWithdrawalCount": sign},
+            "$set": {"updatedAt": now}
+        },
+        upsert=True
+    )
+
+
+def record_referral(user_stats_collection, sponsor_user_id: str, now: datetime, delta: int = 1):
+    """A member joined (or was removed) under sponsor_user_id's referral ID"""
+    if not sponsor_user_id:
+        return
+    user_stats_collection.update_one(
+        {"userId": sponsor_user_id},
+        {"$inc": {"directReferrals": delta}, "$set": {"updatedAt": now}},
+        upsert=True
+    )
+
+
+def user_stats_view(doc: Optional[dict], now: datetime) -> dict:
+    """A user_stats document with defaults; todaysEarnings is 0 unless credited today"""
+    doc = doc or {}
+    stats = {field: doc.get(field, default) for field, default in STAT_FIELDS.items()}
+    if stats["earningsDate"] != ist_day(now):
+        stats["todaysEarnings"] = 0
+    return stats
+
+
+def get_user_stats(user_stats_collection, user_id: str, now: datetime) -> dict:
+    """Stats for one user (see user_stats_view)"""
+    return user_stats_view(user_stats_collection.find_one({"userId": user_id}, {"_id": 0}), now)
+
+
+def rebuild_user_stats(user_stats_collection, users_collection, transactions_collection,
+                       withdrawals_collection, now: datetime) -> dict:
+    """
+    Recompute every user_stats document from the source collections:
+    reset one document per user, then merge in transaction totals,
+    pending withdrawals and direct referral counts.
+    """
+    target = user_stats_collection.name
+    day = ist_day(now)
+    local_now = now.astimezone(IST) if now.tzinfo is not None else IST.localize(now)
+    start_of_day = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_utc = start_of_day.astimezone(pytz.utc).replace(tzinfo=None)
+    end_utc = (start_of_day + timedelta(days=1)).astimezone(pytz.utc).replace(tzinfo=None)
+
+    def merge_into(when_not_matched: str):
+        return {"$merge": {
+            "into": target, "on": "userId", "whenMatched": "merge", "whenNotMatched": when_not_matched
+        }}
+
+    # 1. Zeroed document per user
+    users_collection.aggregate([
+        {"$project": {"_id": 0, "userId": {"$toString": "$_id"}}},
+        {"$addFields": {**STAT_FIELDS, "earningsDate": day, "rebuiltAt": {"$literal": now}, "updatedAt": {"$literal": now}}},
+        merge_into("insert")
+    ], allowDiskUse=True)
+
+    # 2. Income totals from positive transactions
+    transactions_collection.aggregate([
+        {"$match": {"amount": {"$gt": 0}, "userId": {"$type": "string"}}},
+        {"$group": {
+            "_id": "$userId",
+            "totalIncome": {"$sum": "$amount"},
+            "matchingIncome": {"$sum": {"$cond": [{"$in": ["$type", list(MATCHING_TYPES)]}, "$amount", 0]}},
+            "todaysEarnings": {"$sum": {"$cond": [
+                {"$and": [{"$gte": ["$createdAt", start_utc]}, {"$lt": ["$createdAt", end_utc]}]}, "$amount", 0
+            ]}}
+        }},
+        {"$project": {"_id": 0, "userId": "$_id", "totalIncome": 1, "matchingIncome": 1, "todaysEarnings": 1}},
+        merge_into("discard")
+    ], allowDiskUse=True)
+
+    # 3. Pending withdrawals
+    withdrawals_collection.aggregate([
+        {"$match": {"status": "PENDING"}},
+        {"$group": {"_id": "$userId", "pendingWithdrawals": {"$sum": "$amount"}, "pendingWithdrawalCount": {"$sum": 1}}},
+        {"$project": {"_id": 0, "userId": "$_id", "pendingWithdrawals": 1, "pendingWithdrawalCount": 1}},
+        merge_into("discard")
+    ], allowDiskUse=True)
+
+    # 4. Direct referrals (users.sponsorId holds the sponsor's referral ID)
+    users_collection.aggregate([
+        {"$match": {"sponsorId": {"$type": "string", "$ne": ""}}},
+        {"$group": {"_id": "$sponsorId", "directReferrals": {"$sum": 1}}},
+        {"$lookup": {"from": users_collection.name, "localField": "_id", "foreignField": "referralId", "as": "sponsor"}},
+        {"$unwind": "$sponsor"},
+        {"$project": {"_id": 0, "userId": {"$toString": "$sponsor._id"}, "directReferrals": 1}},
+        merge_into("discard")
+    ], allowDiskUse=True)
+
+    # Users that no longer exist
+    removed = user_stats_collection.delete_many({"rebuiltAt": {"$ne": now}}).deleted_count
+    return {"users": user_stats_collection.count_documents({}), "removed": removed, "rebuiltAt": now}
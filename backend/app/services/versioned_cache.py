@@ -0,0 +1,120 @@
+"""
+Versioned Cache - Base for small per-worker copies of admin-edited data
+(settings, plans, ranks) that are read far more often than they change.
+
+Freshness:
+    * The copy is reloaded at most every ``ttl`` seconds.
+    * Writers call invalidate(), which drops the local copy and bumps a
+      version counter in ``cache_versions``:
+          {_id: <version_id>, version: <int>, updatedAt: <utc datetime>}
+      Other workers read that one small document at most every
+      ``version_check_interval`` seconds and reload when it changed, so a
+      change is visible everywhere within that interval.
+
+If MongoDB is unreachable the last loaded copy keeps being served (or the
+subclass's empty value when nothing was loaded yet).
+
+Subclasses set ``version_id`` and implement ``_fetch()``, which returns the
+value to cache (any structure, built once per reload).
+"""
+import threading
+import time
+from datetime import datetime
+
+
+class VersionedCache:
+    """TTL cache with cross-worker invalidation through cache_versions"""
+
+    version_id: str = ""
+
+    def __init__(self, versions_collection, ttl: float = 60.0, version_check_interval: float = 2.0):
+        self.versions = versions_collection
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._version_checked_at = 0.0
+        self.hits = 0
+        self.loads = 0
+
+    def _fetch(self):
+        raise NotImplementedError
+
+    def _empty(self):
+        """Value served when nothing could be loaded"""
+        return None
+
+    def _read_version(self):
+        doc = self.versions.find_one({"_id": self.version_id}, {"version": 1})
+        return doc.get("version", 0) if doc else 0
+
+    def _load(self, now: float):
+        version = self._read_version()
+        self._value = self._fetch()
+        self._version = version
+        self._loaded_at = self._version_checked_at = now
+        self.loads += 1
+
+    def current(self):
+        """The cached value, reloaded when expired or invalidated"""
+        now = time.monotonic()
+        with self._lock:
+            try:
+                if self._value is None or now - self._loaded_at >= self.ttl:
+                    self._load(now)
+                elif now - self._version_checked_at >= self.version_check_interval:
+                    self._version_checked_at = now
+                    if self._read_version() != self._version:
+                        self._load(now)
+                    else:
+                        self.hits += 1
+                else:
+                    self.hits += 1
+            except Exception as e:
+                print(f"⚠️ {type(self).__name__} reload failed, serving cached copy: {e}")
+                # Retry on the next check interval rather than on every call
+                self._loaded_at = self._version_checked_at = now
+                if self._value is None:
+                    return self._empty()
+            return self._value
+
+    def sync(self):
+        """
+        Check the version counter now (ignoring version_check_interval) and
+        reload if it moved. Returns the version of the copy now held.
+        """
+        now = time.monotonic()
+        with self._lock:
+            try:
+                version = self._read_version()
+                self._version_checked_at = now
+                if self._value is None or version != self._version:
+                    self._load(now)
+            except Exception as e:
+                print(f"⚠️ {type(self).__name__} sync failed, serving cached copy: {e}")
+            return self._version
+
+    def loaded_version(self):
+        """Version of the copy currently served (after the usual freshness checks)"""
+        self.current()
+        return self._version
+
+    def invalidate(self):
+        """Drop this worker's copy and tell the other workers to reload"""
+        with self._lock:
+            self._value = None
+        self.versions.update_one(
+            {"_id": self.version_id},
+            {"$inc": {"version": 1}, "$set": {"updatedAt": datetime.utcnow()}},
+            upsert=True
+        )
+
+    def stats(self) -> dict:
+        return {
+            "version": self._version,
+            "loads": self.loads,
+            "hits": self.hits,
+            "ageSeconds": round(time.monotonic() - self._loaded_at, 1) if self._value is not None else None
+        }
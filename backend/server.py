@@ -1,81 +1,92 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Body, Header
+from fastapi import FastAPI, HTTPException, Depends, status, Body, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
 import os
+import asyncio
+import threading
+import time
 from dotenv import load_dotenv
-import random
-import string
 import re
+import tempfile
 import pytz
 from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
 import requests
+from app.services.tree_service import (
+    get_ancestor_path,
+    build_ancestor_path,
+    distribute_pv_to_ancestors,
+    truncate_ancestor_paths,
+    find_extreme_leaf,
+    advance_extreme_leaf_pointers,
+    clear_extreme_leaf_pointers,
+    adjust_leg_counters,
+    rebuild_leg_counters,
+    compute_downline_counts,
+)
+from app.services.tree_index import BinaryTreeIndex
+from app.services.eod_engine import (
+    run_matching,
+    run_date_for,
+    run_sharded_matching,
+    ensure_matching_indexes,
+    load_snapshot,
+    simulate_matching,
+)
+from app.services.eod_scheduler import EODScheduler
+from app.services.payout_forecast import forecast_payouts
+from app.services.settings_cache import SettingsCache
+from app.services.plan_registry import PlanRegistry
+from app.services.rank_table import RankTable
+from app.services.principal_cache import PrincipalCache
+from app.services.response_cache import ResponseCache
+from app.services.referral_ids import ReferralIdAllocator
+from app.services.password_hasher import PasswordHasher, HasherBusy
+from app.services.report_files import REPORT_FORMATS
+from app.services.report_jobs import ReportJobQueue, STATUS_DONE, job_view
+from app.repositories import Repositories
+from app.services.user_stats import (
+    ensure_user_stats_indexes,
+    rebuild_user_stats,
+    record_credit,
+    record_referral,
+    record_withdrawal,
+)
+from app.services.daily_stats import (
+    get_daily_stats,
+    lifetime_totals,
+    rebuild_daily_stats,
+    record_payout,
+    record_plan_activation,
+    record_registration,
+    record_topup,
+    record_transactions,
+)
+from app.services.eod_pipeline import (
+    EODPipeline,
+    reset_carry_forward,
+    rollup_daily_stats,
+    snapshot_pv,
+    ensure_pipeline_indexes,
+)
 
 
 # Auto-placement functions (moved from service to avoid import issues)
 
 def find_deepest_left_position(sponsor_id: str):
     """Find the deepest LEFT-most available position in sponsor's LEFT leg"""
-    left_child = teams_collection.find_one({
-        "sponsorId": sponsor_id,
-        "placement": "LEFT"
-    })
-    
-    if not left_child:
-        return None
-    
-    current_user_id = left_child["userId"]
-    max_depth = 100
-    for _ in range(max_depth):
-        left_child = teams_collection.find_one({
-            "sponsorId": current_user_id,
-            "placement": "LEFT"
-        })
-        
-        if not left_child:
-            return current_user_id
-        
-        current_user_id = left_child["userId"]
-    
-    return current_user_id
+    return find_extreme_leaf(users_collection, teams_collection, sponsor_id, "LEFT")
 
 def find_deepest_right_position(sponsor_id: str):
     """Find the deepest RIGHT-most available position in sponsor's RIGHT leg"""
-    right_child = teams_collection.find_one({
-        "sponsorId": sponsor_id,
-        "placement": "RIGHT"
-    })
-    
-    if not right_child:
-        return None
-    
-    current_user_id = right_child["userId"]
-    max_depth = 100
-    for _ in range(max_depth):
-        right_child = teams_collection.find_one({
-            "sponsorId": current_user_id,
-            "placement": "RIGHT"
-        })
-        
-        if not right_child:
-            return current_user_id
-        
-        current_user_id = right_child["userId"]
-    
-    return current_user_id
+    return find_extreme_leaf(users_collection, teams_collection, sponsor_id, "RIGHT")
 
 def get_auto_placement_position(sponsor_id: str, preferred_placement: str):
     """Get the actual placement position for a new user"""
@@ -94,6 +105,93 @@ def get_auto_placement_position(sponsor_id: str, preferred_placement: str):
     else:
         return sponsor_id, "LEFT"
 
+# A registration that loses a slot race moves to the next slot on the same leg
+PLACEMENT_RETRY_LIMIT = 10
+
+def reserve_placement_slot(user_id: str, sponsor_id: str, placement: str):
+    """
+    Insert the team record for a new user, retrying on slot conflicts
+    The unique (sponsorId, placement) index makes the insert the reservation.
+    Returns (actual_sponsor_id, placement, ancestors) or None if every retry lost.
+    """
+    for _ in range(PLACEMENT_RETRY_LIMIT):
+        ancestors = build_ancestor_path(teams_collection, sponsor_id, placement)
+        try:
+            teams_collection.insert_one({
+                "userId": user_id,
+                "sponsorId": sponsor_id,  # This is the actual sponsor after auto-placement
+                "placement": placement,    # This is the actual placement side
+                "ancestors": ancestors,
+                "level": 1,
+                "createdAt": get_ist_now()
+            })
+            return sponsor_id, placement, ancestors
+        except DuplicateKeyError:
+            # Slot taken by a concurrent registration: go below the member who took it
+            occupant = teams_collection.find_one({"sponsorId": sponsor_id, "placement": placement}, {"userId": 1})
+            if not occupant:
+                continue
+            sponsor_id = find_extreme_leaf(users_collection, teams_collection, occupant["userId"], placement) or occupant["userId"]
+    return None
+
+# State of the unique (sponsorId, placement) index. reserve_placement_slot is
+# only safe with it, so registrations that need a slot are refused (503)
+# while it is missing; creating it is retried every PLACEMENT_INDEX_RETRY_SECONDS
+# so the API recovers once the duplicate slots are repaired.
+PLACEMENT_INDEX_RETRY_SECONDS = 60
+placement_index = {"ready": False, "error": None, "duplicateSlots": [], "checkedAt": 0.0}
+
+def ensure_placement_index() -> bool:
+    """Create the unique slot index; on failure record the duplicate slots that block it"""
+    placement_index["checkedAt"] = time.monotonic()
+    try:
+        teams_collection.create_index(
+            [("sponsorId", ASCENDING), ("placement", ASCENDING)],
+            unique=True,
+            name="sponsorId_1_placement_1"
+        )
+        placement_index.update(ready=True, error=None, duplicateSlots=[])
+    except Exception as e:
+        duplicates = teams_collection.aggregate([
+            {"$group": {
+                "_id": {"sponsorId": "$sponsorId", "placement": "$placement"},
+                "count": {"$sum": 1},
+                "userIds": {"$push": "$userId"}
+            }},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": 50}
+        ])
+        placement_index.update(ready=False, error=str(e), duplicateSlots=[
+            {"sponsorId": row["_id"].get("sponsorId"), "placement": row["_id"].get("placement"),
+             "userIds": [str(user_id) for user_id in row["userIds"]]}
+            for row in duplicates
+        ])
+    return placement_index["ready"]
+
+def placement_available() -> bool:
+    if placement_index["ready"]:
+        return True
+    if time.monotonic() - placement_index["checkedAt"] >= PLACEMENT_INDEX_RETRY_SECONDS:
+        return ensure_placement_index()
+    return False
+
+def place_new_member(user_id: str, sponsor_user_id: str, sponsor_id: str, placement: str) -> bool:
+    """
+    Put a newly registered member into the tree: reserve the slot, update the
+    tree index, extreme-leaf pointers and leg counters, and count the direct
+    referral for the sponsor. Blocking; registration runs it in a thread.
+    Returns False if the slot could not be reserved.
+    """
+    reserved = reserve_placement_slot(user_id, sponsor_id, placement)
+    if not reserved:
+        return False
+    actual_sponsor_id, actual_placement, ancestors = reserved
+    tree_index.add(user_id, actual_sponsor_id, actual_placement)
+    advance_extreme_leaf_pointers(users_collection, ancestors, user_id)
+    adjust_leg_counters(users_collection, ancestors, 1, 0)
+    record_referral(user_stats_collection, sponsor_user_id, get_ist_now())
+    return True
+
 def get_placement_info_for_display(sponsor_id: str, preferred_placement: str):
     """Get human-readable placement information for UI display"""
     original_sponsor = users_collection.find_one({"_id": ObjectId(sponsor_id)})
@@ -149,6 +247,11 @@ MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "mlm_vsv_unite")
 client = MongoClient(MONGO_URL)
 db = client[MONGO_DB_NAME]
 
+# Non-blocking data access for request handlers; pymongo above stays for
+# background jobs, reports and code run in worker threads (see app/repositories)
+async_client = AsyncIOMotorClient(MONGO_URL)
+repos = Repositories(async_client[MONGO_DB_NAME])
+
 # Collections
 users_collection = db["users"]
 plans_collection = db["plans"]
@@ -163,28 +266,93 @@ ranks_collection = db["ranks"]
 kyc_submissions_collection = db["kyc_submissions"]
 tutorials_collection = db["tutorials"]
 playlists_collection = db["playlists"]
+eod_runs_collection = db["eod_runs"]
+scheduler_leases_collection = db["scheduler_leases"]
+daily_stats_collection = db["daily_stats"]
+pv_snapshots_collection = db["pv_snapshots"]
+cache_versions_collection = db["cache_versions"]
+user_stats_collection = db["user_stats"]
+counters_collection = db["counters"]
+
+# In-process binary tree structure, loaded at startup and kept in sync on
+# register/delete (see app/services/tree_index.py)
+tree_index = BinaryTreeIndex()
 
 # JWT Configuration
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", 10080))
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing: bcrypt runs in a bounded thread pool, never on the event
+# loop; BCRYPT_ROUNDS changes are applied on login (see app/services/password_hasher.py)
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv("BCRYPT_ROUNDS", 12)),
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", 2)),
+    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", 100))
+)
 
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please try again")
+
+# Settings are served from memory; PUT /api/settings/* invalidates every
+# worker's copy through cache_versions (see app/services/settings_cache.py)
+settings_cache = SettingsCache(
+    settings_collection,
+    cache_versions_collection,
+    ttl=float(os.getenv("SETTINGS_CACHE_TTL", 60))
+)
+
+# Plan catalog indexed by id and name; create/update/delete plan invalidate it
+plan_registry = PlanRegistry(plans_collection, cache_versions_collection)
+
+# Rank thresholds; save_ranks/delete_rank invalidate it
+rank_table = RankTable(ranks_collection, cache_versions_collection)
+
+# Slim auth principals for get_current_user; invalidated on status, role,
+# KYC or name changes (see app/services/principal_cache.py)
+principal_cache = PrincipalCache(
+    users_collection,
+    cache_versions_collection,
+    db["principal_invalidations"],
+    max_entries=int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", 30)),
+    async_users=repos.users.collection,
+    async_versions=repos.cache_versions.collection,
+    async_invalidations=repos.db["principal_invalidations"]
+)
+
+# Serialized bodies + ETags for read endpoints that only change on admin
+# edits; groups: "plans", "settings", "tutorials"
+response_cache = ResponseCache(
+    cache_versions_collection,
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", 60))
+)
+
+# Referral IDs from blocks of the counters sequence; no uniqueness probe
+# needed (see app/services/referral_ids.py)
+referral_ids = ReferralIdAllocator(
+    counters_collection,
+    block_size=int(os.getenv("REFERRAL_ID_BLOCK_SIZE", 100)),
+    async_counters=repos.db["counters"]
+)
+
+# Excel/PDF exports: rendered in a process pool; large ones become report
+# jobs that are polled and downloaded (see app/services/report_jobs.py)
+report_jobs = ReportJobQueue(
+    db["report_jobs"],
+    os.getenv("REPORT_JOBS_DIR", os.path.join(tempfile.gettempdir(), "vsv-report-jobs")),
+    max_workers=int(os.getenv("REPORT_WORKERS", 2)),
+    ttl=float(os.getenv("REPORT_JOB_TTL", 3600))
+)
+REPORT_SYNC_MAX_ROWS = int(os.getenv("REPORT_SYNC_MAX_ROWS", 2000))
 
 def get_system_time_offset():
     """Get system time offset from settings (in minutes)"""
-    try:
-        settings = settings_collection.find_one({})
-        if settings and settings.get("systemTimeOffset"):
-            return int(settings.get("systemTimeOffset", 0))
-    except:
-        pass
-    return 0
+    return settings_cache.offset_minutes()
 
 def get_ist_now():
     """Get current time in IST with optional offset from settings"""
@@ -196,16 +364,20 @@ def get_ist_now():
 
 def get_eod_time():
     """Get End of Day time from settings (default 23:59)"""
-    try:
-        settings = settings_collection.find_one({})
-        if settings and settings.get("eodTime"):
-            return settings.get("eodTime", "23:59")
-    except:
-        pass
-    return "23:59"
+    return settings_cache.eod_time()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str, user_id=None) -> bool:
+    """
+    Check a password off the event loop. When ``user_id`` is given and the
+    stored hash uses an outdated cost factor, it is replaced with a fresh one.
+    """
+    try:
+        valid, new_hash = await password_hasher.verify(plain_password, hashed_password)
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please try again")
+    if valid and new_hash and user_id is not None:
+        await repos.users.replace_password_hash(user_id, hashed_password, new_hash)
+    return valid
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -217,46 +389,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
-def generate_referral_id(prefix="VSV"):
-    """Generate unique referral ID"""
-    while True:
-        random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=7))
-        referral_id = f"{prefix}{random_str}"
-        if not users_collection.find_one({"referralId": referral_id}):
-            return referral_id
-
 def get_user_rank(total_pv: int):
     """Get user rank based on total PV"""
-    # Get all ranks sorted by minPV descending
-    ranks = list(ranks_collection.find({}).sort("minPV", DESCENDING))
-    
-    # Find the highest rank user qualifies for
-    for rank in ranks:
-        if total_pv >= rank.get("minPV", 0):
-            return {
-                "name": rank.get("name"),
-                "icon": rank.get("icon"),
-                "color": rank.get("color"),
-                "minPV": rank.get("minPV")
-            }
-    
-    # If no rank found, return lowest rank
-    lowest_rank = ranks_collection.find_one({}, sort=[("minPV", ASCENDING)])
-    if lowest_rank:
-        return {
-            "name": lowest_rank.get("name"),
-            "icon": lowest_rank.get("icon"),
-            "color": lowest_rank.get("color"),
-            "minPV": lowest_rank.get("minPV")
-        }
-    
-    # Default rank if no ranks defined
-    return {
-        "name": "Member",
-        "icon": "👤",
-        "color": "#6B7280",
-        "minPV": 0
-    }
+    return rank_table.rank_for(total_pv)
 
 def serialize_doc(doc):
     """Convert MongoDB document to JSON serializable format"""
@@ -284,115 +419,6 @@ def serialize_doc(doc):
 
 # ============ REPORT GENERATION HELPERS ============
 
-def generate_excel_report(data: List[Dict], headers: List[str], title: str) -> BytesIO:
-    """Generate Excel file from data"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = title[:31]  # Excel sheet name max 31 chars
-    
-    # Header styling
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Add title
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(headers))
-    title_cell = ws.cell(row=1, column=1, value=title)
-    title_cell.font = Font(bold=True, size=14)
-    title_cell.alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Add timestamp
-    ws.merge_cells(start_row=2, start_column=1, end_row=2, end_column=len(headers))
-    timestamp_cell = ws.cell(row=2, column=1, value=f"Generated on: {datetime.now(IST).strftime('%d-%m-%Y %I:%M %p IST')}")
-    timestamp_cell.alignment = Alignment(horizontal="center")
-    
-    # Add headers
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=col_num, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-    
-    # Add data
-    for row_num, row_data in enumerate(data, 5):
-        for col_num, header in enumerate(headers, 1):
-            value = row_data.get(header, "")
-            ws.cell(row=row_num, column=col_num, value=value)
-    
-    # Auto-adjust column widths
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column].width = adjusted_width
-    
-    # Save to BytesIO
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return output
-
-def generate_pdf_report(data: List[Dict], headers: List[str], title: str) -> BytesIO:
-    """Generate PDF file from data"""
-    output = BytesIO()
-    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#366092'),
-        spaceAfter=12,
-        alignment=1  # Center
-    )
-    elements.append(Paragraph(title, title_style))
-    
-    # Timestamp
-    timestamp_text = f"Generated on: {datetime.now(IST).strftime('%d-%m-%Y %I:%M %p IST')}"
-    timestamp_style = ParagraphStyle('Timestamp', parent=styles['Normal'], fontSize=9, alignment=1)
-    elements.append(Paragraph(timestamp_text, timestamp_style))
-    elements.append(Spacer(1, 20))
-    
-    # Prepare table data
-    table_data = [headers]
-    for row in data:
-        table_data.append([str(row.get(header, "")) for header in headers])
-    
-    # Create table
-    col_widths = [A4[0] / len(headers) - 10] * len(headers)
-    table = Table(table_data, colWidths=col_widths)
-    
-    # Table styling
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#366092')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-    ]))
-    
-    elements.append(table)
-    
-    # Build PDF
-    doc.build(elements)
-    output.seek(0)
-    return output
-
 def parse_date_range(start_date: Optional[str], end_date: Optional[str]):
     """Parse and validate date range parameters"""
     if start_date:
@@ -413,6 +439,36 @@ def parse_date_range(start_date: Optional[str], end_date: Optional[str]):
     
     return start, end
 
+async def report_file_response(format: str, mode: str, data: List[Dict], headers: List[str], title: str,
+                               filename: str, current_admin: dict):
+    """
+    Excel/PDF export. mode "sync" returns the file; "async" queues a report
+    job and returns 202 with its status; "auto" returns the file when there
+    are at most REPORT_SYNC_MAX_ROWS rows and queues a job otherwise.
+    """
+    if mode not in ("auto", "sync", "async"):
+        raise HTTPException(status_code=400, detail="mode must be auto, sync or async")
+    media_type, extension = REPORT_FORMATS[format]
+    download_name = f"{filename}_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.{extension}"
+    
+    if mode == "async" or (mode == "auto" and len(data) > REPORT_SYNC_MAX_ROWS):
+        job = await report_jobs.submit(format, data, headers, title, download_name, current_admin.get("id"))
+        return JSONResponse(status_code=202, content={"success": True, "data": report_job_view(job)})
+    
+    content = await report_jobs.render(format, data, headers, title)
+    return StreamingResponse(
+        BytesIO(content),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={download_name}"}
+    )
+
+def report_job_view(job: dict) -> dict:
+    return {
+        **job,
+        "statusUrl": f"/api/admin/reports/jobs/{job['jobId']}",
+        "downloadUrl": f"/api/admin/reports/jobs/{job['jobId']}/download"
+    }
+
 # Get current user from token
 async def get_current_user(authorization: Optional[str] = Header(None)):
     """Extract user from JWT token in Authorization header"""
@@ -434,11 +490,11 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = users_collection.find_one({"_id": ObjectId(user_id)})
+    user = await principal_cache.aget(user_id)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     
-    return serialize_doc(user)
+    return user
 
 async def get_current_active_user(authorization: Optional[str] = Header(None)):
     """Get current active user"""
@@ -595,6 +651,8 @@ def initialize_plans():
             }
         ]
         plans_collection.insert_many(plans)
+        plan_registry.invalidate()
+        response_cache.invalidate("plans")
         print("✅ Default plans initialized")
 
 # Initialize default ranks
@@ -645,6 +703,7 @@ def initialize_ranks():
             }
         ]
         ranks_collection.insert_many(default_ranks)
+        rank_table.invalidate()
         print("✅ Default ranks initialized")
 
 # Initialize admin user
@@ -661,7 +720,7 @@ def initialize_admin():
             "name": os.getenv("ADMIN_NAME", "VSV Admin"),
             "username": os.getenv("ADMIN_USERNAME", "vsvadmin"),
             "email": admin_email,
-            "password": hash_password(admin_password),
+            "password": password_hasher.context.hash(admin_password),
             "mobile": "8807867028",
             "referralId": admin_referral_id,
             "role": "admin",
@@ -708,37 +767,144 @@ async def startup_event():
     
     wallets_collection.create_index([("userId", ASCENDING)], unique=True)
     transactions_collection.create_index([("userId", ASCENDING)])
+    ensure_matching_indexes(transactions_collection)
+    transactions_collection.create_index([("type", ASCENDING), ("createdAt", DESCENDING)])
+    transactions_collection.create_index([("userId", ASCENDING), ("createdAt", DESCENDING)])
+    ensure_user_stats_indexes(user_stats_collection)
+    ensure_pipeline_indexes(daily_stats_collection, pv_snapshots_collection)
     teams_collection.create_index([("userId", ASCENDING)])
     teams_collection.create_index([("sponsorId", ASCENDING)])
     
+    # One member per sponsor/side slot - this is what makes concurrent placement safe
+    if not ensure_placement_index():
+        print(f"❌ Unique placement index missing, placed registrations are DISABLED: {placement_index['error']}")
+        for slot in placement_index["duplicateSlots"]:
+            print(f"   ❌ Slot {slot['sponsorId']}/{slot['placement']} held by {', '.join(slot['userIds'])}")
+    
     # KYC indexes
     kyc_submissions_collection.create_index([("userId", ASCENDING)])
     kyc_submissions_collection.create_index([("status", ASCENDING)])
     users_collection.create_index([("kycStatus", ASCENDING)])
     
+    try:
+        principal_cache.ensure_indexes()
+    except Exception as e:
+        print(f"⚠️ Principal invalidation log indexes failed: {e}")
+    
+    # Load binary tree index
+    try:
+        tree_index.load(teams_collection)
+        stats = tree_index.stats()
+        print(f"✅ Tree index loaded: {stats['placed']} members ({stats['bytesPerNode']} bytes/node)")
+    except Exception as e:
+        print(f"⚠️ Tree index load failed, will retry on first use: {e}")
+    
+    # Leg counters are maintained incrementally; build them once for older data
+    try:
+        if users_collection.find_one({"leftCount": {"$exists": False}}, {"_id": 1}):
+            updated = rebuild_leg_counters(users_collection, teams_collection)
+            print(f"✅ Leg counters rebuilt for {updated} users")
+    except Exception as e:
+        print(f"⚠️ Leg counter rebuild failed: {e}")
+    
+    # Ranks are computed from totalPV when read; drop the snapshot older EOD runs stored
+    try:
+        cleared = users_collection.update_many({"rank": {"$exists": True}}, {"$unset": {"rank": ""}}).modified_count
+        if cleared:
+            print(f"✅ Removed stored rank from {cleared} users")
+    except Exception as e:
+        print(f"⚠️ Stored rank cleanup failed: {e}")
+    
+    # Referral ID counter: seed it once, past any sequence IDs already issued
+    try:
+        if not counters_collection.find_one({"_id": "referralId"}):
+            synced = referral_ids.sync_counter(users_collection)
+            print(f"✅ Referral ID counter at {synced['seq']} ({synced['legacy']} legacy IDs kept)")
+    except Exception as e:
+        print(f"⚠️ Referral ID counter sync failed: {e}")
+    
+    # Dashboard stats are maintained incrementally; build them once for older data
+    try:
+        if not user_stats_collection.find_one({}, {"_id": 1}) and users_collection.find_one({}, {"_id": 1}):
+            rebuilt = rebuild_user_stats(
+                user_stats_collection, users_collection, transactions_collection, withdrawals_collection, get_ist_now()
+            )
+            print(f"✅ User stats built for {rebuilt['users']} users")
+    except Exception as e:
+        print(f"⚠️ User stats rebuild failed: {e}")
+    
+    # Daily business figures are maintained incrementally; build them once for older data
+    try:
+        built = daily_stats_collection.find_one({"newUsers": {"$exists": True}}, {"_id": 1})
+        if not built and users_collection.find_one({"role": "user"}, {"_id": 1}):
+            rebuilt = rebuild_daily_stats(
+                daily_stats_collection, users_collection, topups_collection, withdrawals_collection,
+                transactions_collection, get_ist_now()
+            )
+            print(f"✅ Daily stats built for {rebuilt['days']} days")
+    except Exception as e:
+        print(f"⚠️ Daily stats rebuild failed: {e}")
+    
     # Initialize data
     initialize_plans()
     initialize_ranks()
     initialize_admin()
     
+    # Report jobs
+    try:
+        report_jobs.ensure_indexes()
+        report_jobs.start()
+        print(f"✅ Report jobs enabled ({report_jobs.directory}, {report_jobs.max_workers} workers)")
+    except Exception as e:
+        print(f"⚠️ Report jobs failed to start: {e}")
+    
+    # EOD scheduler
+    try:
+        eod_scheduler.ensure_indexes()
+        eod_scheduler.start()
+        print(f"✅ EOD scheduler started (eodTime {get_eod_time()} IST, enabled={eod_scheduler.enabled})")
+    except Exception as e:
+        print(f"⚠️ EOD scheduler failed to start: {e}")
+    
     print("✅ Database initialized successfully")
     print("✅ Tutorial Routes Active")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks"""
+    await eod_scheduler.stop()
+    await report_jobs.stop()
+    async_client.close()
+    password_hasher.shutdown()
+
 # ==================== AUTH ROUTES ====================
 
 @app.post("/api/auth/register")
 async def register(user: UserRegister):
     """Register new user with MLM structure"""
     try:
+        # Without the unique slot index two registrations can take the same slot
+        if user.referralId and not await asyncio.to_thread(placement_available):
+            raise HTTPException(
+                status_code=503,
+                detail="Registration is temporarily unavailable (placement index missing, see /api/health)"
+            )
+        
+        email_taken, mobile_accounts, username_taken = await asyncio.gather(
+            repos.users.email_taken(user.email),
+            repos.users.count_by_mobile(user.mobile),
+            repos.users.username_taken(user.username)
+        )
+        
         # Check if user already exists
-        if user.email and users_collection.find_one({"email": user.email}):
+        if email_taken:
             raise HTTPException(status_code=400, detail="Email already registered")
 
         # Check for maximum 3 accounts per mobile number
-        if users_collection.count_documents({"mobile": user.mobile}) >= 3:
+        if mobile_accounts >= 3:
             raise HTTPException(status_code=400, detail="Maximum 3 accounts allowed per mobile number")
         
-        if users_collection.find_one({"username": user.username}):
+        if username_taken:
             raise HTTPException(status_code=400, detail="Username already taken")
         
         # Validate referral ID if provided
@@ -747,7 +913,7 @@ async def register(user: UserRegister):
         actual_placement = None
         
         if user.referralId:
-            sponsor = users_collection.find_one({"referralId": user.referralId})
+            sponsor = await repos.users.get_by_referral_id(user.referralId, {"_id": 1})
             if not sponsor:
                 raise HTTPException(status_code=400, detail="Invalid referral ID")
             
@@ -755,18 +921,19 @@ async def register(user: UserRegister):
                 raise HTTPException(status_code=400, detail="Placement is required when using referral ID")
             
             # Get auto-placement position (deepest left-most or right-most)
-            actual_sponsor_id, actual_placement = get_auto_placement_position(
+            actual_sponsor_id, actual_placement = await asyncio.to_thread(
+                get_auto_placement_position,
                 str(sponsor["_id"]), 
                 user.placement
             )
         
-        # Generate unique referral ID
-        referral_id = generate_referral_id()
+        # Allocate referral ID (unique by construction)
+        referral_id = await referral_ids.anext_id()
         
         # Check if plan is provided and valid
         plan = None
         if user.planId:
-            plan = plans_collection.find_one({"_id": ObjectId(user.planId)})
+            plan = plan_registry.by_id(user.planId)
             if not plan:
                 raise HTTPException(status_code=400, detail="Invalid plan ID")
         
@@ -775,7 +942,7 @@ async def register(user: UserRegister):
         user_data = {
             "name": user.name,
             "username": user.username,
-            "password": hash_password(user.password),
+            "password": await hash_password(user.password),
             "mobile": user.mobile,
             "referralId": referral_id,
             "role": "user",
@@ -790,6 +957,12 @@ async def register(user: UserRegister):
             "totalPV": 0,
             "leftPV": 0,
             "rightPV": 0,
+            "leftLeafId": None,   # Outer-leg leaf pointers used by auto-placement
+            "rightLeafId": None,
+            "leftCount": 0,       # Leg sizes, maintained on register/activation/delete
+            "rightCount": 0,
+            "leftActiveCount": 0,
+            "rightActiveCount": 0,
             "createdAt": get_ist_now(),
             "updatedAt": get_ist_now()
         }
@@ -798,29 +971,22 @@ async def register(user: UserRegister):
         if user.email:
             user_data["email"] = user.email
         
-        result = users_collection.insert_one(user_data)
-        user_id = str(result.inserted_id)
+        inserted_id = await repos.users.insert(user_data)
+        user_id = str(inserted_id)
         
         # Create wallet
-        wallets_collection.insert_one({
-            "userId": user_id,
-            "balance": 0,
-            "totalEarnings": 0,
-            "totalWithdrawals": 0,
-            "createdAt": get_ist_now(),
-            "updatedAt": get_ist_now()
-        })
+        await repos.wallets.create(user_id, get_ist_now())
         
         # Add to team structure if has sponsor
         if sponsor:
             # Use auto-placement: actual_sponsor_id and actual_placement
-            teams_collection.insert_one({
-                "userId": user_id,
-                "sponsorId": actual_sponsor_id,  # This is the actual sponsor after auto-placement
-                "placement": actual_placement,    # This is the actual placement side
-                "level": 1,
-                "createdAt": get_ist_now()
-            })
+            placed = await asyncio.to_thread(
+                place_new_member, user_id, str(sponsor["_id"]), actual_sponsor_id, actual_placement
+            )
+            if not placed:
+                await repos.wallets.delete(user_id)
+                await repos.users.delete(inserted_id)
+                raise HTTPException(status_code=503, detail="Placement is busy, please try again")
             
             # Distribute PV if plan is assigned (referral income system removed)
             # LOGIC DEFERRED TO KYC APPROVAL:
@@ -829,11 +995,14 @@ async def register(user: UserRegister):
             pass
 
         
+        # Count the registration in today's business figures
+        await asyncio.to_thread(record_registration, daily_stats_collection, user_data["createdAt"])
+        
         # Create access token
         access_token = create_access_token(data={"sub": user.username, "userId": user_id})
         
         # Get created user
-        created_user = users_collection.find_one({"_id": result.inserted_id})
+        created_user = await repos.users.get(inserted_id)
         user_response = serialize_doc(created_user)
         user_response.pop("password", None)
         
@@ -861,12 +1030,12 @@ async def login_email(credentials: dict = Body(...)):
             raise HTTPException(status_code=400, detail="Email and password required")
         
         # Find user
-        user = users_collection.find_one({"email": email})
+        user = await repos.users.find_one({"email": email})
         if not user:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        # Verify password
-        if not verify_password(password, user["password"]):
+        # Verify password (rehashes at the configured cost if needed)
+        if not await verify_password(password, user["password"], user["_id"]):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         # Allow login for admin OR users with any KYC status (they will see KYC form if needed)
@@ -912,12 +1081,12 @@ async def login_username(credentials: dict = Body(...)):
             raise HTTPException(status_code=400, detail="Username and password required")
         
         # Find user
-        user = users_collection.find_one({"username": username})
+        user = await repos.users.find_one({"username": username})
         if not user:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        # Verify password
-        if not verify_password(password, user["password"]):
+        # Verify password (rehashes at the configured cost if needed)
+        if not await verify_password(password, user["password"], user["_id"]):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         # Allow login for admin OR users with any KYC status (they will see KYC form if needed)
@@ -1018,8 +1187,11 @@ async def logout():
 async def get_profile(current_user: dict = Depends(get_current_active_user)):
     """Get user profile"""
     try:
-        user_data = serialize_doc(current_user)
-        user_data.pop("password", None)
+        # current_user is the slim auth principal; the profile needs the full record
+        user = users_collection.find_one({"_id": ObjectId(current_user["id"])}, {"password": 0})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_data = serialize_doc(user)
         
         # Get wallet info
         wallet = wallets_collection.find_one({"userId": current_user["id"]})
@@ -1043,6 +1215,8 @@ async def get_profile(current_user: dict = Depends(get_current_active_user)):
         user_data["rightTeamSize"] = right_count
         
         return {"success": True, "data": user_data}
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1079,6 +1253,7 @@ async def update_profile(
             {"_id": ObjectId(user_id)},
             {"$set": update_data}
         )
+        principal_cache.invalidate(user_id)
         
         return {"success": True, "message": "Profile updated successfully"}
     except HTTPException as he:
@@ -1105,14 +1280,14 @@ async def change_password(
             raise HTTPException(status_code=404, detail="User not found")
         
         # Verify old password
-        if not verify_password(old_password, user["password"]):
+        if not await verify_password(old_password, user["password"]):
             raise HTTPException(status_code=400, detail="Incorrect old password")
         
         # Update password
         users_collection.update_one(
             {"_id": ObjectId(current_user["id"])},
             {"$set": {
-                "password": hash_password(new_password),
+                "password": await hash_password(new_password),
                 "updatedAt": get_ist_now()
             }}
         )
@@ -1144,95 +1319,45 @@ async def get_referral_info(referral_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Fields the user dashboard reads from the user document
+DASHBOARD_USER_PROJECTION = {
+    "currentPlan": 1, "totalPV": 1, "kycStatus": 1, "isActive": 1,
+    "leftCount": 1, "rightCount": 1, "leftActiveCount": 1, "rightActiveCount": 1
+}
+
 @app.get("/api/user/dashboard")
 async def get_user_dashboard(current_user: dict = Depends(get_current_active_user)):
     """Get user dashboard statistics"""
     try:
         user_id = current_user["id"]
         
-        # Get wallet
-        wallet = wallets_collection.find_one({"userId": user_id})
+        # Wallet, fresh user (not the cached principal), income / pending
+        # withdrawals (materialized in user_stats) and recent transactions
+        # (excluding PLAN_ACTIVATION), fetched concurrently
+        wallet, fresh_user, stats, transactions = await asyncio.gather(
+            repos.wallets.get(user_id),
+            repos.users.get(user_id, DASHBOARD_USER_PROJECTION),
+            repos.user_stats.get(user_id, get_ist_now()),
+            repos.transactions.for_user(user_id, ["PLAN_ACTIVATION"], limit=5)
+        )
+        
         wallet_data = serialize_doc(wallet) if wallet else {
             "balance": 0,
             "totalEarnings": 0,
             "totalWithdrawals": 0
         }
         
-        # Get team statistics
-        total_team = teams_collection.count_documents({"sponsorId": user_id})
-        left_team = teams_collection.count_documents({
-            "sponsorId": user_id,
-            "placement": "LEFT"
-        })
-        right_team = teams_collection.count_documents({
-            "sponsorId": user_id,
-            "placement": "RIGHT"
-        })
-        
-        # Get current plan (fetch fresh from database, not from JWT token)
-        fresh_user = users_collection.find_one({"_id": ObjectId(user_id)})
+        # Get team statistics (maintained leg counters)
+        left_team = fresh_user.get("leftCount", 0) if fresh_user else 0
+        right_team = fresh_user.get("rightCount", 0) if fresh_user else 0
+        total_team = left_team + right_team
         current_plan = None
         
         if fresh_user and fresh_user.get("currentPlan"):
-            plan_value = fresh_user.get("currentPlan")
-            try:
-                # Try as ObjectId first
-                plan = plans_collection.find_one({"_id": ObjectId(plan_value)})
-                if plan:
-                    current_plan = serialize_doc(plan)
-            except:
-                # Try as plan name
-                plan = plans_collection.find_one({"name": plan_value})
-                if plan:
-                    current_plan = serialize_doc(plan)
-        
-        # Get additional financial stats
-        # Get additional financial stats
-        try:
-            # 1. Today's Earnings
-            ist_now = get_ist_now()
-            start_of_day = ist_now.replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            todays_transactions = list(transactions_collection.find({
-                "userId": user_id,
-                "amount": {"$gt": 0},
-                "createdAt": {"$gte": start_of_day.isoformat()}
-            }))
-            todays_earnings = sum(t.get("amount", 0) for t in todays_transactions)
-
-            # 2. Pending Withdrawals
-            pending_payouts = list(withdrawals_collection.find({
-                "userId": user_id,
-                "status": "PENDING"
-            }))
-            pending_withdrawals = sum(p.get("amount", 0) for p in pending_payouts)
-
-            # 3. Referral Income (REMOVED)
-            referral_income = 0
-            # referral_txns = list(transactions_collection.find({
-            #     "userId": user_id,
-            #     "type": "REFERRAL_BONUS"
-            # }))
-            # referral_income = sum(t.get("amount", 0) for t in referral_txns)
-
-            # 4. Matching Income
-            matching_txns = list(transactions_collection.find({
-                "userId": user_id,
-                "type": "MATCHING_BONUS"
-            }))
-            matching_income = sum(t.get("amount", 0) for t in matching_txns)
-        except Exception as e:
-            print(f"Error calculating stats: {e}")
-            todays_earnings = 0
-            pending_withdrawals = 0
-            referral_income = 0
-            matching_income = 0
-        
-        # Get recent transactions (exclude PLAN_ACTIVATION)
-        transactions = list(transactions_collection.find({
-            "userId": user_id,
-            "type": {"$ne": "PLAN_ACTIVATION"}
-        }).sort("createdAt", DESCENDING).limit(5))
+            # currentPlan is a plan id, or a plan name on legacy records
+            plan = plan_registry.resolve(fresh_user.get("currentPlan"))
+            if plan:
+                current_plan = serialize_doc(plan)
         
         # Get user rank based on total PV
         total_pv = fresh_user.get("totalPV", 0) if fresh_user else 0
@@ -1243,15 +1368,18 @@ async def get_user_dashboard(current_user: dict = Depends(get_current_active_use
             "data": {
                 "wallet": {
                     **wallet_data,
-                    "todaysEarnings": todays_earnings,
-                    "pendingWithdrawals": pending_withdrawals,
-                    "referralIncome": referral_income,
-                    "matchingIncome": matching_income
+                    "todaysEarnings": stats["todaysEarnings"],
+                    "pendingWithdrawals": stats["pendingWithdrawals"],
+                    "referralIncome": 0,  # Referral income system removed
+                    "matchingIncome": stats["matchingIncome"]
                 },
                 "team": {
                     "total": total_team,
                     "left": left_team,
-                    "right": right_team
+                    "right": right_team,
+                    "direct": stats["directReferrals"],
+                    "leftActive": fresh_user.get("leftActiveCount", 0) if fresh_user else 0,
+                    "rightActive": fresh_user.get("rightActiveCount", 0) if fresh_user else 0
                 },
                 "currentPlan": current_plan,
                 "rank": user_rank,
@@ -1263,71 +1391,111 @@ async def get_user_dashboard(current_user: dict = Depends(get_current_active_use
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Fields needed to render a tree node
+TREE_NODE_PROJECTION = {
+    "name": 1, "referralId": 1, "placement": 1, "currentPlan": 1, "isActive": 1,
+    "leftPV": 1, "rightPV": 1, "totalPV": 1, "profilePhoto": 1,
+    "leftCount": 1, "rightCount": 1, "leftActiveCount": 1, "rightActiveCount": 1
+}
+
+# Deepest tree a single request may return
+MAX_TREE_DEPTH = 50
+
+def assemble_team_tree(root_id: str, edges: list, users: dict):
+    """
+    Nest the edges below root_id into tree nodes. ``users`` maps user id to
+    a TREE_NODE_PROJECTION document. Every node carries leftCount/rightCount
+    and hasChildren, so nodes on the depth frontier (hasChildren but no
+    left/right loaded) can be expanded with a follow-up request rooted at them.
+    """
+    children = {(edge["sponsorId"], edge["placement"]): edge["userId"] for edge in edges}
+    
+    def make_node(user_id: str):
+        user = users.get(user_id)
+        if not user:
+            return None
+        left_count = user.get("leftCount", 0)
+        right_count = user.get("rightCount", 0)
+        return {
+            "id": user_id,
+            "name": user["name"],
+            "referralId": user["referralId"],
+            "placement": user.get("placement"),
+            "currentPlan": plan_registry.name_for(user.get("currentPlan")),
+            "isActive": user.get("isActive", False),
+            "leftPV": user.get("leftPV", 0),
+            "rightPV": user.get("rightPV", 0),
+            "totalPV": user.get("totalPV", 0),
+            "profilePhoto": user.get("profilePhoto"),
+            "leftCount": left_count,
+            "rightCount": right_count,
+            "leftActiveCount": user.get("leftActiveCount", 0),
+            "rightActiveCount": user.get("rightActiveCount", 0),
+            "hasChildren": left_count + right_count > 0,
+            "left": None,
+            "right": None
+        }
+    
+    # Assemble top-down without recursion; members whose user record is gone are pruned with their subtree
+    tree = make_node(root_id)
+    stack = [(root_id, tree)]
+    while stack:
+        parent_id, parent_node = stack.pop()
+        for side, key in (("LEFT", "left"), ("RIGHT", "right")):
+            child_id = children.get((parent_id, side))
+            if not child_id:
+                continue
+            child_node = make_node(child_id)
+            if child_node:
+                parent_node[key] = child_node
+                stack.append((child_id, child_node))
+    
+    return tree
+
+async def build_team_tree(root_id: str, max_depth: int = MAX_TREE_DEPTH):
+    """
+    Build the nested binary tree below root_id, max_depth levels deep
+    One $graphLookup for the edges, one $in query for the users, plans from a map.
+    """
+    root_user, edges = await asyncio.gather(
+        repos.users.get(root_id, TREE_NODE_PROJECTION),
+        repos.teams.subtree_edges(root_id, max_depth)
+    )
+    if not root_user:
+        return None
+    
+    users = await repos.users.get_many([edge["userId"] for edge in edges], TREE_NODE_PROJECTION)
+    users[root_id] = root_user
+    return assemble_team_tree(root_id, edges, users)
+
 @app.get("/api/user/team/tree")
-async def get_team_tree(current_user: dict = Depends(get_current_active_user)):
-    """Get user's team tree (binary structure)"""
+async def get_team_tree(
+    depth: int = MAX_TREE_DEPTH,
+    root: Optional[str] = None,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Get user's team tree (binary structure), optionally rooted at a downline member"""
     try:
-        user_id = current_user["id"]
-        
-        def build_tree(parent_id, depth=0, max_depth=50):
-            if depth > max_depth:
-                return None
-            
-            user = users_collection.find_one({"_id": ObjectId(parent_id)})
-            if not user:
-                return None
-            
-            # Get children from teams collection
-            # sponsorId in teams collection is stored as string of ObjectId
-            left_child = teams_collection.find_one({
-                "sponsorId": str(user["_id"]),
-                "placement": "LEFT"
-            })
-            right_child = teams_collection.find_one({
-                "sponsorId": str(user["_id"]),
-                "placement": "RIGHT"
-            })
-            
-            # Get plan name if exists
-            plan_name = None
-            if user.get("currentPlan"):
-                try:
-                    plan = plans_collection.find_one({"_id": ObjectId(user["currentPlan"])}, {"_id": 0})
-                    if plan:
-                        plan_name = plan.get("name")
-                except Exception:
-                    # If currentPlan is already a string (plan name), use it
-                    plan_name = user.get("currentPlan") if isinstance(user.get("currentPlan"), str) and len(user.get("currentPlan")) < 50 else None
+        root_id = current_user["id"]
+        if root:
+            root_user = await repos.users.get_by_id_or_referral(root, {"_id": 1})
+            if not root_user:
+                raise HTTPException(status_code=404, detail="User not found")
+            root_id = str(root_user["_id"])
             
-            node = {
-                "id": str(user["_id"]),
-                "name": user["name"],
-                "referralId": user["referralId"],
-                "placement": user.get("placement"),
-                "currentPlan": plan_name,
-                "isActive": user.get("isActive", False),
-                "leftPV": user.get("leftPV", 0),
-                "rightPV": user.get("rightPV", 0),
-                "totalPV": user.get("totalPV", 0),
-                "profilePhoto": user.get("profilePhoto"),
-                "left": None,
-                "right": None
-            }
-            
-            if left_child:
-                node["left"] = build_tree(left_child["userId"], depth + 1, max_depth)
-            
-            if right_child:
-                node["right"] = build_tree(right_child["userId"], depth + 1, max_depth)
-            
-            return node
+            # Only the user's own downline can be expanded
+            upline = await repos.teams.ancestor_path(root_id)
+            if root_id != current_user["id"] and not any(a["userId"] == current_user["id"] for a in upline):
+                raise HTTPException(status_code=403, detail="User is not in your team")
         
-        tree = build_tree(user_id)
+        tree = await build_team_tree(root_id, max(0, min(depth, MAX_TREE_DEPTH)))
         
         return {
             "success": True,
             "data": tree
         }
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1346,18 +1514,14 @@ async def get_user_details(user_id: str, current_user: dict = Depends(get_curren
         
         # Get plan details
         plan_details = None
-        if user.get("currentPlan"):
-            try:
-                plan = plans_collection.find_one({"_id": ObjectId(user["currentPlan"])})
-                if plan:
-                    plan_details = {
-                        "name": plan.get("name"),
-                        "amount": plan.get("amount"),
-                        "pv": plan.get("pv"),
-                        "dailyCapping": plan.get("dailyCapping")
-                    }
-            except:
-                pass
+        plan = plan_registry.resolve(user.get("currentPlan"))
+        if plan:
+            plan_details = {
+                "name": plan.get("name"),
+                "amount": plan.get("amount"),
+                "pv": plan.get("pv"),
+                "dailyCapping": plan.get("dailyCapping")
+            }
         
         # Get wallet info
         wallet = wallets_collection.find_one({"userId": str(user["_id"])})
@@ -1377,10 +1541,10 @@ async def get_user_details(user_id: str, current_user: dict = Depends(get_curren
                     "referralId": sponsor.get("referralId")
                 }
         
-        # Get team count
-        team_count = teams_collection.count_documents({"sponsorId": str(user["_id"])})
-        left_count = teams_collection.count_documents({"sponsorId": str(user["_id"]), "placement": "LEFT"})
-        right_count = teams_collection.count_documents({"sponsorId": str(user["_id"]), "placement": "RIGHT"})
+        # Get team count (maintained leg counters)
+        left_count = user.get("leftCount", 0)
+        right_count = user.get("rightCount", 0)
+        team_count = left_count + right_count
         
         # Get user's own placement from teams collection
         user_team_record = teams_collection.find_one({"userId": str(user["_id"])})
@@ -1428,7 +1592,9 @@ async def get_user_details(user_id: str, current_user: dict = Depends(get_curren
             "team": {
                 "total": team_count,
                 "left": left_count,
-                "right": right_count
+                "right": right_count,
+                "leftActive": user.get("leftActiveCount", 0),
+                "rightActive": user.get("rightActiveCount", 0)
             },
             "joinedAt": user.get("createdAt"),
             "lastActive": user.get("updatedAt"),
@@ -1462,33 +1628,20 @@ async def get_team_list(current_user: dict = Depends(get_current_active_user)):
         users_list = list(users_collection.find({"_id": {"$in": user_ids}}))
         users_map = {str(user["_id"]): user for user in users_list}
         
-        # Batch fetch all plans
-        plans_list = list(plans_collection.find({}))
-        plans_map = {str(plan["_id"]): plan for plan in plans_list}
-        plans_by_name = {plan["name"]: plan for plan in plans_list}
+        # Resolve every member's rank in one pass
+        ranks_by_user = dict(zip(users_map, rank_table.rank_for_many(
+            user.get("totalPV", 0) for user in users_map.values()
+        )))
         
         result = []
         for member in team_members:
             user = users_map.get(member["userId"])
             if user:
                 # Get plan name if exists
-                plan_name = None
-                if user.get("currentPlan"):
-                    # Try ObjectId lookup first
-                    plan = plans_map.get(user.get("currentPlan"))
-                    if plan:
-                        plan_name = plan.get("name")
-                    else:
-                        # Try by name
-                        plan = plans_by_name.get(user.get("currentPlan"))
-                        if plan:
-                            plan_name = plan.get("name")
-                        elif isinstance(user.get("currentPlan"), str) and len(user.get("currentPlan")) < 50:
-                            plan_name = user.get("currentPlan")
+                plan_name = plan_registry.name_for(user.get("currentPlan"))
                 
                 # Get user rank
-                total_pv = user.get("totalPV", 0)
-                user_rank = get_user_rank(total_pv)
+                user_rank = ranks_by_user[str(user["_id"])]
                 
                 result.append({
                     "id": str(user["_id"]),
@@ -1541,10 +1694,10 @@ async def get_all_teams(
         users_list = list(users_collection.find({"_id": {"$in": all_user_ids}}))
         users_map = {str(user["_id"]): user for user in users_list}
         
-        # Batch fetch all plans
-        plans_list = list(plans_collection.find({}))
-        plans_map = {str(plan["_id"]): plan for plan in plans_list}
-        plans_by_name = {plan["name"]: plan for plan in plans_list}
+        # Resolve every member's rank in one pass
+        ranks_by_user = dict(zip(users_map, rank_table.rank_for_many(
+            user.get("totalPV", 0) for user in users_map.values()
+        )))
         
         result = []
         for team in teams:
@@ -1553,23 +1706,10 @@ async def get_all_teams(
             
             if user:
                 # Get plan name if exists
-                plan_name = None
-                if user.get("currentPlan"):
-                    # Try ObjectId lookup first
-                    plan = plans_map.get(user.get("currentPlan"))
-                    if plan:
-                        plan_name = plan.get("name")
-                    else:
-                        # Try by name
-                        plan = plans_by_name.get(user.get("currentPlan"))
-                        if plan:
-                            plan_name = plan.get("name")
-                        elif isinstance(user.get("currentPlan"), str) and len(user.get("currentPlan")) < 50:
-                            plan_name = user.get("currentPlan")
+                plan_name = plan_registry.name_for(user.get("currentPlan"))
                 
                 # Get user rank
-                total_pv = user.get("totalPV", 0)
-                user_rank = get_user_rank(total_pv)
+                user_rank = ranks_by_user[str(user["_id"])]
                 
                 member_data = {
                     "id": str(user["_id"]),
@@ -1617,73 +1757,20 @@ async def get_all_teams(
 @app.get("/api/admin/team/tree/{user_id}")
 async def get_admin_team_tree(
     user_id: str,
+    depth: int = MAX_TREE_DEPTH,
+    root: Optional[str] = None,
     current_admin: dict = Depends(get_current_admin)
 ):
-    """Get team tree for any user (admin only)"""
+    """Get team tree for any user (admin only); root expands a node inside it"""
     try:
-        def build_tree(parent_id: str, depth=0, max_depth=50) -> dict:
-            if depth > max_depth:
-                return None
-                
-            user = users_collection.find_one({"_id": ObjectId(parent_id)})
-            if not user:
-                return None
-            
-            # Get left and right children from teams collection
-            left_child = teams_collection.find_one({
-                "sponsorId": str(user["_id"]),
-                "placement": "LEFT"
-            })
-            right_child = teams_collection.find_one({
-                "sponsorId": str(user["_id"]),
-                "placement": "RIGHT"
-            })
-            
-            # Get plan name if exists
-            plan_name = None
-            if user.get("currentPlan"):
-                try:
-                    plan = plans_collection.find_one({"_id": ObjectId(user["currentPlan"])}, {"_id": 0})
-                    if plan:
-                        plan_name = plan.get("name")
-                except Exception:
-                    # If currentPlan is already a string (plan name), use it
-                    plan_name = user.get("currentPlan") if isinstance(user.get("currentPlan"), str) and len(user.get("currentPlan")) < 50 else None
-            
-            node = {
-                "id": str(user["_id"]),
-                "name": user["name"],
-                "referralId": user["referralId"],
-                "placement": user.get("placement"),
-                "currentPlan": plan_name,
-                "isActive": user.get("isActive", False),
-                "leftPV": user.get("leftPV", 0),
-                "rightPV": user.get("rightPV", 0),
-                "totalPV": user.get("totalPV", 0),
-                "profilePhoto": user.get("profilePhoto"),
-                "left": None,
-                "right": None
-            }
-            
-            if left_child:
-                node["left"] = build_tree(left_child["userId"], depth + 1, max_depth)
-            
-            if right_child:
-                node["right"] = build_tree(right_child["userId"], depth + 1, max_depth)
-            
-            return node
-        
         # Find user by referralId or ObjectId
-        try:
-            target_user = users_collection.find_one({"_id": ObjectId(user_id)})
-        except:
-            target_user = users_collection.find_one({"referralId": user_id})
+        target_user = await repos.users.get_by_id_or_referral(root or user_id, {"_id": 1})
         
         if not target_user:
             raise HTTPException(status_code=404, detail="User not found")
         
         target_user_id = str(target_user["_id"])
-        tree = build_tree(target_user_id)
+        tree = await build_team_tree(target_user_id, max(0, min(depth, MAX_TREE_DEPTH)))
         
         return {
             "success": True,
@@ -1695,17 +1782,31 @@ async def get_admin_team_tree(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/admin/team/reconcile-counters")
+async def reconcile_leg_counters(current_admin: dict = Depends(get_current_admin)):
+    """Rebuild every user's left/right leg counters from the teams collection (admin only)"""
+    try:
+        # Full BFS over users and teams: runs off the event loop
+        updated = await asyncio.to_thread(rebuild_leg_counters, users_collection, teams_collection)
+        return {
+            "success": True,
+            "message": f"Leg counters reconciled, {updated} users corrected",
+            "data": {"updated": updated}
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ==================== PLANS ROUTES ====================
 
 @app.get("/api/plans")
-async def get_plans():
+async def get_plans(request: Request):
     """Get all active plans"""
     try:
-        plans = list(plans_collection.find({"isActive": True}))
-        return {
+        return response_cache.respond(request, "plans", lambda: {
             "success": True,
-            "data": serialize_doc(plans)
-        }
+            "data": serialize_doc(plan_registry.all(active_only=True))
+        }, sources=(plan_registry,))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1721,7 +1822,7 @@ async def activate_plan(
             raise HTTPException(status_code=400, detail="Plan ID required")
         
         # Get plan
-        plan = plans_collection.find_one({"_id": ObjectId(plan_id)})
+        plan = plan_registry.by_id(plan_id)
         if not plan:
             raise HTTPException(status_code=404, detail="Plan not found")
         
@@ -1771,6 +1872,8 @@ async def activate_plan(
                 },
                 upsert=True
             )
+            record_credit(user_stats_collection, admin_id, plan["amount"], "PLAN_ACTIVATION", get_ist_now())
+        record_plan_activation(daily_stats_collection, plan["name"], plan["amount"], get_ist_now())
         
         # Distribute PV upward in the binary tree
         pv_amount = plan.get("pv", 0)
@@ -1833,7 +1936,7 @@ async def create_topup_request(
             raise HTTPException(status_code=400, detail="Transaction details required")
         
         # Get plan details
-        plan = plans_collection.find_one({"_id": ObjectId(plan_id)})
+        plan = plan_registry.by_id(plan_id)
         if not plan:
             raise HTTPException(status_code=404, detail="Plan not found")
         
@@ -1872,54 +1975,49 @@ async def create_topup_request(
 def distribute_pv_upward(user_id: str, pv_amount: int):
     """
     Distribute PV upward in the binary tree
-    PV flows completely to all sponsors based on placement
+    PV flows completely to all sponsors based on placement.
+    Uses the materialized ancestor path so the whole upline is updated
+    in a single bulk write instead of one round trip per level.
     """
     try:
-        current_user = users_collection.find_one({"_id": ObjectId(user_id)})
-        if not current_user:
-            return
-        
-        # Get user's team record to find placement
-        team_record = teams_collection.find_one({"userId": user_id})
-        if not team_record or not team_record.get("sponsorId"):
+        ancestors = get_ancestor_path(teams_collection, user_id)
+        if not ancestors:
             return  # No sponsor (admin user)
         
-        placement = team_record.get("placement")  # LEFT or RIGHT
-        sponsor_id = team_record["sponsorId"]
-        
-        # Travel up the tree
-        while sponsor_id:
-            sponsor = users_collection.find_one({"_id": ObjectId(sponsor_id)})
-            if not sponsor:
-                break
-            
-            # Add PV to sponsor's left or right leg based on placement
-            update_field = "leftPV" if placement == "LEFT" else "rightPV"
-            
-            users_collection.update_one(
-                {"_id": ObjectId(sponsor_id)},
-                {
-                    "$inc": {update_field: pv_amount},
-                    "$set": {"updatedAt": get_ist_now()}
-                }
-            )
-            
-            # Note: Matching income will be calculated at end of day
-            # Not calculated immediately to allow PV accumulation
-            
-            # Move up to next sponsor
-            sponsor_team = teams_collection.find_one({"userId": sponsor_id})
-            if not sponsor_team or not sponsor_team.get("sponsorId"):
-                break
-            
-            # Get placement of current sponsor in their sponsor's tree
-            placement = sponsor_team.get("placement")
-            sponsor_id = sponsor_team["sponsorId"]
+        # Note: Matching income will be calculated at end of day
+        # Not calculated immediately to allow PV accumulation
+        distribute_pv_to_ancestors(users_collection, ancestors, pv_amount, get_ist_now())
             
     except Exception as e:
         print(f"Error in PV distribution: {str(e)}")
 
 
+def update_user_fields(user_id: str, update_data: dict):
+    """
+    $set fields on a user, keeping the upline's active-member counters in step
+    when isActive flips. Returns the user's previous isActive value (None if not found).
+    """
+    before = users_collection.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$set": update_data},
+        projection={"isActive": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return None
+    principal_cache.invalidate(user_id)
+    
+    was_active = bool(before.get("isActive", False))
+    if "isActive" in update_data and bool(update_data["isActive"]) != was_active:
+        adjust_leg_counters(
+            users_collection,
+            get_ancestor_path(teams_collection, user_id),
+            0,
+            1 if update_data["isActive"] else -1
+        )
+    return was_active
+
+
 def calculate_matching_income(user_id: str):
     """
     Calculate binary matching income based on left and right PV
@@ -1927,152 +2025,52 @@ def calculate_matching_income(user_id: str):
     Amount = todayPV × ₹25
     """
     try:
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user or not user.get("currentPlan"):
-            return  # User must have an active plan
-        
-        # Get user's current PV
-        left_pv = user.get("leftPV", 0)
-        right_pv = user.get("rightPV", 0)
-        
-        # No matching possible if any side is 0
-        if left_pv == 0 or right_pv == 0:
-            return
-        
-        # Get plan details
-        plan = plans_collection.find_one({"_id": ObjectId(user["currentPlan"])})
-        if not plan:
-            return
-        
-        daily_capping = plan.get("dailyCapping", 500)
-        matching_income_rate = 25  # ₹25 per PV (as per your formula)
-        
-        # Calculate matching PV = min(leftPV, rightPV)
-        matched_pv = min(left_pv, right_pv)
-        
-        # Check daily capping
-        today_date = get_ist_now().replace(hour=0, minute=0, second=0, microsecond=0)
-        last_matching_date = user.get("lastMatchingDate")
-        
-        # Reset daily PV if new day
-        if not last_matching_date or last_matching_date.replace(hour=0, minute=0, second=0, microsecond=0) != today_date:
-            daily_pv_used = 0
-        else:
-            daily_pv_used = user.get("dailyPVUsed", 0)
-        
-        # Calculate maximum PV allowed today (based on capping)
-        max_pv_per_day = daily_capping // matching_income_rate  # 500 / 25 = 20 PV max per day
-        remaining_pv_today = max_pv_per_day - daily_pv_used
-        
-        if remaining_pv_today <= 0:
-            return  # Daily limit reached
-        
-        # Today's PV = min(matched_pv, remaining_pv_today)
-        today_pv = min(matched_pv, remaining_pv_today)
-        
-        if today_pv <= 0:
-            return
-        
-        # Calculate income
-        income = today_pv * matching_income_rate
-        
-        # Update user's wallet
-        wallets_collection.update_one(
-            {"userId": user_id},
-            {
-                "$inc": {
-                    "balance": income,
-                    "totalEarnings": income
-                },
-                "$set": {"updatedAt": get_ist_now()}
-            }
+        result = run_matching(
+            users_collection, wallets_collection, transactions_collection, plans_collection,
+            get_ist_now(),
+            query={"_id": ObjectId(user_id), "currentPlan": {"$ne": None}},
+            user_stats_collection=user_stats_collection,
+            daily_stats_collection=daily_stats_collection
         )
-        
-        # Create transaction
-        transactions_collection.insert_one({
-            "userId": user_id,
-            "type": "MATCHING_INCOME",
-            "amount": income,
-            "description": f"Binary matching income - {today_pv} PV @ ₹{matching_income_rate}/PV",
-            "pv": today_pv,
-            "status": "COMPLETED",
-            "createdAt": get_ist_now()
-        })
-        
-        # Flush matched PV from both sides
-        # Note: We deduct matched_pv (not today_pv) to properly flush the matched pairs
-        # Even if daily capping limits income, the matched PV should be removed
-        # Example: left=14, right=37, matched=14, daily_cap=10
-        # Income = 10 * 25 = ₹250, but we flush 14 from each side
-        # Result: left=0, right=23, totalPV+=14, dailyPVUsed=10
-        users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {
-                "$inc": {
-                    "leftPV": -matched_pv,
-                    "rightPV": -matched_pv,
-                    "totalPV": matched_pv  # totalPV = lifetime PV matched (not capped)
-                },
-                "$set": {
-                    "lastMatchingDate": today_date,
-                    "dailyPVUsed": daily_pv_used + today_pv,
-                    "updatedAt": get_ist_now()
-                }
-            }
-        )
-        
-        print(f"Matching income calculated for {user_id}: {income} (PV: {today_pv})")
+        for detail in result["details"]:
+            print(f"Matching income calculated for {user_id}: {detail['income']} (PV: {detail['matchedPV']})")
         
     except Exception as e:
         print(f"Error in matching income calculation: {str(e)}")
 
 
-def process_eod_matching_for_all_users():
+def process_eod_matching_for_all_users(run: Optional[dict] = None):
     """
     Process EOD matching calculation for all active users
-    This runs the matching calculation and carry forward logic
+    With an eod_runs document the run is sharded across EOD_WORKERS processes
+    and checkpointed on that document, so a restarted run resumes where it
+    stopped. Either way no user is paid twice for the same run date.
     """
     try:
-        # Get all active users with a plan
-        active_users = list(users_collection.find({
-            "isActive": True,
-            "currentPlan": {"$ne": None}
-        }))
-        
-        processed_count = 0
-        total_income = 0
-        
-        for user in active_users:
-            try:
-                user_id = str(user["_id"])
-                left_pv = user.get("leftPV", 0)
-                right_pv = user.get("rightPV", 0)
-                
-                # Only process if both sides have PV
-                if left_pv > 0 and right_pv > 0:
-                    # Get pre-calculation balance
-                    wallet = wallets_collection.find_one({"userId": user_id})
-                    pre_balance = wallet.get("balance", 0) if wallet else 0
-                    
-                    # Calculate matching income
-                    calculate_matching_income(user_id)
-                    
-                    # Get post-calculation balance
-                    wallet = wallets_collection.find_one({"userId": user_id})
-                    post_balance = wallet.get("balance", 0) if wallet else 0
-                    
-                    income_earned = post_balance - pre_balance
-                    if income_earned > 0:
-                        total_income += income_earned
-                        processed_count += 1
-                        
-            except Exception as user_error:
-                print(f"Error processing user {user.get('referralId')}: {str(user_error)}")
-                continue
+        now = get_ist_now()
+        if run is None:
+            result = run_matching(
+                users_collection, wallets_collection, transactions_collection, plans_collection,
+                now, include_details=False, run_date=run_date_for(now),
+                user_stats_collection=user_stats_collection,
+                daily_stats_collection=daily_stats_collection
+            )
+            return {
+                "processedUsers": result["totalUsersProcessed"],
+                "totalIncomeDistributed": result["totalIncomePaid"],
+                "timestamp": get_ist_now().isoformat()
+            }
         
+        result = run_sharded_matching(
+            db, MONGO_URL, MONGO_DB_NAME, eod_runs_collection, run["_id"],
+            now, run["runDate"], workers=EOD_WORKERS
+        )
         return {
-            "processedUsers": processed_count,
-            "totalIncomeDistributed": total_income,
+            "processedUsers": result["paidUsers"],
+            "totalIncomeDistributed": result["income"],
+            "shards": result["shards"],
+            "resumedShards": result["resumedShards"],
+            "workers": result["workers"],
             "timestamp": get_ist_now().isoformat()
         }
         
@@ -2084,61 +2082,97 @@ def process_eod_matching_for_all_users():
 def process_carry_forward():
     """
     Process carry forward of unmatched PV to next day
-    In binary MLM, unmatched PV (the difference) carries forward
+    In binary MLM, unmatched PV (the difference) carries forward; matching
+    already flushed the matched PV, so only dailyPVUsed is reset here
     """
     try:
-        # Get all active users
-        active_users = list(users_collection.find({
-            "isActive": True,
-            "currentPlan": {"$ne": None}
-        }))
-        
-        carried_forward_count = 0
-        
-        for user in active_users:
-            try:
-                user_id = str(user["_id"])
-                left_pv = user.get("leftPV", 0)
-                right_pv = user.get("rightPV", 0)
-                
-                # Calculate carry forward (weaker leg's remaining PV after matching)
-                matched_pv = min(left_pv, right_pv)
-                
-                # After matching, subtract matched PV from both sides
-                # Stronger leg retains the difference (carry forward)
-                # This is already handled in calculate_matching_income
-                
-                # Reset daily PV used at EOD
-                users_collection.update_one(
-                    {"_id": user["_id"]},
-                    {
-                        "$set": {
-                            "dailyPVUsed": 0,
-                            "lastEODProcessed": get_ist_now(),
-                            "updatedAt": get_ist_now()
-                        }
-                    }
-                )
-                carried_forward_count += 1
-                
-            except Exception as user_error:
-                print(f"Error in carry forward for user {user.get('referralId')}: {str(user_error)}")
-                continue
-        
-        return {"usersProcessed": carried_forward_count}
+        result = reset_carry_forward(users_collection, get_ist_now())
+        return {"usersProcessed": result["matched"]}
         
     except Exception as e:
         print(f"Error in carry forward process: {str(e)}")
         return {"error": str(e)}
 
 
+# Worker processes used for sharded EOD matching
+EOD_WORKERS = int(os.getenv("EOD_WORKERS", os.cpu_count() or 1))
+
+
+def eod_matching_stage(context: dict):
+    """Pipeline stage: sharded, checkpointed binary matching"""
+    matching = process_eod_matching_for_all_users(context["run"])
+    if "error" in matching:
+        raise RuntimeError(matching["error"])
+    return {"touched": matching["processedUsers"], **matching}
+
+
+# Nightly stages, in order. Each one is timed and recorded on the eod_runs
+# document (see app/services/eod_pipeline.py); add new stages here.
+eod_pipeline = (
+    EODPipeline(eod_runs_collection, get_ist_now)
+    .add_stage("matching", eod_matching_stage)
+    .add_stage("carryForwardReset", lambda context: reset_carry_forward(
+        users_collection, context["now"]
+    ))
+    .add_stage("dailyStats", lambda context: rollup_daily_stats(
+        daily_stats_collection, users_collection, topups_collection, withdrawals_collection,
+        transactions_collection, context["runDate"], context["now"]
+    ))
+    .add_stage("pvSnapshot", lambda context: snapshot_pv(
+        users_collection, pv_snapshots_collection.name, context["runDate"], context["now"]
+    ))
+)
+
+
+def run_eod_pipeline(run: dict):
+    """
+    Full end-of-day pipeline for one eod_runs document.
+    Raises on failure so the run is recorded as FAILED.
+    """
+    results = eod_pipeline.run(run)
+    return {name: result.get("touched", 0) for name, result in results.items() if result}
+
+
+# Fires run_eod_pipeline at settings.eodTime (IST, honouring systemTimeOffset).
+# Started in startup_event; one worker holds the lease (see app/services/eod_scheduler.py)
+eod_scheduler = EODScheduler(
+    eod_runs_collection,
+    scheduler_leases_collection,
+    run_pipeline=run_eod_pipeline,
+    get_now=get_ist_now,
+    get_eod_time=get_eod_time,
+    enabled=os.getenv("EOD_SCHEDULER_ENABLED", "true").lower() == "true"
+)
+
+
+# PV snapshot for the EOD simulator (arrays only, no user identities).
+# Reused across what-if requests until it is older than the TTL.
+SIMULATION_SNAPSHOT_TTL_SECONDS = 300
+simulation_snapshot_lock = threading.Lock()
+simulation_snapshot = {"snapshot": None, "takenAt": None, "loadedAt": 0.0}
+
+
+def get_simulation_snapshot(refresh: bool = False):
+    """Return (snapshot, takenAt), reloading it when stale or on request"""
+    with simulation_snapshot_lock:
+        age = time.monotonic() - simulation_snapshot["loadedAt"]
+        if refresh or simulation_snapshot["snapshot"] is None or age > SIMULATION_SNAPSHOT_TTL_SECONDS:
+            now = get_ist_now()
+            simulation_snapshot["snapshot"] = load_snapshot(
+                users_collection, plans_collection, now, identity=False
+            )
+            simulation_snapshot["takenAt"] = now
+            simulation_snapshot["loadedAt"] = time.monotonic()
+        return simulation_snapshot["snapshot"], simulation_snapshot["takenAt"]
+
+
 # ==================== WALLET & TRANSACTIONS ====================
 
 @app.get("/api/wallet/balance")
 async def get_wallet_balance(current_user: dict = Depends(get_current_active_user)):
     """Get wallet balance"""
     try:
-        wallet = wallets_collection.find_one({"userId": current_user["id"]})
+        wallet = await repos.wallets.get(current_user["id"])
         if not wallet:
             return {
                 "success": True,
@@ -2165,14 +2199,10 @@ async def get_transactions(
     """Get user transactions (excluding PLAN_ACTIVATION)"""
     try:
         # Exclude PLAN_ACTIVATION transactions (admin income, not user income)
-        query = {
-            "userId": current_user["id"],
-            "type": {"$ne": "PLAN_ACTIVATION"}
-        }
-        
-        transactions = list(transactions_collection.find(query).sort("createdAt", DESCENDING).skip(skip).limit(limit))
-        
-        total = transactions_collection.count_documents(query)
+        transactions, total = await asyncio.gather(
+            repos.transactions.for_user(current_user["id"], ["PLAN_ACTIVATION"], skip=skip, limit=limit),
+            repos.transactions.count_for_user(current_user["id"], ["PLAN_ACTIVATION"])
+        )
         
         return {
             "success": True,
@@ -2200,8 +2230,7 @@ async def create_withdrawal_request(
             raise HTTPException(status_code=400, detail="Invalid amount")
         
         # Get minimum withdraw limit from settings
-        settings = settings_collection.find_one({})
-        minimum_withdraw_limit = int(settings.get("minimumWithdrawLimit", 1000)) if settings else 1000
+        minimum_withdraw_limit = settings_cache.minimum_withdraw_limit()
         
         if amount < minimum_withdraw_limit:
             raise HTTPException(status_code=400, detail=f"Minimum withdrawal amount is ₹{minimum_withdraw_limit}")
@@ -2245,6 +2274,8 @@ async def create_withdrawal_request(
             {"userId": current_user["id"]},
             {"$inc": {"balance": -amount}}
         )
+        record_withdrawal(user_stats_collection, current_user["id"], amount, get_ist_now())
+        record_transactions(daily_stats_collection, "WITHDRAWAL_REQUEST", -amount, get_ist_now())
         
         # Create transaction
         transactions_collection.insert_one({
@@ -2271,9 +2302,7 @@ async def create_withdrawal_request(
 async def get_withdrawal_history(current_user: dict = Depends(get_current_active_user)):
     """Get withdrawal history"""
     try:
-        withdrawals = list(withdrawals_collection.find(
-            {"userId": current_user["id"]}
-        ).sort("requestedAt", DESCENDING))
+        withdrawals = await repos.withdrawals.for_user(current_user["id"])
         
         return {
             "success": True,
@@ -2285,27 +2314,13 @@ async def get_withdrawal_history(current_user: dict = Depends(get_current_active
 # ==================== SETTINGS ROUTES ====================
 
 @app.get("/api/settings/public")
-async def get_public_settings():
+async def get_public_settings(request: Request):
     """Get public settings"""
     try:
-        settings = settings_collection.find_one({})
-        if not settings:
-            # Return default settings
-            return {
-                "success": True,
-                "data": {
-                    "companyName": "VSV Unite",
-                    "companyEmail": "info@vsvunite.com",
-                    "companyPhone": "+91 9999999999",
-                    "metaTitle": "VSV Unite - MLM Platform",
-                    "metaDescription": "Join VSV Unite for transparent MLM opportunities"
-                }
-            }
-        
-        return {
+        return response_cache.respond(request, "settings", lambda: {
             "success": True,
-            "data": serialize_doc(settings)
-        }
+            "data": serialize_doc(settings_cache.public())
+        }, sources=(settings_cache,))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -2334,7 +2349,7 @@ async def get_system_time():
 async def get_settings():
     """Get all settings (admin only)"""
     try:
-        settings = settings_collection.find_one({})
+        settings = settings_cache.get()
         if not settings:
             return {"success": True, "data": {}}
         
@@ -2354,6 +2369,8 @@ async def update_general_settings(data: dict = Body(...)):
             {"$set": {**data, "updatedAt": get_ist_now()}},
             upsert=True
         )
+        settings_cache.invalidate()
+        response_cache.invalidate("settings")
         return {"success": True, "message": "Settings updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2367,6 +2384,8 @@ async def update_seo_settings(data: dict = Body(...)):
             {"$set": {**data, "updatedAt": get_ist_now()}},
             upsert=True
         )
+        settings_cache.invalidate()
+        response_cache.invalidate("settings")
         return {"success": True, "message": "SEO settings updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2380,6 +2399,8 @@ async def update_hero_settings(data: dict = Body(...)):
             {"$set": {**data, "updatedAt": get_ist_now()}},
             upsert=True
         )
+        settings_cache.invalidate()
+        response_cache.invalidate("settings")
         return {"success": True, "message": "Hero settings updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2419,7 +2440,7 @@ async def update_email_config(data: dict = Body(...)):
 async def get_ranks():
     """Get all ranks"""
     try:
-        ranks = list(ranks_collection.find({}).sort("order", ASCENDING))
+        ranks = rank_table.all()
         return {"success": True, "data": serialize_doc(ranks)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2439,6 +2460,7 @@ async def save_ranks(data: dict = Body(...)):
             for rank in ranks_data:
                 rank.pop("_id", None)
             ranks_collection.insert_many(ranks_data)
+        rank_table.invalidate()
         
         return {"success": True, "message": "Ranks updated successfully"}
     except Exception as e:
@@ -2451,6 +2473,7 @@ async def delete_rank(rank_id: str):
         result = ranks_collection.delete_one({"_id": ObjectId(rank_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Rank not found")
+        rank_table.invalidate()
         return {"success": True, "message": "Rank deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2493,7 +2516,7 @@ async def get_admin_dashboard(current_admin: dict = Depends(get_current_admin)):
         
         # Get plan names
         plan_distribution = {}
-        for plan in plans_collection.find({"isActive": True}):
+        for plan in plan_registry.all(active_only=True):
             plan_id = str(plan["_id"])
             plan_name = plan["name"]
             # Check both ObjectId and name (for legacy data)
@@ -2765,11 +2788,6 @@ async def get_all_users(
         users = list(users_collection.find(query).skip(skip).limit(limit))
         total = users_collection.count_documents(query)
         
-        # Batch fetch all plans
-        plans_list = list(plans_collection.find({}))
-        plans_map = {str(plan["_id"]): plan for plan in plans_list}
-        plans_by_name = {plan["name"]: plan for plan in plans_list}
-        
         # Batch fetch placement information from teams collection
         user_ids = [str(user["_id"]) for user in users]
         teams_data = list(teams_collection.find({"userId": {"$in": user_ids}}))
@@ -2789,20 +2807,7 @@ async def get_all_users(
             
             # Convert currentPlan ObjectId to plan name
             if user.get("currentPlan"):
-                # Try ObjectId lookup
-                plan = plans_map.get(user.get("currentPlan"))
-                if plan:
-                    user["currentPlan"] = plan.get("name")
-                else:
-                    # Try by name
-                    plan = plans_by_name.get(user.get("currentPlan"))
-                    if plan:
-                        user["currentPlan"] = plan.get("name")
-                    elif isinstance(user.get("currentPlan"), str) and len(user.get("currentPlan")) < 50:
-                        # Keep as is if it's a valid string
-                        pass
-                    else:
-                        user["currentPlan"] = None
+                user["currentPlan"] = plan_registry.name_for(user.get("currentPlan"))
         
         return {
             "success": True,
@@ -2826,10 +2831,7 @@ async def update_user_status(
         if is_active is None:
             raise HTTPException(status_code=400, detail="isActive field required")
         
-        users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": {"isActive": is_active, "updatedAt": get_ist_now()}}
-        )
+        update_user_fields(user_id, {"isActive": is_active, "updatedAt": get_ist_now()})
         
         return {
             "success": True,
@@ -2867,8 +2869,8 @@ async def update_user(
         if "currentPlan" in data:
             # Handle plan assignment/change
             if data["currentPlan"]:
-                # Find plan by name
-                plan = plans_collection.find_one({"name": data["currentPlan"]})
+                # Find plan by name (or id)
+                plan = plan_registry.resolve(data["currentPlan"])
                 if plan:
                     update_data["currentPlan"] = str(plan["_id"])
                 else:
@@ -2903,6 +2905,7 @@ async def update_user(
                 {"_id": ObjectId(user_id)},
                 {"$set": update_data}
             )
+            principal_cache.invalidate(user_id)
         
         return {
             "success": True,
@@ -2929,7 +2932,7 @@ async def reset_user_password(
         if not new_password or len(new_password) < 6:
             raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
         
-        hashed_password = hash_password(new_password)
+        hashed_password = await hash_password(new_password)
         users_collection.update_one(
             {"_id": ObjectId(user_id)},
             {"$set": {"password": hashed_password, "updatedAt": get_ist_now()}}
@@ -2961,14 +2964,32 @@ async def delete_user(
         # Delete user's transactions
         transactions_collection.delete_many({"userId": user_id})
         
-        # Delete user's team entries
+        # Detach the user's downline from the upline paths, then delete team entries
+        upline = get_ancestor_path(teams_collection, user_id)
+        clear_extreme_leaf_pointers(users_collection, upline)
+        adjust_leg_counters(
+            users_collection,
+            upline,
+            -(1 + user.get("leftCount", 0) + user.get("rightCount", 0)),
+            -((1 if user.get("isActive") else 0) + user.get("leftActiveCount", 0) + user.get("rightActiveCount", 0))
+        )
+        truncate_ancestor_paths(teams_collection, user_id)
         teams_collection.delete_many({"userId": user_id})
+        tree_index.remove(user_id)
         
-        # Delete user's withdrawals
+        # Delete user's withdrawals and dashboard stats
         withdrawals_collection.delete_many({"userId": user_id})
+        user_stats_collection.delete_one({"userId": user_id})
+        if user.get("role") == "user" and isinstance(user.get("createdAt"), datetime):
+            record_registration(daily_stats_collection, pytz.utc.localize(user["createdAt"]), delta=-1)
+        if user.get("sponsorId"):
+            sponsor = users_collection.find_one({"referralId": user["sponsorId"]}, {"_id": 1})
+            if sponsor:
+                record_referral(user_stats_collection, str(sponsor["_id"]), get_ist_now(), delta=-1)
         
         # Delete user
         users_collection.delete_one({"_id": ObjectId(user_id)})
+        principal_cache.invalidate(user_id)
         
         return {
             "success": True,
@@ -3050,6 +3071,8 @@ async def approve_withdrawal(
             {"userId": withdrawal["userId"]},
             {"$inc": {"totalWithdrawals": withdrawal["amount"]}}
         )
+        record_withdrawal(user_stats_collection, withdrawal["userId"], withdrawal["amount"], get_ist_now(), pending=False)
+        record_payout(daily_stats_collection, withdrawal["amount"], get_ist_now())
         
         # Update transaction
         transactions_collection.update_one(
@@ -3101,6 +3124,7 @@ async def reject_withdrawal(
             {"userId": withdrawal["userId"]},
             {"$inc": {"balance": withdrawal["amount"]}}
         )
+        record_withdrawal(user_stats_collection, withdrawal["userId"], withdrawal["amount"], get_ist_now(), pending=False)
         
         # Update transaction
         transactions_collection.update_one(
@@ -3118,14 +3142,13 @@ async def reject_withdrawal(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/admin/plans")
-async def get_admin_plans(current_admin: dict = Depends(get_current_admin)):
+async def get_admin_plans(request: Request, current_admin: dict = Depends(get_current_admin)):
     """Get all plans (admin)"""
     try:
-        plans = list(plans_collection.find({}))
-        return {
+        return response_cache.respond(request, "plans", lambda: {
             "success": True,
-            "data": serialize_doc(plans)
-        }
+            "data": serialize_doc(plan_registry.all())
+        }, cache_control="private, no-cache", sources=(plan_registry,))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -3144,6 +3167,8 @@ async def create_plan(
         }
         
         result = plans_collection.insert_one(plan_data)
+        plan_registry.invalidate()
+        response_cache.invalidate("plans")
         
         return {
             "success": True,
@@ -3167,6 +3192,8 @@ async def update_plan(
             {"_id": ObjectId(plan_id)},
             {"$set": data}
         )
+        plan_registry.invalidate()
+        response_cache.invalidate("plans")
         
         return {
             "success": True,
@@ -3183,7 +3210,7 @@ async def delete_plan(
 ):
     """Delete plan (admin only)"""
     try:
-        plan = plans_collection.find_one({"_id": ObjectId(plan_id)})
+        plan = plan_registry.by_id(plan_id)
         if not plan:
             raise HTTPException(status_code=404, detail="Plan not found")
         
@@ -3196,6 +3223,8 @@ async def delete_plan(
             )
         
         plans_collection.delete_one({"_id": ObjectId(plan_id)})
+        plan_registry.invalidate()
+        response_cache.invalidate("plans")
         
         return {
             "success": True,
@@ -3248,11 +3277,6 @@ async def get_all_topups(
         users_list = list(users_collection.find({"_id": {"$in": user_ids}})) if user_ids else []
         users_map = {str(user["_id"]): user for user in users_list}
         
-        # Batch fetch plans
-        plan_ids = [ObjectId(t["planId"]) for t in topups if t.get("planId")]
-        plans_list = list(plans_collection.find({"_id": {"$in": plan_ids}})) if plan_ids else []
-        plans_map = {str(plan["_id"]): plan for plan in plans_list}
-        
         # Enrich with user and plan details
         for topup in topups:
             if topup.get("userId"):
@@ -3263,7 +3287,7 @@ async def get_all_topups(
                     topup["referralId"] = user.get("referralId")
             
             if topup.get("planId"):
-                plan = plans_map.get(topup["planId"])
+                plan = plan_registry.by_id(topup["planId"])
                 if plan:
                     topup["planName"] = plan.get("name")
         
@@ -3292,7 +3316,7 @@ async def approve_topup(
         plan_id = topup["planId"]
         
         # Get plan details
-        plan = plans_collection.find_one({"_id": ObjectId(plan_id)})
+        plan = plan_registry.by_id(plan_id)
         if not plan:
             raise HTTPException(status_code=404, detail="Plan not found")
         
@@ -3341,6 +3365,8 @@ async def approve_topup(
                 },
                 upsert=True
             )
+            record_credit(user_stats_collection, admin_id, plan["amount"], "PLAN_ACTIVATION", get_ist_now())
+        record_plan_activation(daily_stats_collection, plan["name"], plan["amount"], get_ist_now())
         
         # Distribute PV upward in the binary tree
         pv_amount = plan.get("pv", 0)
@@ -3358,6 +3384,7 @@ async def approve_topup(
                 }
             }
         )
+        record_topup(daily_stats_collection, topup.get("amount", 0), get_ist_now())
         
         # REFERRAL INCOME REMOVED - No longer giving referral income to sponsor
         # user = users_collection.find_one({"_id": ObjectId(user_id)})
@@ -3455,21 +3482,16 @@ async def get_dashboard_reports(
             "currentPlan": {"$exists": True, "$ne": None, "$ne": ""}
         })
         
+        # Lifetime totals from the per-day business figures
+        totals = lifetime_totals(daily_stats_collection)
+        
         # Total earnings (sum of all credit transactions)
-        total_earnings_pipeline = [
-            {"$match": {"amount": {"$gt": 0}}},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]
-        total_earnings_result = list(transactions_collection.aggregate(total_earnings_pipeline))
-        total_earnings = total_earnings_result[0]["total"] if total_earnings_result else 0
+        total_earnings = sum(
+            transactions["amount"] for transactions in totals["transactions"].values() if transactions["amount"] > 0
+        )
         
         # Total withdrawals
-        total_withdrawals_pipeline = [
-            {"$match": {"status": "APPROVED"}},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]
-        total_withdrawals_result = list(withdrawals_collection.aggregate(total_withdrawals_pipeline))
-        total_withdrawals = total_withdrawals_result[0]["total"] if total_withdrawals_result else 0
+        total_withdrawals = totals["payouts"]["amount"]
         
         # Pending withdrawals
         pending_withdrawals = withdrawals_collection.count_documents({"status": "PENDING"})
@@ -3480,78 +3502,41 @@ async def get_dashboard_reports(
         pending_withdrawals_amount_result = list(withdrawals_collection.aggregate(pending_withdrawals_amount_pipeline))
         pending_withdrawals_amount = pending_withdrawals_amount_result[0]["total"] if pending_withdrawals_amount_result else 0
         
-        # Plan distribution
-        plan_distribution = {}
-        for plan in plans_collection.find():
-            # Count users with this plan (handle both ObjectId and string formats)
-            plan_id_str = str(plan["_id"])
-            count = users_collection.count_documents({
-                "$or": [
-                    {"currentPlan": plan_id_str},
-                    {"currentPlan": plan["_id"]},
-                    {"currentPlan": plan["name"]}
-                ]
-            })
-            plan_distribution[plan["name"]] = count
-        
-        # Recent registrations (last 7 days)
-        seven_days_ago = get_ist_now() - timedelta(days=7)
-        recent_registrations = users_collection.count_documents({
-            "role": "user",
-            "createdAt": {"$gte": seven_days_ago}
-        })
-        
-        # Daily business report (last 7 days)
-        daily_reports = []
-        for i in range(6, -1, -1):
-            day_start = get_ist_now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=i)
-            day_end = day_start + timedelta(days=1)
-            
-            # New users on this day
-            new_users = users_collection.count_documents({
-                "role": "user",
-                "createdAt": {"$gte": day_start, "$lt": day_end}
-            })
-            
-            # Topups on this day
-            topups_pipeline = [
-                {"$match": {
-                    "status": "APPROVED",
-                    "approvedAt": {"$gte": day_start, "$lt": day_end}
-                }},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            topups_result = list(topups_collection.aggregate(topups_pipeline))
-            topups_amount = topups_result[0]["total"] if topups_result else 0
-            
-            # Payouts on this day
-            payouts_pipeline = [
-                {"$match": {
-                    "status": "APPROVED",
-                    "approvedAt": {"$gte": day_start, "$lt": day_end}
-                }},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            payouts_result = list(withdrawals_collection.aggregate(payouts_pipeline))
-            payouts_amount = payouts_result[0]["total"] if payouts_result else 0
-            
-            daily_reports.append({
-                "date": day_start.strftime("%Y-%m-%d"),
-                "newUsers": new_users,
-                "topups": topups_amount,
-                "payouts": payouts_amount,
-                "netBusiness": topups_amount - payouts_amount
-            })
+        # Plan distribution (currentPlan holds a plan id or, for legacy users, its name)
+        plan_distribution = {plan["name"]: 0 for plan in plan_registry.all()}
+        for row in users_collection.aggregate([
+            {"$match": {"currentPlan": {"$nin": [None, ""]}}},
+            {"$group": {"_id": "$currentPlan", "count": {"$sum": 1}}}
+        ]):
+            plan = plan_registry.resolve(row["_id"])
+            if plan and plan.get("name") in plan_distribution:
+                plan_distribution[plan["name"]] += row["count"]
+        
+        # Daily business report (last 7 days, IST)
+        today = get_ist_now()
+        days = get_daily_stats(
+            daily_stats_collection,
+            (today - timedelta(days=6)).strftime("%Y-%m-%d"),
+            today.strftime("%Y-%m-%d")
+        )
+        recent_registrations = sum(day["newUsers"] for day in days)
+        daily_reports = [
+            {
+                "date": day["date"],
+                "newUsers": day["newUsers"],
+                "topups": day["topups"]["amount"],
+                "payouts": day["payouts"]["amount"],
+                "netBusiness": day["topups"]["amount"] - day["payouts"]["amount"],
+                "planActivations": sum(plan["count"] for plan in day["planActivations"].values())
+            }
+            for day in days
+        ]
         
         # Income breakdown
-        income_types = {}
-        for income_type in ["REFERRAL_INCOME", "MATCHING_INCOME", "LEVEL_INCOME"]:
-            pipeline = [
-                {"$match": {"type": income_type}},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            result = list(transactions_collection.aggregate(pipeline))
-            income_types[income_type] = result[0]["total"] if result else 0
+        income_types = {
+            income_type: totals["transactions"].get(income_type, {}).get("amount", 0)
+            for income_type in ["REFERRAL_INCOME", "MATCHING_INCOME", "LEVEL_INCOME"]
+        }
         
         # Recent users
         recent_users = list(users_collection.find(
@@ -3590,6 +3575,7 @@ async def get_all_users_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get all members report with optional date filter"""
@@ -3609,11 +3595,6 @@ async def get_all_users_report(
         if not users:
             return {"success": True, "data": [], "total": 0}
         
-        # Batch fetch plans
-        plans_list = list(plans_collection.find({}))
-        plans_map = {str(plan["_id"]): plan for plan in plans_list}
-        plans_by_name = {plan["name"]: plan for plan in plans_list}
-        
         # Batch fetch wallets
         user_ids = [str(user["_id"]) for user in users]
         wallets_list = list(wallets_collection.find({"userId": {"$in": user_ids}}))
@@ -3622,19 +3603,7 @@ async def get_all_users_report(
         # Format data
         report_data = []
         for user in users:
-            plan_name = "No Plan"
-            if user.get("currentPlan"):
-                # Try ObjectId lookup
-                plan = plans_map.get(user.get("currentPlan"))
-                if plan:
-                    plan_name = plan.get("name", "No Plan")
-                else:
-                    # Try by name
-                    plan = plans_by_name.get(user.get("currentPlan"))
-                    if plan:
-                        plan_name = plan.get("name", "No Plan")
-                    elif isinstance(user.get("currentPlan"), str):
-                        plan_name = user.get("currentPlan")
+            plan_name = plan_registry.name_for(user.get("currentPlan"), "No Plan")
             
             wallet = wallets_map.get(str(user["_id"]))
             balance = wallet.get("balance", 0) if wallet else 0
@@ -3653,12 +3622,7 @@ async def get_all_users_report(
         
         if format == "excel":
             headers = ["Referral ID", "Name", "Email", "Mobile", "Sponsor ID", "Current Plan", "Status", "Wallet Balance", "Joined Date"]
-            output = generate_excel_report(report_data, headers, "All Members Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=all_members_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "All Members Report", "all_members", current_admin)
         elif format == "pdf":
             headers = ["Referral ID", "Name", "Email", "Current Plan", "Status", "Balance", "Joined"]
             pdf_data = []
@@ -3672,12 +3636,7 @@ async def get_all_users_report(
                     "Balance": item["Wallet Balance"],
                     "Joined": item["Joined Date"]
                 })
-            output = generate_pdf_report(pdf_data, headers, "All Members Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=all_members_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, pdf_data, headers, "All Members Report", "all_members", current_admin)
         else:
             return {"success": True, "data": report_data, "total": len(report_data)}
     
@@ -3691,6 +3650,7 @@ async def get_active_inactive_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get active/inactive users breakdown"""
@@ -3726,20 +3686,10 @@ async def get_active_inactive_report(
         
         if format == "excel":
             headers = ["Referral ID", "Name", "Email", "Status", "Joined Date"]
-            output = generate_excel_report(report_data, headers, "Active/Inactive Users Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=active_inactive_users_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Active/Inactive Users Report", "active_inactive_users", current_admin)
         elif format == "pdf":
             headers = ["Referral ID", "Name", "Email", "Status", "Joined Date"]
-            output = generate_pdf_report(report_data, headers, "Active/Inactive Users Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=active_inactive_users_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, report_data, headers, "Active/Inactive Users Report", "active_inactive_users", current_admin)
         else:
             return {
                 "success": True,
@@ -3762,6 +3712,7 @@ async def get_users_by_plan_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get users by plan type"""
@@ -3784,16 +3735,9 @@ async def get_users_by_plan_report(
         
         users = list(users_collection.find(query, {"password": 0}))
         
-        report_data = []
-        for user in users:
-            plan_name = "No Plan"
-            if user.get("currentPlan"):
-                try:
-                    plan = plans_collection.find_one({"_id": ObjectId(user["currentPlan"])})
-                    if plan:
-                        plan_name = plan.get("name", "No Plan")
-                except:
-                    pass
+        report_data = []
+        for user in users:
+            plan_name = plan_registry.name_for(user.get("currentPlan"), "No Plan")
             
             report_data.append({
                 "Referral ID": user.get("referralId", ""),
@@ -3806,20 +3750,10 @@ async def get_users_by_plan_report(
         
         if format == "excel":
             headers = ["Referral ID", "Name", "Email", "Plan", "Status", "Joined Date"]
-            output = generate_excel_report(report_data, headers, "Users by Plan Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=users_by_plan_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Users by Plan Report", "users_by_plan", current_admin)
         elif format == "pdf":
             headers = ["Referral ID", "Name", "Email", "Plan", "Status", "Joined Date"]
-            output = generate_pdf_report(report_data, headers, "Users by Plan Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=users_by_plan_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, report_data, headers, "Users by Plan Report", "users_by_plan", current_admin)
         else:
             return {"success": True, "data": report_data, "total": len(report_data)}
     
@@ -3835,6 +3769,7 @@ async def get_earnings_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get earnings summary report"""
@@ -3865,21 +3800,11 @@ async def get_earnings_report(
         
         if format == "excel":
             headers = ["Date", "User", "Referral ID", "Type", "Amount", "Description"]
-            output = generate_excel_report(report_data, headers, "Earnings Summary Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=earnings_report_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Earnings Summary Report", "earnings_report", current_admin)
         elif format == "pdf":
             headers = ["Date", "User", "Referral ID", "Type", "Amount"]
             pdf_data = [{k: v for k, v in item.items() if k != "Description"} for item in report_data]
-            output = generate_pdf_report(pdf_data, headers, "Earnings Summary Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=earnings_report_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, pdf_data, headers, "Earnings Summary Report", "earnings_report", current_admin)
         else:
             total_earnings = sum([txn.get("amount", 0) for txn in transactions])
             return {
@@ -3901,6 +3826,7 @@ async def get_income_breakdown_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get income breakdown by type"""
@@ -3937,20 +3863,10 @@ async def get_income_breakdown_report(
         
         if format == "excel":
             headers = ["Income Type", "Transaction Count", "Total Amount"]
-            output = generate_excel_report(report_data, headers, "Income Breakdown Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=income_breakdown_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Income Breakdown Report", "income_breakdown", current_admin)
         elif format == "pdf":
             headers = ["Income Type", "Transaction Count", "Total Amount"]
-            output = generate_pdf_report(report_data, headers, "Income Breakdown Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=income_breakdown_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, report_data, headers, "Income Breakdown Report", "income_breakdown", current_admin)
         else:
             return {"success": True, "data": report_data, "breakdown": breakdown}
     
@@ -3965,6 +3881,7 @@ async def get_withdrawals_report(
     end_date: Optional[str] = None,
     status: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get withdrawals/payout history report"""
@@ -3998,21 +3915,11 @@ async def get_withdrawals_report(
         
         if format == "excel":
             headers = ["Date", "User", "Referral ID", "Amount", "Status", "Approved Date"]
-            output = generate_excel_report(report_data, headers, "Withdrawals Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=withdrawals_report_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Withdrawals Report", "withdrawals_report", current_admin)
         elif format == "pdf":
             headers = ["Date", "User", "Referral ID", "Amount", "Status"]
             pdf_data = [{k: v for k, v in item.items() if k != "Approved Date"} for item in report_data]
-            output = generate_pdf_report(pdf_data, headers, "Withdrawals Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=withdrawals_report_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, pdf_data, headers, "Withdrawals Report", "withdrawals_report", current_admin)
         else:
             total_amount = sum([w.get("amount", 0) for w in withdrawals])
             return {
@@ -4034,6 +3941,7 @@ async def get_topups_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get topups history report"""
@@ -4064,20 +3972,10 @@ async def get_topups_report(
         
         if format == "excel":
             headers = ["Date", "User", "Referral ID", "Amount", "Status", "Payment Method"]
-            output = generate_excel_report(report_data, headers, "Topups Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=topups_report_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Topups Report", "topups_report", current_admin)
         elif format == "pdf":
             headers = ["Date", "User", "Referral ID", "Amount", "Status", "Payment Method"]
-            output = generate_pdf_report(report_data, headers, "Topups Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=topups_report_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, report_data, headers, "Topups Report", "topups_report", current_admin)
         else:
             total_amount = sum([t.get("amount", 0) for t in topups])
             return {
@@ -4099,6 +3997,7 @@ async def get_business_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get daily/weekly/monthly business report"""
@@ -4106,64 +4005,29 @@ async def get_business_report(
         start, end = parse_date_range(start_date, end_date)
         
         if not start:
-            start = datetime.now() - timedelta(days=30)
+            start = get_ist_now() - timedelta(days=30)
         if not end:
-            end = datetime.now()
+            end = get_ist_now()
         
         # Generate daily reports
         daily_reports = []
-        current_date = start
-        while current_date <= end:
-            day_end = current_date.replace(hour=23, minute=59, second=59)
-            
-            # New registrations
-            new_users = users_collection.count_documents({
-                "role": "user",
-                "createdAt": {"$gte": current_date, "$lte": day_end}
-            })
-            
-            # Topups
-            topups_pipeline = [
-                {"$match": {"status": "APPROVED", "approvedAt": {"$gte": current_date, "$lte": day_end}}},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            topups_result = list(topups_collection.aggregate(topups_pipeline))
-            topups_amount = topups_result[0]["total"] if topups_result else 0
-            
-            # Payouts
-            payouts_pipeline = [
-                {"$match": {"status": "APPROVED", "approvedAt": {"$gte": current_date, "$lte": day_end}}},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            payouts_result = list(withdrawals_collection.aggregate(payouts_pipeline))
-            payouts_amount = payouts_result[0]["total"] if payouts_result else 0
-            
+        for day in get_daily_stats(daily_stats_collection, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")):
+            topups_amount = day["topups"]["amount"]
+            payouts_amount = day["payouts"]["amount"]
             daily_reports.append({
-                "Date": current_date.strftime("%d-%m-%Y"),
-                "New Users": new_users,
+                "Date": datetime.strptime(day["date"], "%Y-%m-%d").strftime("%d-%m-%Y"),
+                "New Users": day["newUsers"],
                 "Topups": f"₹{topups_amount}",
                 "Payouts": f"₹{payouts_amount}",
                 "Net Business": f"₹{topups_amount - payouts_amount}"
             })
-            
-            current_date += timedelta(days=1)
         
         if format == "excel":
             headers = ["Date", "New Users", "Topups", "Payouts", "Net Business"]
-            output = generate_excel_report(daily_reports, headers, "Daily Business Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=business_report_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, daily_reports, headers, "Daily Business Report", "business_report", current_admin)
         elif format == "pdf":
             headers = ["Date", "New Users", "Topups", "Payouts", "Net Business"]
-            output = generate_pdf_report(daily_reports, headers, "Daily Business Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=business_report_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, daily_reports, headers, "Daily Business Report", "business_report", current_admin)
         else:
             return {"success": True, "data": daily_reports, "total": len(daily_reports)}
     
@@ -4177,6 +4041,7 @@ async def get_business_report(
 @app.get("/api/admin/reports/team/structure")
 async def get_team_structure_report(
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get complete team structure report"""
@@ -4200,21 +4065,11 @@ async def get_team_structure_report(
         
         if format == "excel":
             headers = ["User ID", "User Name", "Sponsor ID", "Sponsor Name", "Placement", "Joined Date"]
-            output = generate_excel_report(report_data, headers, "Team Structure Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=team_structure_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Team Structure Report", "team_structure", current_admin)
         elif format == "pdf":
             headers = ["User ID", "User Name", "Sponsor ID", "Sponsor Name", "Placement"]
             pdf_data = [{k: v for k, v in item.items() if k != "Joined Date"} for item in report_data]
-            output = generate_pdf_report(pdf_data, headers, "Team Structure Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=team_structure_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, pdf_data, headers, "Team Structure Report", "team_structure", current_admin)
         else:
             return {"success": True, "data": report_data, "total": len(report_data)}
     
@@ -4223,69 +4078,50 @@ async def get_team_structure_report(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def build_downline_rows(referral_id: Optional[str] = None) -> list:
+    """Downline report rows for one member (by referral ID) or every member"""
+    # One pass over all team edges gives direct/total counts for every member
+    counts = compute_downline_counts(
+        teams_collection.find({}, {"_id": 0, "userId": 1, "sponsorId": 1})
+    )
+    
+    user_query = {"referralId": referral_id} if referral_id else {"role": "user"}
+    users_to_check = users_collection.find(
+        user_query,
+        {"referralId": 1, "name": 1, "isActive": 1}
+    ).sort("_id", ASCENDING)
+    
+    report_data = []
+    for user in users_to_check:
+        direct_count, total_downline = counts.get(str(user["_id"]), (0, 0))
+        
+        report_data.append({
+            "Referral ID": user.get("referralId", ""),
+            "Name": user.get("name", ""),
+            "Direct Downline": direct_count,
+            "Total Downline": total_downline,
+            "Status": "Active" if user.get("isActive", False) else "Inactive"
+        })
+    return report_data
+
 @app.get("/api/admin/reports/team/downline")
 async def get_downline_report(
     referral_id: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get downline summary for a specific user or all users"""
     try:
-        if referral_id:
-            users_to_check = [users_collection.find_one({"referralId": referral_id})]
-        else:
-            users_to_check = list(users_collection.find({"role": "user"}))
-        
-        report_data = []
-        for user in users_to_check:
-            if not user:
-                continue
-                
-            user_id = user.get("referralId", "")
-            
-            # Count direct downline
-            direct_count = teams_collection.count_documents({"sponsorId": user_id})
-            
-            # Get all downline recursively
-            def get_all_downline(sponsor_id, visited=None):
-                if visited is None:
-                    visited = set()
-                if sponsor_id in visited:
-                    return []
-                visited.add(sponsor_id)
-                
-                direct = list(teams_collection.find({"sponsorId": sponsor_id}))
-                all_downline = direct.copy()
-                for member in direct:
-                    all_downline.extend(get_all_downline(member.get("userId"), visited))
-                return all_downline
-            
-            total_downline = len(get_all_downline(user_id))
-            
-            report_data.append({
-                "Referral ID": user_id,
-                "Name": user.get("name", ""),
-                "Direct Downline": direct_count,
-                "Total Downline": total_downline,
-                "Status": "Active" if user.get("isActive", False) else "Inactive"
-            })
+        # Whole-network scan: runs in a thread so other requests keep being served
+        report_data = await asyncio.to_thread(build_downline_rows, referral_id)
         
         if format == "excel":
             headers = ["Referral ID", "Name", "Direct Downline", "Total Downline", "Status"]
-            output = generate_excel_report(report_data, headers, "Downline Summary Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=downline_summary_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Downline Summary Report", "downline_summary", current_admin)
         elif format == "pdf":
             headers = ["Referral ID", "Name", "Direct Downline", "Total Downline", "Status"]
-            output = generate_pdf_report(report_data, headers, "Downline Summary Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=downline_summary_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, report_data, headers, "Downline Summary Report", "downline_summary", current_admin)
         else:
             return {"success": True, "data": report_data, "total": len(report_data)}
     
@@ -4297,34 +4133,39 @@ async def get_downline_report(
 @app.get("/api/admin/reports/team/binary-tree")
 async def get_binary_tree_export(
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Export binary tree data"""
     try:
-        teams = list(teams_collection.find({}))
+        teams = list(teams_collection.find({}, {"userId": 1, "sponsorId": 1, "placement": 1}))
+        
+        # Team records reference users by ObjectId string; load them in one query
+        users_by_id = {
+            str(u["_id"]): u
+            for u in users_collection.find(
+                {"_id": {"$in": [ObjectId(t["userId"]) for t in teams if ObjectId.is_valid(t.get("userId", ""))]}},
+                {"name": 1, "isActive": 1, "leftCount": 1, "rightCount": 1}
+            )
+        }
         
         report_data = []
         for team in teams:
-            user = users_collection.find_one({"referralId": team.get("userId")})
+            user = users_by_id.get(team.get("userId"))
             if user:
                 report_data.append({
                     "User ID": team.get("userId", ""),
                     "User Name": user.get("name", ""),
                     "Sponsor ID": team.get("sponsorId", ""),
                     "Position": team.get("placement", ""),
-                    "Left Side Count": team.get("leftCount", 0),
-                    "Right Side Count": team.get("rightCount", 0),
+                    "Left Side Count": user.get("leftCount", 0),
+                    "Right Side Count": user.get("rightCount", 0),
                     "Status": "Active" if user.get("isActive", False) else "Inactive"
                 })
         
         if format == "excel":
             headers = ["User ID", "User Name", "Sponsor ID", "Position", "Left Side Count", "Right Side Count", "Status"]
-            output = generate_excel_report(report_data, headers, "Binary Tree Data Export")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=binary_tree_data_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Binary Tree Data Export", "binary_tree_data", current_admin)
         elif format == "pdf":
             headers = ["User ID", "User Name", "Sponsor ID", "Position", "Left Count", "Right Count"]
             pdf_data = []
@@ -4337,12 +4178,7 @@ async def get_binary_tree_export(
                     "Left Count": item["Left Side Count"],
                     "Right Count": item["Right Side Count"]
                 })
-            output = generate_pdf_report(pdf_data, headers, "Binary Tree Data Export")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=binary_tree_data_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, pdf_data, headers, "Binary Tree Data Export", "binary_tree_data", current_admin)
         else:
             return {"success": True, "data": report_data, "total": len(report_data)}
     
@@ -4358,6 +4194,7 @@ async def get_registrations_trend(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get daily registrations trend"""
@@ -4365,43 +4202,24 @@ async def get_registrations_trend(
         start, end = parse_date_range(start_date, end_date)
         
         if not start:
-            start = datetime.now() - timedelta(days=30)
+            start = get_ist_now() - timedelta(days=30)
         if not end:
-            end = datetime.now()
+            end = get_ist_now()
         
-        report_data = []
-        current_date = start
-        while current_date <= end:
-            day_end = current_date.replace(hour=23, minute=59, second=59)
-            
-            count = users_collection.count_documents({
-                "role": "user",
-                "createdAt": {"$gte": current_date, "$lte": day_end}
-            })
-            
-            report_data.append({
-                "Date": current_date.strftime("%d-%m-%Y"),
-                "New Registrations": count
-            })
-            
-            current_date += timedelta(days=1)
+        report_data = [
+            {
+                "Date": datetime.strptime(day["date"], "%Y-%m-%d").strftime("%d-%m-%Y"),
+                "New Registrations": day["newUsers"]
+            }
+            for day in get_daily_stats(daily_stats_collection, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+        ]
         
         if format == "excel":
             headers = ["Date", "New Registrations"]
-            output = generate_excel_report(report_data, headers, "Daily Registrations Trend")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=registrations_trend_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Daily Registrations Trend", "registrations_trend", current_admin)
         elif format == "pdf":
             headers = ["Date", "New Registrations"]
-            output = generate_pdf_report(report_data, headers, "Daily Registrations Trend")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=registrations_trend_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, report_data, headers, "Daily Registrations Trend", "registrations_trend", current_admin)
         else:
             total_registrations = sum([r["New Registrations"] for r in report_data])
             return {
@@ -4418,11 +4236,12 @@ async def get_registrations_trend(
 @app.get("/api/admin/reports/analytics/plan-distribution")
 async def get_plan_distribution_report(
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get plan distribution analysis"""
     try:
-        plans = list(plans_collection.find({}))
+        plans = plan_registry.all()
         
         report_data = []
         total_users_with_plan = 0
@@ -4464,20 +4283,10 @@ async def get_plan_distribution_report(
         
         if format == "excel":
             headers = ["Plan Name", "Price", "User Count", "Revenue"]
-            output = generate_excel_report(report_data, headers, "Plan Distribution Analysis")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=plan_distribution_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Plan Distribution Analysis", "plan_distribution", current_admin)
         elif format == "pdf":
             headers = ["Plan Name", "Price", "User Count", "Revenue"]
-            output = generate_pdf_report(report_data, headers, "Plan Distribution Analysis")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=plan_distribution_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, report_data, headers, "Plan Distribution Analysis", "plan_distribution", current_admin)
         else:
             return {"success": True, "data": report_data, "total": len(report_data)}
     
@@ -4489,61 +4298,43 @@ async def get_plan_distribution_report(
 @app.get("/api/admin/reports/analytics/growth")
 async def get_growth_statistics(
     format: str = "json",
+    mode: str = "auto",
     current_admin: dict = Depends(get_current_admin)
 ):
     """Get growth statistics"""
     try:
-        # Monthly growth for last 12 months
-        report_data = []
+        # Monthly growth for the last 12 calendar months (IST)
+        today = get_ist_now()
+        month_starts = []
+        year, month = today.year, today.month
+        for _ in range(12):
+            month_starts.insert(0, datetime(year, month, 1))
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        
+        first_day = month_starts[0].strftime("%Y-%m-%d")
+        months = {month_start.strftime("%Y-%m"): {"newUsers": 0, "revenue": 0} for month_start in month_starts}
+        for day in get_daily_stats(daily_stats_collection, first_day, today.strftime("%Y-%m-%d")):
+            months[day["date"][:7]]["newUsers"] += day["newUsers"]
+            months[day["date"][:7]]["revenue"] += day["topups"]["amount"]
         
-        for i in range(11, -1, -1):
-            month_start = (datetime.now().replace(day=1) - timedelta(days=i*30)).replace(day=1, hour=0, minute=0, second=0)
-            if i == 0:
-                month_end = datetime.now()
-            else:
-                month_end = (datetime.now().replace(day=1) - timedelta(days=(i-1)*30)).replace(day=1, hour=0, minute=0, second=0)
-            
-            new_users = users_collection.count_documents({
-                "role": "user",
-                "createdAt": {"$gte": month_start, "$lt": month_end}
-            })
-            
-            total_users = users_collection.count_documents({
-                "role": "user",
-                "createdAt": {"$lt": month_end}
-            })
-            
-            # Calculate revenue for the month
-            topups_pipeline = [
-                {"$match": {"status": "APPROVED", "approvedAt": {"$gte": month_start, "$lt": month_end}}},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            topups_result = list(topups_collection.aggregate(topups_pipeline))
-            revenue = topups_result[0]["total"] if topups_result else 0
-            
+        report_data = []
+        total_users = lifetime_totals(daily_stats_collection, before_date=first_day)["newUsers"]
+        for month_start in month_starts:
+            figures = months[month_start.strftime("%Y-%m")]
+            total_users += figures["newUsers"]
             report_data.append({
                 "Month": month_start.strftime("%B %Y"),
-                "New Users": new_users,
+                "New Users": figures["newUsers"],
                 "Total Users": total_users,
-                "Revenue": f"₹{revenue}"
+                "Revenue": f"₹{figures['revenue']}"
             })
         
         if format == "excel":
             headers = ["Month", "New Users", "Total Users", "Revenue"]
-            output = generate_excel_report(report_data, headers, "Growth Statistics Report")
-            return StreamingResponse(
-                output,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=growth_statistics_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.xlsx"}
-            )
+            return await report_file_response("excel", mode, report_data, headers, "Growth Statistics Report", "growth_statistics", current_admin)
         elif format == "pdf":
             headers = ["Month", "New Users", "Total Users", "Revenue"]
-            output = generate_pdf_report(report_data, headers, "Growth Statistics Report")
-            return StreamingResponse(
-                output,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=growth_statistics_{datetime.now(IST).strftime('%Y%m%d_%H%M%S')}.pdf"}
-            )
+            return await report_file_response("pdf", mode, report_data, headers, "Growth Statistics Report", "growth_statistics", current_admin)
         else:
             return {"success": True, "data": report_data, "total": len(report_data)}
     
@@ -4552,6 +4343,53 @@ async def get_growth_statistics(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ============ REPORT JOBS ============
+
+@app.get("/api/admin/reports/jobs")
+async def list_report_jobs(limit: int = 20, current_admin: dict = Depends(get_current_admin)):
+    """Recent report jobs, newest first"""
+    try:
+        jobs = await report_jobs.recent(max(1, min(limit, 100)))
+        return {"success": True, "data": [report_job_view(job_view(job)) for job in jobs]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/reports/jobs/{job_id}")
+async def get_report_job(job_id: str, current_admin: dict = Depends(get_current_admin)):
+    """Status of a report job"""
+    try:
+        job = await report_jobs.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Report job not found")
+        return {"success": True, "data": report_job_view(job_view(job))}
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/reports/jobs/{job_id}/download")
+async def download_report_job(job_id: str, current_admin: dict = Depends(get_current_admin)):
+    """The rendered file of a finished report job"""
+    try:
+        job = await report_jobs.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Report job not found")
+        if job["status"] != STATUS_DONE:
+            raise HTTPException(status_code=409, detail=f"Report is {job['status']}")
+        if report_jobs.rendered_elsewhere(job):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Report was rendered on {job['host']}; REPORT_JOBS_DIR is not shared with this server"
+            )
+        path = report_jobs.file_path(job)
+        if not os.path.exists(path):
+            raise HTTPException(status_code=410, detail="Report file has expired")
+        return FileResponse(path, media_type=REPORT_FORMATS[job["format"]][0], filename=job["filename"])
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/admin/calculate-daily-matching")
 async def calculate_daily_matching_income(current_admin: dict = Depends(get_current_admin)):
     """
@@ -4559,152 +4397,132 @@ async def calculate_daily_matching_income(current_admin: dict = Depends(get_curr
     This should be called once per day (manually or via cron job)
     """
     try:
-        # Get all users with active plans (including admin)
-        users = list(users_collection.find({
-            "isActive": True,
-            "currentPlan": {"$ne": None}
-        }))
-        
-        total_processed = 0
-        total_income_paid = 0
-        results = []
-        
-        for user in users:
-            user_id = str(user["_id"])
-            left_pv = user.get("leftPV", 0)
-            right_pv = user.get("rightPV", 0)
-            
-            # Skip if no PV on either side
-            if left_pv == 0 or right_pv == 0:
-                continue
-            
-            # Calculate matching income
-            try:
-                # Get plan details
-                plan = None
-                plan_id = user.get("currentPlanId")
-                plan_value = user.get("currentPlan")
-                
-                if plan_id:
-                    # Try by currentPlanId
-                    plan = plans_collection.find_one({"_id": ObjectId(plan_id)})
-                elif plan_value:
-                    # Try by name first
-                    plan = plans_collection.find_one({"name": plan_value})
-                    if not plan:
-                        # Try as ObjectId string
-                        try:
-                            plan = plans_collection.find_one({"_id": ObjectId(plan_value)})
-                        except:
-                            pass
-                
-                if not plan:
-                    continue
-                
-                daily_capping = plan.get("dailyCapping", 500)
-                matching_income_rate = 25  # ₹25 per PV
-                
-                # Calculate matching PV
-                matched_pv = min(left_pv, right_pv)
-                
-                # Check daily capping
-                today_date = datetime.now(IST).replace(hour=0, minute=0, second=0, microsecond=0)
-                last_matching_date = user.get("lastMatchingDate")
-                
-                # Reset daily PV if new day
-                if not last_matching_date or last_matching_date.replace(hour=0, minute=0, second=0, microsecond=0) != today_date:
-                    daily_pv_used = 0
-                else:
-                    daily_pv_used = user.get("dailyPVUsed", 0)
-                
-                # Calculate maximum PV allowed today
-                max_pv_per_day = daily_capping // matching_income_rate
-                remaining_pv_today = max_pv_per_day - daily_pv_used
-                
-                if remaining_pv_today <= 0:
-                    continue  # Daily limit reached
-                
-                # Today's PV = min(matched_pv, remaining_pv_today)
-                today_pv = min(matched_pv, remaining_pv_today)
-                
-                if today_pv <= 0:
-                    continue
-                
-                # Calculate income
-                income = today_pv * matching_income_rate
-                
-                # Update wallet
-                wallets_collection.update_one(
-                    {"userId": user_id},
-                    {
-                        "$inc": {
-                            "balance": income,
-                            "totalEarnings": income
-                        },
-                        "$set": {"updatedAt": datetime.now(IST)}
-                    }
-                )
-                
-                # Create transaction
-                transactions_collection.insert_one({
-                    "userId": user_id,
-                    "type": "MATCHING_INCOME",
-                    "amount": income,
-                    "description": f"Daily binary matching income - {today_pv} PV @ ₹{matching_income_rate}/PV",
-                    "pv": today_pv,
-                    "status": "COMPLETED",
-                    "createdAt": datetime.now(IST)
-                })
-                
-                # Flush matched PV from both sides
-                # Note: Flush matched_pv (not today_pv) to properly remove matched pairs
-                # Add matched_pv to totalPV (lifetime matched), not today_pv (capped amount)
-                users_collection.update_one(
-                    {"_id": user["_id"]},
-                    {
-                        "$inc": {
-                            "leftPV": -matched_pv,
-                            "rightPV": -matched_pv,
-                            "totalPV": matched_pv  # totalPV = lifetime PV matched (not capped)
-                        },
-                        "$set": {
-                            "lastMatchingDate": today_date,
-                            "dailyPVUsed": daily_pv_used + today_pv,
-                            "updatedAt": datetime.now(IST)
-                        }
-                    }
-                )
-                
-                total_processed += 1
-                total_income_paid += income
-                
-                results.append({
-                    "userId": user_id,
-                    "name": user.get("name"),
-                    "referralId": user.get("referralId"),
-                    "matchedPV": today_pv,
-                    "income": income,
-                    "leftPV_before": left_pv,
-                    "rightPV_before": right_pv,
-                    "leftPV_after": left_pv - today_pv,
-                    "rightPV_after": right_pv - today_pv
-                })
-                
-            except Exception as e:
-                print(f"Error processing user {user_id}: {str(e)}")
-                continue
+        # All users with active plans (including admin); runs off the event loop
+        result = await asyncio.to_thread(
+            run_matching,
+            users_collection, wallets_collection, transactions_collection, plans_collection,
+            get_ist_now(), description="Daily binary matching income",
+            run_date=run_date_for(get_ist_now()),
+            user_stats_collection=user_stats_collection,
+            daily_stats_collection=daily_stats_collection
+        )
         
         return {
             "success": True,
             "message": "Daily matching income calculated successfully",
             "summary": {
-                "totalUsersProcessed": total_processed,
-                "totalIncomePaid": total_income_paid,
-                "date": datetime.now(IST).strftime("%Y-%m-%d")
+                "totalUsersProcessed": result["totalUsersProcessed"],
+                "totalIncomePaid": result["totalIncomePaid"],
+                "date": result["date"]
             },
-            "details": results
+            "details": result["details"]
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/eod/status")
+async def get_eod_status(limit: int = 20, current_admin: dict = Depends(get_current_admin)):
+    """EOD scheduler state and recent run history"""
+    try:
+        status_data = await asyncio.to_thread(eod_scheduler.status)
+        runs = await asyncio.to_thread(eod_scheduler.recent_runs, max(1, min(limit, 100)))
+        return {
+            "success": True,
+            "data": {
+                "scheduler": serialize_doc(status_data),
+                "runs": serialize_doc(runs)
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class EODSimulationRequest(BaseModel):
+    matchingIncomeRate: Optional[float] = Field(None, gt=0)
+    dailyCapping: Optional[Dict[str, float]] = None  # plan id or name -> dailyCapping
+    refreshSnapshot: bool = False
+
+@app.post("/api/admin/eod/simulate")
+async def simulate_eod(request: EODSimulationRequest, current_admin: dict = Depends(get_current_admin)):
+    """
+    Dry-run EOD matching under what-if capping / rate values.
+    Read-only: nothing is written to wallets, transactions or users.
+    """
+    try:
+        snapshot, taken_at = await asyncio.to_thread(get_simulation_snapshot, request.refreshSnapshot)
+        
+        started = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(
+                simulate_matching, snapshot, request.matchingIncomeRate, request.dailyCapping
+            )
+        except ValueError as ve:
+            raise HTTPException(status_code=400, detail=str(ve))
+        
+        result["snapshot"] = {
+            "takenAt": taken_at.isoformat(),
+            "users": int(len(snapshot["leftPV"]))
+        }
+        result["computeMs"] = round((time.perf_counter() - started) * 1000, 1)
+        
+        return {
+            "success": True,
+            "data": result
+        }
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/eod/forecast")
+async def get_payout_forecast(
+    days: int = 30,
+    lookbackDays: int = 30,
+    current_admin: dict = Depends(get_current_admin)
+):
+    """
+    Projected matching income liability for the next `days` EODs, from
+    current carry-forward PV and PLAN_ACTIVATION velocity over `lookbackDays`
+    """
+    try:
+        if not 1 <= days <= 90:
+            raise HTTPException(status_code=400, detail="days must be between 1 and 90")
+        if not 1 <= lookbackDays <= 180:
+            raise HTTPException(status_code=400, detail="lookbackDays must be between 1 and 180")
+        
+        def build_forecast():
+            tree_index.refresh(teams_collection)
+            return forecast_payouts(
+                users_collection, transactions_collection, plans_collection, tree_index,
+                get_ist_now(), eod_scheduler.next_run_at().date(),
+                days=days, lookback_days=lookbackDays
+            )
+        
+        forecast = await asyncio.to_thread(build_forecast)
+        
+        return {
+            "success": True,
+            "data": forecast
         }
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/eod/run")
+async def trigger_eod_run(current_admin: dict = Depends(get_current_admin)):
+    """Run the EOD pipeline now (recorded as a manual run)"""
+    try:
+        run = await eod_scheduler.run("manual")
+        if run is None:
+            raise HTTPException(status_code=409, detail="An EOD run is already in progress")
         
+        return {
+            "success": run.get("status") == "COMPLETED",
+            "data": serialize_doc(run)
+        }
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -4715,8 +4533,14 @@ async def health_check():
         # Check MongoDB connection
         client.admin.command('ping')
         return {
-            "status": "healthy",
+            "status": "healthy" if placement_index["ready"] else "degraded",
             "database": "connected",
+            "placement": {
+                "slotIndex": placement_index["ready"],
+                "registrationEnabled": placement_index["ready"],
+                "duplicateSlots": placement_index["duplicateSlots"],
+                "error": placement_index["error"]
+            },
             "timestamp": get_ist_now().isoformat()
         }
     except Exception as e:
@@ -4843,6 +4667,7 @@ async def submit_kyc(
                 }
             }
         )
+        principal_cache.invalidate(user_id)
         
         return {
             "success": True,
@@ -4960,6 +4785,7 @@ async def submit_kyc_for_member(
                 }
             }
         )
+        principal_cache.invalidate(target_user_id)
         
         return {
             "success": True,
@@ -4979,19 +4805,16 @@ async def get_my_kyc(current_user: dict = Depends(get_current_user)):
     try:
         user_id = current_user["id"]
         
-        # Get fresh user data
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        # Fresh user data and latest KYC submission
+        user, latest_kyc = await asyncio.gather(
+            repos.users.get(user_id, {"kycStatus": 1, "isActive": 1}),
+            repos.kyc.latest_for_user(user_id)
+        )
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         kyc_status = user.get("kycStatus", "PENDING_KYC")
         
-        # Get latest KYC submission
-        latest_kyc = kyc_submissions_collection.find_one(
-            {"userId": user_id},
-            sort=[("createdAt", DESCENDING)]
-        )
-        
         return {
             "success": True,
             "data": {
@@ -5255,7 +5078,7 @@ async def approve_kyc(
             # Check if user has a pending plan
             if target_user.get("currentPlanId"): # Use currentPlanId to find the plan object
                  try:
-                    plan = plans_collection.find_one({"_id": ObjectId(target_user["currentPlanId"])})
+                    plan = plan_registry.by_id(target_user["currentPlanId"])
                     if plan:
                         # 1. Admin Revenue Logic
                         admin_user = users_collection.find_one({"role": "admin"})
@@ -5286,6 +5109,8 @@ async def approve_kyc(
                                 },
                                 upsert=True
                             )
+                            record_credit(user_stats_collection, admin_id, plan["amount"], "PLAN_ACTIVATION", get_ist_now())
+                        record_plan_activation(daily_stats_collection, plan["name"], plan["amount"], get_ist_now())
                         
                         # 2. PV Distribution Logic
                         pv_amount = plan.get("pv", 0)
@@ -5328,10 +5153,7 @@ async def approve_kyc(
         if kyc_form:
             user_update_data["kycData"] = kyc_form
         
-        users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": user_update_data}
-        )
+        update_user_fields(user_id, user_update_data)
         
 
 
@@ -5395,6 +5217,7 @@ async def reject_kyc(
                 }
             }
         )
+        principal_cache.invalidate(user_id)
         
         return {
             "success": True,
@@ -5472,6 +5295,7 @@ async def create_playlist(
         }
         
         result = playlists_collection.insert_one(playlist)
+        response_cache.invalidate("tutorials")
         
         # Re-fetch to get proper serialization
         created = playlists_collection.find_one({"_id": result.inserted_id})
@@ -5515,6 +5339,7 @@ async def delete_playlist(
         result = playlists_collection.delete_one({"_id": ObjectId(playlist_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Playlist not found")
+        response_cache.invalidate("tutorials")
             
         return {"success": True, "message": "Playlist deleted successfully"}
     except HTTPException as he:
@@ -5568,6 +5393,7 @@ async def add_video(
         }
         
         result = tutorials_collection.insert_one(video)
+        response_cache.invalidate("tutorials")
         
         # Re-fetch to get proper serialization
         created = tutorials_collection.find_one({"_id": result.inserted_id})
@@ -5612,6 +5438,7 @@ async def delete_video(
         result = tutorials_collection.delete_one({"_id": ObjectId(video_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Video not found")
+        response_cache.invalidate("tutorials")
             
         return {"success": True, "message": "Video deleted successfully"}
     except Exception as e:
@@ -5619,47 +5446,108 @@ async def delete_video(
 
 # --- Public/User Routes ---
 
+def build_tutorials_payload():
+    """Tutorials grouped by playlist (cached by get_user_tutorials)"""
+    # Get all playlists
+    playlists = list(playlists_collection.find().sort("createdAt", -1))
+    
+    # Get all videos
+    videos = list(tutorials_collection.find().sort("createdAt", -1))
+    
+    # Group videos by playlist
+    grouped_data = []
+    
+    # 1. Add specific playlists
+    for pl in playlists:
+        pl_id = str(pl["_id"])
+        pl_videos = [serialize_doc(v) for v in videos if str(v.get("playlistId", "")) == pl_id]
+    
+        if pl_videos:
+            grouped_data.append({
+                "id": pl_id,
+                "name": pl["name"],
+                "description": pl.get("description", ""),
+                "videos": pl_videos
+            })
+    
+    # 2. Add uncategorized videos
+    uncategorized = [serialize_doc(v) for v in videos if not v.get("playlistId")]
+    if uncategorized:
+        grouped_data.append({
+            "id": "uncategorized",
+            "name": "Other Videos",
+            "description": "General tutorials",
+            "videos": uncategorized
+        })
+    
+    return {"success": True, "data": grouped_data}
+
 @app.get("/api/tutorials")
-async def get_user_tutorials(current_user: dict = Depends(get_current_active_user)):
+async def get_user_tutorials(request: Request, current_user: dict = Depends(get_current_active_user)):
     """Get all tutorials grouped by playlist"""
     try:
-        # Get all playlists
-        playlists = list(playlists_collection.find().sort("createdAt", -1))
-        
-        # Get all videos
-        videos = list(tutorials_collection.find().sort("createdAt", -1))
-        
-        # Group videos by playlist
-        grouped_data = []
-        
-        # 1. Add specific playlists
-        for pl in playlists:
-            pl_id = str(pl["_id"])
-            pl_videos = [serialize_doc(v) for v in videos if str(v.get("playlistId", "")) == pl_id]
-            
-            if pl_videos:
-                grouped_data.append({
-                    "id": pl_id,
-                    "name": pl["name"],
-                    "description": pl.get("description", ""),
-                    "videos": pl_videos
-                })
-        
-        # 2. Add uncategorized videos
-        uncategorized = [serialize_doc(v) for v in videos if not v.get("playlistId")]
-        if uncategorized:
-            grouped_data.append({
-                "id": "uncategorized",
-                "name": "Other Videos",
-                "description": "General tutorials",
-                "videos": uncategorized
-            })
-            
-        return {"success": True, "data": grouped_data}
+        return response_cache.respond(
+            request, "tutorials", build_tutorials_payload, cache_control="private, no-cache"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==================== CACHE METRICS ====================
+
+@app.get("/api/admin/cache/metrics")
+async def get_cache_metrics(current_admin: dict = Depends(get_current_admin)):
+    """Hit rates of the in-process caches (this worker only)"""
+    try:
+        return {
+            "success": True,
+            "data": {
+                "responses": response_cache.metrics(),
+                "settings": settings_cache.stats(),
+                "plans": plan_registry.stats(),
+                "ranks": rank_table.stats(),
+                "principals": principal_cache.stats()
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/admin/auth/hasher-metrics")
+async def get_hasher_metrics(current_admin: dict = Depends(get_current_admin)):
+    """bcrypt pool load: queue length, queue wait and hash time (this worker only)"""
+    try:
+        return {"success": True, "data": password_hasher.stats()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ==================== USER STATS ====================
 
+@app.post("/api/admin/user-stats/rebuild")
+async def rebuild_all_user_stats(current_admin: dict = Depends(get_current_admin)):
+    """Recompute every user's dashboard stats from transactions, withdrawals and users"""
+    try:
+        result = await asyncio.to_thread(
+            rebuild_user_stats,
+            user_stats_collection, users_collection, transactions_collection, withdrawals_collection,
+            get_ist_now()
+        )
+        return {"success": True, "data": serialize_doc(result)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==================== DAILY STATS ====================
+
+@app.post("/api/admin/daily-stats/rebuild")
+async def rebuild_all_daily_stats(current_admin: dict = Depends(get_current_admin)):
+    """Recompute every day's business figures from users, topups, withdrawals and transactions"""
+    try:
+        result = await asyncio.to_thread(
+            rebuild_daily_stats,
+            daily_stats_collection, users_collection, topups_collection, withdrawals_collection,
+            transactions_collection, get_ist_now()
+        )
+        return {"success": True, "data": result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 # ==================== WEAK MEMBER REPORT ====================
 
@@ -5681,32 +5569,22 @@ async def get_weak_members_report(
         
         target_user_id = str(target_user["_id"])
         
-        # Get all downline members recursively
-        def get_all_downline(parent_id, side=None, depth=0, max_depth=50):
-            if depth > max_depth:
-                return []
-            
-            members = []
-            
-            # Get direct children
-            children = list(teams_collection.find({"sponsorId": parent_id}))
-            
-            for child in children:
-                child_user = users_collection.find_one({"_id": ObjectId(child["userId"])})
-                if child_user:
-                    child_side = child.get("placement", "UNKNOWN")
-                    members.append({
-                        "user": child_user,
-                        "side": child_side if depth == 0 else side,  # Track original side from root
-                        "depth": depth + 1
-                    })
-                    # Get their downline
-                    members.extend(get_all_downline(child["userId"], child_side if depth == 0 else side, depth + 1, max_depth))
-            
-            return members
-        
-        # Get all downline
-        all_downline = get_all_downline(target_user_id)
+        # Get all downline members from the tree index
+        tree_index.refresh(teams_collection)
+        downline_nodes = [
+            (member_id, depth, leg)
+            for member_id, depth, leg in tree_index.walk(target_user_id, max_depth=51)
+            if depth > 0
+        ]
+        downline_users = {
+            str(u["_id"]): u
+            for u in users_collection.find({"_id": {"$in": [ObjectId(n[0]) for n in downline_nodes]}})
+        }
+        all_downline = [
+            {"user": downline_users[member_id], "side": leg, "depth": depth}
+            for member_id, depth, leg in downline_nodes
+            if member_id in downline_users
+        ]
         
         # Analyze weakness
         weak_members = []
@@ -5719,8 +5597,9 @@ async def get_weak_members_report(
             weakness_reasons = []
             
             # Check 1: No downline (no team members)
-            team_count = teams_collection.count_documents({"sponsorId": str(member["_id"])})
-            if team_count == 0:
+            left_leg = member.get("leftCount", 0)
+            right_leg = member.get("rightCount", 0)
+            if not left_leg and not right_leg:
                 weakness_reasons.append({
                     "type": "NO_DOWNLINE",
                     "message": "No team members under this user",
@@ -5729,9 +5608,6 @@ async def get_weak_members_report(
             severity = "LOW" # Default to LOW, will be updated if higher severity weakness is found
 
             # Check for binary legs
-            left_leg = teams_collection.find_one({"sponsorId": str(member["_id"]), "placement": "LEFT"})
-            right_leg = teams_collection.find_one({"sponsorId": str(member["_id"]), "placement": "RIGHT"})
-            
             if not left_leg and not right_leg:
                 weakness_reasons.append({
                     "type": "MISSING_BOTH",
@@ -5757,14 +5633,7 @@ async def get_weak_members_report(
             # Only add if there is a weakness
             if weakness_reasons:
                 # Get plan name
-                plan_name = None
-                if member.get("currentPlan"):
-                    try:
-                        plan = plans_collection.find_one({"_id": ObjectId(member["currentPlan"])})
-                        if plan:
-                            plan_name = plan.get("name")
-                    except:
-                        plan_name = member.get("currentPlan") if len(str(member.get("currentPlan", ""))) < 50 else None
+                plan_name = plan_registry.name_for(member.get("currentPlan"))
 
                 weak_members.append({
                     "id": member_id,
@@ -5774,6 +5643,8 @@ async def get_weak_members_report(
                     "totalPV": member.get("totalPV", 0),
                     "leftPV": member.get("leftPV", 0),
                     "rightPV": member.get("rightPV", 0),
+                    "leftCount": left_leg,
+                    "rightCount": right_leg,
                     "currentPlan": plan_name,
                     "isActive": member.get("isActive", False),
                     "profilePhoto": member.get("profilePhoto"),
@@ -5796,8 +5667,8 @@ async def get_weak_members_report(
         target_weakness = None
         
         # Check target user's legs
-        target_left = teams_collection.find_one({"sponsorId": target_user_id, "placement": "LEFT"})
-        target_right = teams_collection.find_one({"sponsorId": target_user_id, "placement": "RIGHT"})
+        target_left = target_user.get("leftCount", 0)
+        target_right = target_user.get("rightCount", 0)
         
         if not target_left and not target_right:
             target_weakness = {
@@ -5879,10 +5750,7 @@ async def admin_update_user_profile(
         
         update_data["updatedAt"] = get_ist_now()
         
-        users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_data}
-        )
+        update_user_fields(user_id, update_data)
         
         return {
             "success": True,
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark: whole-network downline report at 100k members.
+
+Generates a random binary tree and times the single-pass engine
+(compute_downline_counts + row join) that backs
+/api/admin/reports/team/downline, plus Excel rendering of the same rows.
+
+With --db the tree is written to a scratch database (MONGO_URL, default
+localhost) and the engine is timed end to end including both queries.
+The scratch database is dropped at the end.
+
+    python3 benchmark_downline_report.py [members] [--db]
+"""
+import os
+import sys
+import time
+import random
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.tree_service import compute_downline_counts
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+BENCH_DB_NAME = "mlm_report_benchmark"
+
+
+def generate_tree(members):
+    """Random binary tree: each member takes a random free slot"""
+    root_id = str(ObjectId())
+    users = [{"_id": root_id, "referralId": "VSV00001", "name": "Admin", "isActive": True}]
+    teams = []
+    free_slots = [(root_id, "LEFT"), (root_id, "RIGHT")]
+    for i in range(members):
+        sponsor_id, placement = free_slots.pop(random.randrange(len(free_slots)))
+        user_id = str(ObjectId())
+        users.append({"_id": user_id, "referralId": f"B{i:07d}", "name": f"Member {i}", "isActive": i % 3 != 0})
+        teams.append({"userId": user_id, "sponsorId": sponsor_id, "placement": placement})
+        free_slots.extend([(user_id, "LEFT"), (user_id, "RIGHT")])
+    return users, teams
+
+
+def build_rows(users, counts):
+    rows = []
+    for user in users:
+        direct_count, total_downline = counts.get(str(user["_id"]), (0, 0))
+        rows.append({
+            "Referral ID": user.get("referralId", ""),
+            "Name": user.get("name", ""),
+            "Direct Downline": direct_count,
+            "Total Downline": total_downline,
+            "Status": "Active" if user.get("isActive", False) else "Inactive"
+        })
+    return rows
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"   {label:<32} {time.perf_counter() - start:>8.2f}s")
+    return result
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    members = int(args[0]) if args else 100_000
+    use_db = "--db" in sys.argv
+
+    print(f"🚀 Downline report benchmark ({members:,} members)")
+    users, teams = timed("generate tree", lambda: generate_tree(members))
+
+    counts = timed("post-order counts", lambda: compute_downline_counts(teams))
+    rows = timed("join rows", lambda: build_rows(users[1:], counts))
+
+    root_total = counts[users[0]["_id"]][1]
+    if root_total != members:
+        print(f"❌ Root total downline {root_total} != {members}")
+        sys.exit(1)
+    print(f"✅ Root total downline = {root_total:,}")
+
+    # Same rows feed the Excel export
+    try:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+        from app.services.report_files import generate_excel_report
+        headers = ["Referral ID", "Name", "Direct Downline", "Total Downline", "Status"]
+        timed("excel render", lambda: generate_excel_report(rows, headers, "Downline Summary Report"))
+    except ImportError as e:
+        print(f"   (excel render skipped: {e})")
+
+    if use_db:
+        from pymongo import MongoClient
+        client = MongoClient(MONGO_URL)
+        db = client[BENCH_DB_NAME]
+        try:
+            db.users.drop()
+            db.teams.drop()
+            timed("insert scratch data", lambda: (
+                db.users.insert_many([dict(u, _id=ObjectId(u["_id"]), role="user") for u in users]),
+                db.teams.insert_many([dict(t) for t in teams])
+            ))
+
+            def end_to_end():
+                db_counts = compute_downline_counts(db.teams.find({}, {"_id": 0, "userId": 1, "sponsorId": 1}))
+                db_users = db.users.find({"role": "user"}, {"referralId": 1, "name": 1, "isActive": 1})
+                return build_rows(db_users, db_counts)
+
+            db_rows = timed("end to end (mongo)", end_to_end)
+            print(f"✅ {len(db_rows):,} report rows from MongoDB")
+        finally:
+            client.drop_database(BENCH_DB_NAME)
+
+
+if __name__ == "__main__":
+    main()
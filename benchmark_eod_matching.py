@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Benchmark: vectorized EOD binary matching at 1M users.
+
+Generates random user documents (PV on both legs, mixed plans, some users
+already matched today) and times the EOD engine stages that back
+/api/admin/calculate-daily-matching: snapshot packing, the NumPy matching
+kernel and the details payload. The kernel result is checked against a
+plain per-user loop on a sample, and the read-only what-if simulator is
+timed over the same users.
+
+With --db the users are written to a scratch database (MONGO_URL, default
+localhost) and run_matching is timed end to end, including the cursor read
+and the chunked wallet / transaction / user writes. The sharded, checkpointed
+run is then timed for each worker count in --workers (default 1,2,4,cpus)
+to show how throughput scales with the process pool. The scratch database
+is dropped at the end.
+
+    python3 benchmark_eod_matching.py [users] [--db] [--workers=1,2,4,8]
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+import pytz
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.eod_engine import (
+    MATCHING_INCOME_RATE, build_snapshot, compute_matching, matching_details, normalize_plans,
+    ist_day_bounds, run_matching, run_date_for, run_sharded_matching, ensure_matching_indexes,
+    simulate_matching
+)
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+BENCH_DB_NAME = "mlm_eod_benchmark"
+IST = pytz.timezone('Asia/Kolkata')
+
+PLANS = [
+    {"_id": ObjectId(), "name": "Basic", "dailyCapping": 250},
+    {"_id": ObjectId(), "name": "Standard", "dailyCapping": 500},
+    {"_id": ObjectId(), "name": "Premium", "dailyCapping": 1000},
+]
+
+
+def generate_users(count, now):
+    """Random users: PV on both legs, plan by name or id, ~20% matched earlier today"""
+    _, start_utc, _ = ist_day_bounds(now)
+    earlier_today = start_utc + timedelta(hours=2)
+    yesterday = start_utc - timedelta(hours=2)
+    users = []
+    for i in range(count):
+        plan = random.choice(PLANS)
+        user = {
+            "_id": ObjectId(),
+            "name": f"Member {i}",
+            "referralId": f"B{i:07d}",
+            "role": "user",
+            "isActive": True,
+            "leftPV": random.randint(1, 80),
+            "rightPV": random.randint(1, 80),
+            "dailyPVUsed": random.randint(0, 15),
+            "lastMatchingDate": earlier_today if random.random() < 0.2 else yesterday,
+            "totalPV": 0
+        }
+        if i % 2:
+            user["currentPlan"] = plan["name"]
+        else:
+            user["currentPlan"] = str(plan["_id"])
+            user["currentPlanId"] = str(plan["_id"])
+        users.append(user)
+    return users
+
+
+def reference_today_pv(user, now):
+    """Per-user rule, used to spot-check the kernel"""
+    _, start_utc, end_utc = ist_day_bounds(now)
+    plan = next(p for p in PLANS if user["currentPlan"] in (p["name"], str(p["_id"])))
+    max_pv = plan["dailyCapping"] // MATCHING_INCOME_RATE
+    same_day = start_utc <= user["lastMatchingDate"] < end_utc
+    used = user["dailyPVUsed"] if same_day else 0
+    if max_pv - used <= 0:
+        return 0
+    return max(min(min(user["leftPV"], user["rightPV"]), max_pv - used), 0)
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"   {label:<32} {time.perf_counter() - start:>8.2f}s")
+    return result
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    count = int(args[0]) if args else 1_000_000
+    use_db = "--db" in sys.argv
+    worker_arg = next((a.split("=", 1)[1] for a in sys.argv[1:] if a.startswith("--workers=")), None)
+    worker_counts = [int(w) for w in worker_arg.split(",")] if worker_arg else sorted({1, 2, 4, os.cpu_count() or 1})
+    now = IST.localize(datetime.now().replace(hour=23, minute=30))
+
+    print(f"🚀 EOD matching benchmark ({count:,} users)")
+    users = timed("generate users", lambda: generate_users(count, now))
+
+    plans = normalize_plans(PLANS)
+    _, start_utc, end_utc = ist_day_bounds(now)
+
+    snapshot = timed("pack snapshot arrays", lambda: build_snapshot(users, plans, start_utc, end_utc))
+    result = timed("matching kernel", lambda: compute_matching(snapshot))
+    rows = result["paid"].nonzero()[0].tolist()
+    details = timed("details payload", lambda: matching_details(snapshot, result, rows))
+
+    print(f"   paid users: {len(details):,}, income: ₹{int(result['income'][result['paid']].sum()):,}")
+
+    today_pv = result["todayPV"].tolist()
+    paid = result["paid"].tolist()
+    for i in random.sample(range(count), min(count, 10_000)):
+        expected = reference_today_pv(users[i], now)
+        actual = today_pv[i] if paid[i] else 0
+        if expected != actual:
+            print(f"❌ Mismatch for {users[i]['referralId']}: kernel {actual}, expected {expected}")
+            sys.exit(1)
+    print("✅ Kernel matches the per-user rule on a 10k sample")
+
+    # What-if: double Basic's capping and pay ₹20/PV (current + simulated pass)
+    sim_snapshot = timed("pack simulator snapshot", lambda: build_snapshot(users, plans, start_utc, end_utc, identity=False))
+    start = time.perf_counter()
+    simulation = simulate_matching(sim_snapshot, rate=20, daily_capping={"Basic": 500})
+    elapsed = time.perf_counter() - start
+    print(f"   {'simulate (current + what-if)':<32} {elapsed:>8.2f}s")
+    print(f"   payout ₹{simulation['current']['totalPayout']:,.0f} -> ₹{simulation['simulated']['totalPayout']:,.0f}, "
+          f"capped users {simulation['current']['cappedUsers']:,} -> {simulation['simulated']['cappedUsers']:,}")
+    if simulation["current"]["totalPayout"] != int(result["income"][result["paid"]].sum()):
+        print("❌ Simulated current payout differs from the engine")
+        sys.exit(1)
+    print(f"{'✅' if elapsed < 1 else '⚠️'} Simulation took {elapsed * 1000:.0f}ms")
+
+    if use_db:
+        from pymongo import MongoClient
+        client = MongoClient(MONGO_URL)
+        db = client[BENCH_DB_NAME]
+
+        def load_scratch_data():
+            for name in ("users", "wallets", "transactions", "plans", "eod_runs"):
+                db[name].drop()
+            db.plans.insert_many([dict(p) for p in PLANS])
+            db.users.insert_many([dict(u) for u in users])
+            db.wallets.insert_many([{"userId": str(u["_id"]), "balance": 0, "totalEarnings": 0} for u in users])
+            db.wallets.create_index("userId")
+            ensure_matching_indexes(db.transactions)
+
+        try:
+            timed("insert scratch data", load_scratch_data)
+            db_result = timed("run_matching (mongo)", lambda: run_matching(
+                db.users, db.wallets, db.transactions, db.plans, now, include_details=False
+            ))
+            print(f"✅ {db_result['totalUsersProcessed']:,} users paid ₹{db_result['totalIncomePaid']:,} from MongoDB")
+
+            print("\n📊 Sharded runs")
+            baseline = None
+            for workers in worker_counts:
+                timed("reload scratch data", load_scratch_data)
+                run_id = db.eod_runs.insert_one({"runDate": run_date_for(now), "trigger": "benchmark"}).inserted_id
+                start = time.perf_counter()
+                result = run_sharded_matching(
+                    db, MONGO_URL, BENCH_DB_NAME, db.eod_runs, run_id, now, run_date_for(now), workers=workers
+                )
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed
+                print(f"   {workers:>2} workers / {result['shards']:>3} shards  {elapsed:>8.2f}s  "
+                      f"{result['paidUsers'] / elapsed:>10,.0f} users/s  speedup {baseline / elapsed:.2f}x")
+        finally:
+            client.drop_database(BENCH_DB_NAME)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark: login storm vs. unrelated endpoint latency.
+
+Fires LOGINS username/password logins from CONCURRENCY threads at a live
+backend (the start-of-day login burst) and, at the same time, polls an
+unrelated endpoint (/api/plans by default) from one thread. Prints:
+  - logins/sec, login latency percentiles and how many got 503 (bcrypt
+    queue full, see PASSWORD_HASH_MAX_PENDING)
+  - /api/plans latency idle vs. during the storm
+  - the server's bcrypt pool metrics (/api/admin/auth/hasher-metrics)
+
+With bcrypt on the event loop the unrelated p99 during the storm grows to
+many times the hash cost; with the bounded pool it should stay close to
+idle while logins/sec levels off at roughly workers / hash time.
+
+    python3 benchmark_login_storm.py [logins] [concurrency] [--label NAME]
+
+Logs in as the admin (ADMIN_USERNAME / ADMIN_PASSWORD). Try it with
+different BCRYPT_ROUNDS / PASSWORD_HASH_WORKERS settings on the server.
+"""
+import os
+import sys
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.getenv("BACKEND_URL", "http://localhost:8001") + "/api"
+ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "vsvadmin")
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "Admin@123")
+PROBE_PATH = os.getenv("PROBE_PATH", "/plans")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def login():
+    start = time.perf_counter()
+    response = requests.post(
+        f"{BASE_URL}/auth/sign-in/username",
+        json={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD},
+        timeout=120
+    )
+    return response.status_code, (time.perf_counter() - start) * 1000, response
+
+
+def probe(stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            requests.get(f"{BASE_URL}{PROBE_PATH}", timeout=120)
+        except requests.RequestException as e:
+            print(f"⚠️ Probe failed: {e}")
+            return
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.02)
+
+
+def probe_for(seconds):
+    stop = threading.Event()
+    latencies = []
+    thread = threading.Thread(target=probe, args=(stop, latencies), daemon=True)
+    thread.start()
+    time.sleep(seconds)
+    stop.set()
+    thread.join()
+    return latencies
+
+
+def summarize(label, latencies):
+    if not latencies:
+        print(f"   {label:<8} no samples")
+        return
+    print(f"   {label:<8} n={len(latencies):<5} p50={percentile(latencies, 50):>8.1f}ms  "
+          f"p95={percentile(latencies, 95):>8.1f}ms  p99={percentile(latencies, 99):>8.1f}ms  "
+          f"max={max(latencies):>8.1f}ms")
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    label = "run"
+    if "--label" in sys.argv:
+        label = sys.argv[sys.argv.index("--label") + 1]
+        args = [arg for arg in args if arg != label]
+    count = int(args[0]) if len(args) > 0 else 200
+    concurrency = int(args[1]) if len(args) > 1 else 50
+
+    print(f"🚀 Login storm [{label}] - {count} logins, concurrency {concurrency}")
+    status_code, _, response = login()
+    if status_code != 200:
+        print(f"❌ Admin login failed: {status_code} {response.text}")
+        return
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    idle = probe_for(3)
+
+    stop = threading.Event()
+    loaded = []
+    prober = threading.Thread(target=probe, args=(stop, loaded), daemon=True)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: login()[:2], range(count)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+
+    ok = [latency for code, latency in results if code == 200]
+    busy = sum(1 for code, _ in results if code == 503)
+    failed = len(results) - len(ok) - busy
+
+    print(f"\n📊 Logins [{label}]")
+    print(f"   {len(ok)} ok, {busy} busy (503), {failed} failed in {elapsed:.2f}s "
+          f"-> {len(ok) / elapsed:.1f} logins/sec")
+    summarize("login", ok)
+
+    print(f"\n📊 {PROBE_PATH} [{label}]")
+    summarize("idle", idle)
+    summarize("storm", loaded)
+    if idle and loaded:
+        print(f"   p99 during the storm is {percentile(loaded, 99) / percentile(idle, 99):.1f}x the idle p99")
+
+    metrics = requests.get(f"{BASE_URL}/admin/auth/hasher-metrics", headers=headers, timeout=30)
+    if metrics.status_code == 200:
+        data = metrics.json()["data"]
+        print(f"\n🔐 bcrypt pool: rounds={data['rounds']} workers={data['workers']} "
+              f"verifies={data['verifies']} rehashes={data['rehashes']} rejected={data['rejected']}")
+        print(f"   queue wait {data['queueWaitMs']}  hash time {data['runMs']}")
+    else:
+        print(f"⚠️ No hasher metrics ({metrics.status_code})")
+
+    print(f"\n✅ Done")
+
+
+if __name__ == "__main__":
+    main()
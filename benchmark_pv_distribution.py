@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-level PV walk vs materialized-ancestor bulk write.
+
+Builds a synthetic chain in a scratch database for each depth and times
+distributing PV from the deepest member with:
+  - legacy: the old walk (find sponsor, update, find sponsor's team per level)
+  - bulk:   one team read + one bulk_write of grouped UpdateMany ops
+
+Uses MONGO_URL (default localhost). The scratch database is dropped at the end.
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime
+from pymongo import MongoClient
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.tree_service import get_ancestor_path, distribute_pv_to_ancestors
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+BENCH_DB_NAME = "mlm_pv_benchmark"
+DEPTHS = [10, 100, 1000]
+RUNS = 5
+PV = 10
+
+
+def build_chain(db, depth):
+    """Create a root plus `depth` members, each placed under the previous one"""
+    db.users.drop()
+    db.teams.drop()
+    db.teams.create_index("userId")
+
+    ids = [ObjectId() for _ in range(depth + 1)]
+    db.users.insert_many([{"_id": oid, "leftPV": 0, "rightPV": 0} for oid in ids])
+
+    teams = []
+    ancestors = []
+    for parent, child in zip(ids, ids[1:]):
+        side = random.choice(["LEFT", "RIGHT"])
+        ancestors = [{"userId": str(parent), "side": side}] + ancestors
+        teams.append({
+            "userId": str(child),
+            "sponsorId": str(parent),
+            "placement": side,
+            "ancestors": ancestors
+        })
+    db.teams.insert_many(teams)
+    return str(ids[-1])
+
+
+def legacy_distribute(db, user_id, pv_amount):
+    """The previous implementation: three round trips per level"""
+    team_record = db.teams.find_one({"userId": user_id})
+    if not team_record or not team_record.get("sponsorId"):
+        return
+    placement = team_record.get("placement")
+    sponsor_id = team_record["sponsorId"]
+    while sponsor_id:
+        sponsor = db.users.find_one({"_id": ObjectId(sponsor_id)})
+        if not sponsor:
+            break
+        update_field = "leftPV" if placement == "LEFT" else "rightPV"
+        db.users.update_one(
+            {"_id": ObjectId(sponsor_id)},
+            {"$inc": {update_field: pv_amount}, "$set": {"updatedAt": datetime.utcnow()}}
+        )
+        sponsor_team = db.teams.find_one({"userId": sponsor_id})
+        if not sponsor_team or not sponsor_team.get("sponsorId"):
+            break
+        placement = sponsor_team.get("placement")
+        sponsor_id = sponsor_team["sponsorId"]
+
+
+def bulk_distribute(db, user_id, pv_amount):
+    ancestors = get_ancestor_path(db.teams, user_id)
+    distribute_pv_to_ancestors(db.users, ancestors, pv_amount, datetime.utcnow())
+
+
+def pv_snapshot(db):
+    return {u["_id"]: (u["leftPV"], u["rightPV"]) for u in db.users.find({}, {"leftPV": 1, "rightPV": 1})}
+
+
+def time_runs(fn, db, user_id):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn(db, user_id, PV)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    client = MongoClient(MONGO_URL)
+    db = client[BENCH_DB_NAME]
+
+    print("🚀 PV distribution benchmark")
+    print(f"{'depth':>6} | {'legacy min/avg ms':>20} | {'bulk min/avg ms':>18} | {'speedup':>7}")
+    print("-" * 62)
+
+    try:
+        for depth in DEPTHS:
+            leaf_id = build_chain(db, depth)
+
+            legacy_min, legacy_avg = time_runs(legacy_distribute, db, leaf_id)
+            after_legacy = pv_snapshot(db)
+
+            db.users.update_many({}, {"$set": {"leftPV": 0, "rightPV": 0}})
+            bulk_min, bulk_avg = time_runs(bulk_distribute, db, leaf_id)
+            after_bulk = pv_snapshot(db)
+
+            if after_legacy != after_bulk:
+                print(f"❌ Depth {depth}: bulk result differs from legacy walk")
+                continue
+
+            print(f"{depth:>6} | {legacy_min:>9.2f} / {legacy_avg:>8.2f} | "
+                  f"{bulk_min:>8.2f} / {bulk_avg:>7.2f} | {legacy_avg / bulk_avg:>6.1f}x")
+    finally:
+        client.drop_database(BENCH_DB_NAME)
+
+    print("✅ Done (results verified identical at each depth)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /api/wallet/balance latency while a heavy report runs.
+
+Measures wallet balance latency (p50 / p95 / p99 / max) twice against a
+live backend:
+  1. idle     - nothing else running
+  2. loaded   - REPORT_LOOPS threads requesting the whole-network downline
+                report (/api/admin/reports/team/downline) back to back
+
+When handlers block the event loop, every wallet request that lands while a
+report is running waits for it, so the loaded p99 grows to roughly the
+report's duration. With the motor-backed handlers it should stay close to
+the idle figure.
+
+Run it against one uvicorn worker before and after the async data layer
+(git checkout the earlier commit, restart, run with --label before; then
+the same with --label after) and compare the two summaries:
+
+    python3 benchmark_wallet_latency.py [requests] [concurrency] [--label NAME]
+
+Logs in as the admin (ADMIN_USERNAME / ADMIN_PASSWORD), which is active and
+may run reports. Use a database with a realistically sized tree, e.g. one
+seeded by benchmark_downline_report.py --db.
+"""
+import os
+import sys
+import time
+import threading
+import statistics
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.getenv("BACKEND_URL", "http://localhost:8001") + "/api"
+ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "vsvadmin")
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "Admin@123")
+REPORT_LOOPS = int(os.getenv("REPORT_LOOPS", 2))
+
+
+def login():
+    response = requests.post(
+        f"{BASE_URL}/auth/sign-in/username",
+        json={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD},
+        timeout=30
+    )
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def wallet_latencies(session_headers, count, concurrency):
+    def one(_):
+        start = time.perf_counter()
+        response = requests.get(f"{BASE_URL}/wallet/balance", headers=session_headers, timeout=120)
+        elapsed = (time.perf_counter() - start) * 1000
+        return elapsed if response.status_code == 200 else None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(count)))
+    failed = sum(1 for result in results if result is None)
+    return [result for result in results if result is not None], failed
+
+
+def report_loop(session_headers, stop, durations):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            requests.get(f"{BASE_URL}/admin/reports/team/downline", headers=session_headers, timeout=600)
+        except requests.RequestException as e:
+            print(f"⚠️ Report request failed: {e}")
+            return
+        durations.append(time.perf_counter() - start)
+
+
+def summarize(label, latencies, failed):
+    print(f"   {label:<8} n={len(latencies):<5} failed={failed:<3} "
+          f"p50={percentile(latencies, 50):>8.1f}ms  p95={percentile(latencies, 95):>8.1f}ms  "
+          f"p99={percentile(latencies, 99):>8.1f}ms  max={max(latencies):>8.1f}ms  "
+          f"mean={statistics.mean(latencies):>8.1f}ms")
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    label = "run"
+    if "--label" in sys.argv:
+        label = sys.argv[sys.argv.index("--label") + 1]
+        args = [arg for arg in args if arg != label]
+    count = int(args[0]) if len(args) > 0 else 500
+    concurrency = int(args[1]) if len(args) > 1 else 20
+
+    print(f"🚀 Wallet latency benchmark [{label}] - {count} requests, concurrency {concurrency}")
+    headers = {"Authorization": f"Bearer {login()}"}
+
+    # Warm up caches and connections
+    wallet_latencies(headers, concurrency, concurrency)
+
+    idle, idle_failed = wallet_latencies(headers, count, concurrency)
+
+    stop = threading.Event()
+    report_durations = []
+    loops = [
+        threading.Thread(target=report_loop, args=(headers, stop, report_durations), daemon=True)
+        for _ in range(REPORT_LOOPS)
+    ]
+    for loop in loops:
+        loop.start()
+    time.sleep(0.5)  # let the reports get going
+    loaded, loaded_failed = wallet_latencies(headers, count, concurrency)
+    stop.set()
+    for loop in loops:
+        loop.join()
+
+    print(f"\n📊 /api/wallet/balance [{label}]")
+    summarize("idle", idle, idle_failed)
+    summarize("loaded", loaded, loaded_failed)
+    if report_durations:
+        print(f"   report   runs={len(report_durations)} mean={statistics.mean(report_durations):.2f}s")
+    print(f"\n✅ p99 under load is {percentile(loaded, 99) / percentile(idle, 99):.1f}x the idle p99")
+
+
+if __name__ == "__main__":
+    main()
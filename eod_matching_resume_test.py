@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+EOD Matching resume test
+
+Crashes a matching run between the MATCHING_INCOME insert and the wallet
+credit, lets more PV arrive, then resumes the same run date. Runs against
+a throwaway database (<MONGO_DB_NAME>_matching_test, dropped afterwards):
+  1. the first attempt records the transactions and dies before paying
+  2. both users receive new PV before the resume
+  3. the resumed run pays exactly the recorded amounts, flushes the
+     recorded matched PV and adds no second transaction
+  4. a third attempt changes nothing
+
+    python3 eod_matching_resume_test.py
+"""
+import os
+import sys
+from datetime import datetime
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.eod_engine import ensure_matching_indexes, run_matching
+
+load_dotenv("backend/.env")
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+TEST_DB_NAME = os.getenv("MONGO_DB_NAME", "mlm_vsv_unite") + "_matching_test"
+RUN_DATE = "2026-01-05"
+NOW = datetime(2026, 1, 5, 18, 0)
+
+
+class CrashingWallets:
+    """Wallets collection whose bulk_write dies once, like a worker killed mid-run"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.crash = True
+
+    def bulk_write(self, *args, **kwargs):
+        if self.crash:
+            self.crash = False
+            raise RuntimeError("simulated crash before wallet credit")
+        return self.collection.bulk_write(*args, **kwargs)
+
+
+results = []
+
+
+def check(name, condition, detail=""):
+    results.append(condition)
+    print(f"{'✅' if condition else '❌'} {name}{f' ({detail})' if detail else ''}")
+
+
+def match(db, wallets):
+    return run_matching(
+        db["users"], wallets, db["transactions"], db["plans"], NOW,
+        include_details=False, run_date=RUN_DATE,
+        user_stats_collection=db["user_stats"]
+    )
+
+
+def main():
+    client = MongoClient(MONGO_URL)
+    client.drop_database(TEST_DB_NAME)
+    db = client[TEST_DB_NAME]
+
+    try:
+        ensure_matching_indexes(db["transactions"])
+        db["plans"].insert_one({"name": "Basic", "dailyCapping": 500})
+        users = {
+            "capped": {"leftPV": 30, "rightPV": 40},   # 30 matched, capped at 20 PV/day
+            "uncapped": {"leftPV": 5, "rightPV": 8}
+        }
+        for name, pv in users.items():
+            user_id = db["users"].insert_one({
+                "name": name, "isActive": True, "currentPlan": "Basic", "dailyPVUsed": 0, "totalPV": 0, **pv
+            }).inserted_id
+            users[name]["_id"] = user_id
+            db["wallets"].insert_one({"userId": str(user_id), "balance": 0, "totalEarnings": 0})
+
+        # 1. Crash between the transaction insert and the wallet credit
+        wallets = CrashingWallets(db["wallets"])
+        try:
+            match(db, wallets)
+            check("First attempt crashed", False)
+        except RuntimeError:
+            check("First attempt crashed", True)
+        recorded = {doc["userId"]: doc for doc in db["transactions"].find({"runDate": RUN_DATE})}
+        check("Transactions recorded before the crash", len(recorded) == 2, len(recorded))
+        check("No wallet credited yet", db["wallets"].count_documents({"balance": {"$gt": 0}}) == 0)
+
+        # 2. More PV arrives before the resume
+        db["users"].update_many({}, {"$inc": {"leftPV": 100, "rightPV": 100}})
+
+        # 3. Resume pays what the ledger says
+        match(db, wallets)
+        check("No second transaction", db["transactions"].count_documents({"runDate": RUN_DATE}) == 2)
+        for name, seed in users.items():
+            user_id = str(seed["_id"])
+            transaction = recorded[user_id]
+            wallet = db["wallets"].find_one({"userId": user_id})
+            user = db["users"].find_one({"_id": seed["_id"]})
+            stats = db["user_stats"].find_one({"userId": user_id}) or {}
+            check(f"{name}: wallet matches the transaction", wallet["balance"] == transaction["amount"],
+                  f"wallet {wallet['balance']} vs ledger {transaction['amount']}")
+            check(f"{name}: recorded matched PV flushed",
+                  user["leftPV"] == seed["leftPV"] + 100 - transaction["matchedPV"]
+                  and user["totalPV"] == transaction["matchedPV"],
+                  f"leftPV {user['leftPV']}, totalPV {user['totalPV']}")
+            check(f"{name}: dailyPVUsed is the recorded PV", user["dailyPVUsed"] == transaction["pv"],
+                  user["dailyPVUsed"])
+            check(f"{name}: stats credited the recorded amount",
+                  stats.get("totalIncome") == transaction["amount"], stats.get("totalIncome"))
+
+        # 4. Running again is a no-op
+        before = {doc["userId"]: doc["balance"] for doc in db["wallets"].find()}
+        match(db, db["wallets"])
+        after = {doc["userId"]: doc["balance"] for doc in db["wallets"].find()}
+        check("Third attempt pays nobody", before == after)
+    finally:
+        client.drop_database(TEST_DB_NAME)
+
+    print(f"\n{'✅ All' if all(results) else '❌ Some'} checks passed ({sum(results)}/{len(results)})")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
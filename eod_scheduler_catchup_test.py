@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+EOD Scheduler catch-up test
+
+Simulates the leader going down over midnight with a fake IST clock and a
+fake pipeline, against a throwaway database (<MONGO_DB_NAME>_scheduler_test,
+dropped afterwards):
+  1. day 1 runs normally at eodTime
+  2. on day 2 the run fails at 23:59:30 and the worker restarts after
+     midnight -> day 2 must be retried (runDate day 2) on day 3
+  3. day 3 is skipped entirely (worker down from 23:58 to 00:10) -> caught
+     up on day 4 before day 4's own run
+  4. nothing is due once every date has completed
+
+    python3 eod_scheduler_catchup_test.py
+"""
+import os
+import sys
+import asyncio
+from datetime import datetime
+import pytz
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.eod_scheduler import EODScheduler, STATUS_COMPLETED, TRIGGER_SCHEDULER
+
+load_dotenv("backend/.env")
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+TEST_DB_NAME = os.getenv("MONGO_DB_NAME", "mlm_vsv_unite") + "_scheduler_test"
+IST = pytz.timezone("Asia/Kolkata")
+
+
+class Clock:
+    def __init__(self):
+        self.now = None
+
+    def set(self, day, hour, minute, second=0):
+        self.now = IST.localize(datetime(2026, 1, day, hour, minute, second))
+
+    def __call__(self):
+        return self.now
+
+
+results = []
+
+
+def check(name, condition, detail=""):
+    results.append(condition)
+    print(f"{'✅' if condition else '❌'} {name}{f' ({detail})' if detail else ''}")
+
+
+async def tick(scheduler):
+    """One scheduler loop iteration, as EODScheduler._loop does it"""
+    run_date = scheduler.due_run_date()
+    if run_date:
+        return await scheduler.run(TRIGGER_SCHEDULER, run_date=run_date)
+    return None
+
+
+async def main():
+    client = MongoClient(MONGO_URL)
+    client.drop_database(TEST_DB_NAME)
+    db = client[TEST_DB_NAME]
+    clock = Clock()
+    pipeline_dates = []
+    failing = {"on": False}
+
+    def pipeline(run):
+        pipeline_dates.append(run["runDate"])
+        if failing["on"]:
+            raise RuntimeError("simulated failure")
+        return {"runDate": run["runDate"]}
+
+    def worker():
+        # A fresh scheduler object per "process start"
+        scheduler = EODScheduler(db["eod_runs"], db["scheduler_leases"], pipeline, clock, lambda: "23:59")
+        scheduler.ensure_indexes()
+        return scheduler
+
+    try:
+        # 1. Day 1 runs at eodTime
+        scheduler = worker()
+        clock.set(1, 23, 58)
+        check("Not due before eodTime", scheduler.due_run_date() is None)
+        clock.set(1, 23, 59, 5)
+        run = await tick(scheduler)
+        check("Day 1 runs at eodTime", run and run["status"] == STATUS_COMPLETED and run["runDate"] == "2026-01-01")
+
+        # 2. Day 2 fails at 23:59:30, worker restarts after midnight
+        clock.set(2, 23, 59, 30)
+        failing["on"] = True
+        run = await tick(scheduler)
+        check("Day 2 run failed", run and run["status"] == "FAILED")
+        failing["on"] = False
+        scheduler = worker()
+        clock.set(3, 0, 2)
+        check("Day 2 still due after midnight", scheduler.due_run_date() == "2026-01-02", scheduler.due_run_date())
+        run = await tick(scheduler)
+        check("Day 2 retried under its own runDate",
+              run and run["runDate"] == "2026-01-02" and run["status"] == STATUS_COMPLETED and run["attempts"] == 2)
+
+        # 3. Worker down over day 3's eodTime
+        clock.set(4, 0, 10)
+        scheduler = worker()
+        check("Missed day 3 is due on day 4", scheduler.due_run_date() == "2026-01-03", scheduler.due_run_date())
+        run = await tick(scheduler)
+        check("Day 3 caught up", run and run["runDate"] == "2026-01-03" and run["status"] == STATUS_COMPLETED)
+        check("Day 4 not due before its eodTime", scheduler.due_run_date() is None)
+        clock.set(4, 23, 59, 1)
+        run = await tick(scheduler)
+        check("Day 4 runs at eodTime", run and run["runDate"] == "2026-01-04")
+
+        # 4. Nothing left
+        clock.set(5, 0, 1)
+        check("Nothing due once every date completed", scheduler.due_run_date() is None)
+        completed = sorted(doc["runDate"] for doc in db["eod_runs"].find({"status": STATUS_COMPLETED}))
+        check("Each date completed exactly once",
+              completed == ["2026-01-01", "2026-01-02", "2026-01-03", "2026-01-04"], completed)
+        print(f"📋 Pipeline calls: {pipeline_dates}")
+    finally:
+        client.drop_database(TEST_DB_NAME)
+
+    print(f"\n{'✅ All' if all(results) else '❌ Some'} checks passed ({sum(results)}/{len(results)})")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -58,10 +58,27 @@ export default function AdminReportsPage() {
       if (filters.planFilter && filters.planFilter !== "all") url += `&plan_id=${filters.planFilter}`;
       if (filters.statusFilter && filters.statusFilter !== "all") url += `&status=${filters.statusFilter}`;
 
-      const response = await axiosInstance.get(url, {
+      let response = await axiosInstance.get(url, {
         responseType: 'blob'
       });
 
+      // Large reports are rendered in the background: poll the job, then download the file
+      if (response.status === 202) {
+        const job = JSON.parse(await response.data.text()).data;
+        let status = job.status;
+        while (status === "QUEUED" || status === "RENDERING") {
+          await new Promise(resolve => setTimeout(resolve, 2000));
+          const poll = await axiosInstance.get(job.statusUrl);
+          status = poll.data.data.status;
+        }
+        if (status !== "DONE") {
+          throw new Error(`Report job ${job.jobId} ${status}`);
+        }
+        response = await axiosInstance.get(job.downloadUrl, {
+          responseType: 'blob'
+        });
+      }
+
       const blob = new Blob([response.data], {
         type: format === "excel"
           ? "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
@@ -1,6 +1,6 @@
 "use client";
 
-import { Users, ZoomIn, ZoomOut, Maximize, Network, X, Phone, Mail, Calendar, TrendingUp, Wallet, AlertTriangle, UserX } from "lucide-react";
+import { Users, ZoomIn, ZoomOut, Maximize, Network, X, Phone, Mail, Calendar, TrendingUp, Wallet, AlertTriangle, UserX, ChevronDown } from "lucide-react";
 import { cn } from "@/lib/utils";
 import { PageContainer, PageHeader } from "@/components/ui/page-components";
 import { Button } from "@/components/ui/button";
@@ -18,10 +18,25 @@ type TreeNode = {
   leftPV?: number;
   rightPV?: number;
   profilePhoto?: string | null;
+  leftCount?: number;
+  rightCount?: number;
+  hasChildren?: boolean;
   left?: TreeNode | null;
   right?: TreeNode | null;
 };
 
+// Levels loaded per request; deeper branches are fetched when expanded
+const TREE_DEPTH = 4;
+
+function replaceNode(tree: TreeNode, nodeId: string, subtree: TreeNode): TreeNode {
+  if (tree.id === nodeId) return subtree;
+  return {
+    ...tree,
+    left: tree.left ? replaceNode(tree.left, nodeId, subtree) : tree.left,
+    right: tree.right ? replaceNode(tree.right, nodeId, subtree) : tree.right,
+  };
+}
+
 type UserDetails = {
   id: string;
   name: string;
@@ -116,11 +131,13 @@ function TreeNodeComponent({
   isRoot = false,
   onNodeClick,
   onWeakReportClick,
+  onExpand,
 }: {
   node: TreeNode;
   isRoot?: boolean;
   onNodeClick: (nodeId: string) => void;
   onWeakReportClick: (nodeId: string) => void;
+  onExpand?: (nodeId: string) => void;
 }) {
   const isLeft = node.placement === "LEFT";
   const isRight = node.placement === "RIGHT";
@@ -203,6 +220,18 @@ function TreeNodeComponent({
         </button>
       </div>
 
+      {/* Not loaded yet: branch below the requested depth */}
+      {node.hasChildren && !node.left && !node.right && onExpand && (
+        <button
+          onClick={() => onExpand(node.id)}
+          className="mt-2 flex items-center gap-1 px-2.5 py-1 rounded-full text-[10px] font-medium border border-border bg-card text-muted-foreground hover:bg-muted transition-colors"
+          title="Load team"
+        >
+          <ChevronDown className="w-3 h-3" />
+          {node.leftCount ?? 0} L / {node.rightCount ?? 0} R
+        </button>
+      )}
+
       {/* Connection Lines */}
       {(node.left || node.right) && (
         <div className="flex flex-col items-center w-full">
@@ -230,7 +259,7 @@ function TreeNodeComponent({
                 <div className="h-6"></div>
 
                 {node.left ? (
-                  <TreeNodeComponent node={node.left} onNodeClick={onNodeClick} onWeakReportClick={onWeakReportClick} />
+                  <TreeNodeComponent node={node.left} onNodeClick={onNodeClick} onWeakReportClick={onWeakReportClick} onExpand={onExpand} />
                 ) : (
                   <EmptyNode label="LEFT" />
                 )}
@@ -242,7 +271,7 @@ function TreeNodeComponent({
                 <div className="h-6"></div>
 
                 {node.right ? (
-                  <TreeNodeComponent node={node.right} onNodeClick={onNodeClick} onWeakReportClick={onWeakReportClick} />
+                  <TreeNodeComponent node={node.right} onNodeClick={onNodeClick} onWeakReportClick={onWeakReportClick} onExpand={onExpand} />
                 ) : (
                   <EmptyNode label="RIGHT" />
                 )}
@@ -722,7 +751,7 @@ export default function BinaryTreePage() {
 
     const fetchTree = async () => {
       try {
-        const response = await axiosInstance.get('/api/user/team/tree');
+        const response = await axiosInstance.get('/api/user/team/tree', { params: { depth: TREE_DEPTH } });
         if (response.data.success) {
           setTreeData(response.data.data);
         }
@@ -751,6 +780,19 @@ export default function BinaryTreePage() {
     setWeakReportUserId(nodeId);
   };
 
+  const handleExpand = async (nodeId: string) => {
+    try {
+      const response = await axiosInstance.get('/api/user/team/tree', {
+        params: { root: nodeId, depth: TREE_DEPTH },
+      });
+      if (response.data.success && response.data.data) {
+        setTreeData((prev) => (prev ? replaceNode(prev, nodeId, response.data.data) : prev));
+      }
+    } catch (error) {
+      console.error("Error expanding tree:", error);
+    }
+  };
+
   if (loading) {
     return (
       <PageContainer maxWidth="full">
@@ -811,6 +853,7 @@ export default function BinaryTreePage() {
             isRoot={true}
             onNodeClick={handleNodeClick}
             onWeakReportClick={handleWeakReportClick}
+            onExpand={handleExpand}
           />
         </div>
       </div>
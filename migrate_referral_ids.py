@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Prepare the referral ID counter for sequence-allocated IDs.
+
+New members get IDs from the ``counters`` sequence (see
+backend/app/services/referral_ids.py). Existing IDs are kept as they are:
+the random 7-character IDs and the admin's ADMIN_REFERRAL_ID have a
+different length from sequence IDs, so they stay valid and can never be
+issued again.
+
+This script moves the counter past every sequence ID already present in
+users (the server does the same on startup when the counter is missing).
+Run it after restoring the users collection from a backup.
+
+Safe to re-run: the counter only ever moves forward.
+"""
+import os
+import sys
+from collections import Counter
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.referral_ids import ReferralIdAllocator, decode
+
+load_dotenv("backend/.env")
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "mlm_vsv_unite")
+
+
+def main():
+    client = MongoClient(MONGO_URL)
+    db = client[MONGO_DB_NAME]
+    users_collection = db["users"]
+
+    lengths = Counter(
+        len(user["referralId"])
+        for user in users_collection.find({"referralId": {"$type": "string"}}, {"referralId": 1})
+        if decode(user["referralId"]) is None
+    )
+    for length, count in sorted(lengths.items()):
+        print(f"📋 Legacy IDs of length {length}: {count}")
+
+    missing = users_collection.count_documents({"referralId": {"$not": {"$type": "string"}}})
+    if missing:
+        print(f"⚠️ Users without a referral ID: {missing}")
+
+    result = ReferralIdAllocator(db["counters"]).sync_counter(users_collection)
+    print(f"✅ Counter at {result['seq']}: {result['issued']} sequence IDs, {result['legacy']} legacy IDs kept")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Backfill materialized ancestor paths on the teams collection.
+
+Every team record gets an ``ancestors`` list (nearest first) used for
+single round-trip PV distribution. Records created by older code paths are
+also healed lazily on first use, but running this once after deploying
+avoids the one-off walk on the first activation per member.
+
+Safe to re-run: paths are recomputed from sponsorId/placement each time.
+"""
+import os
+import sys
+import time
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.tree_service import backfill_ancestor_paths
+
+load_dotenv("backend/.env")
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "mlm_vsv_unite")
+
+
+def main():
+    client = MongoClient(MONGO_URL)
+    db = client[MONGO_DB_NAME]
+    teams_collection = db["teams"]
+
+    total = teams_collection.count_documents({})
+    missing = teams_collection.count_documents({"ancestors": {"$exists": False}})
+    print(f"📊 Team records: {total} ({missing} without ancestor path)")
+
+    start = time.perf_counter()
+    written = backfill_ancestor_paths(teams_collection)
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ Ancestor paths written: {written} in {elapsed:.2f}s")
+
+    deepest = teams_collection.aggregate([
+        {"$project": {"depth": {"$size": {"$ifNull": ["$ancestors", []]}}}},
+        {"$sort": {"depth": -1}},
+        {"$limit": 1}
+    ])
+    for doc in deepest:
+        print(f"🌳 Deepest member is {doc['depth']} levels below the root")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Concurrent Signup Stress Test for VSV Unite MLM Platform
+
+Fires N parallel registrations into the same leg of one sponsor and then
+verifies the tree is still a valid chain:
+  - every registration succeeded
+  - no sponsor/side slot holds more than one member
+  - the new members form a single unbroken LEFT (or RIGHT) chain
+
+Run against a live backend (uvicorn with several workers to exercise the
+cross-process path):
+    python3 registration_stress_test.py [N] [LEFT|RIGHT]
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient
+
+BASE_URL = "http://localhost:8001/api"
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.getenv("MONGO_DB_NAME", "mlm_vsv_unite")
+SPONSOR_REFERRAL_ID = "VSV00001"
+
+
+def register_one(index, run_id, side):
+    payload = {
+        "name": f"Stress {run_id} {index}",
+        "username": f"stress_{run_id}_{index}",
+        "password": "Stress@123",
+        "mobile": f"9{random.randint(100000000, 999999999)}",
+        "referralId": SPONSOR_REFERRAL_ID,
+        "placement": side
+    }
+    start = time.perf_counter()
+    try:
+        response = requests.post(f"{BASE_URL}/auth/register", json=payload, timeout=60)
+        elapsed = time.perf_counter() - start
+        if response.status_code == 200:
+            return response.json()["user"]["id"], elapsed, None
+        return None, elapsed, f"{response.status_code}: {response.text[:120]}"
+    except Exception as e:
+        return None, time.perf_counter() - start, str(e)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    side = sys.argv[2].upper() if len(sys.argv) > 2 else "LEFT"
+    run_id = uuid.uuid4().hex[:6]
+
+    client = MongoClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    sponsor = db.users.find_one({"referralId": SPONSOR_REFERRAL_ID})
+    if not sponsor:
+        print(f"❌ Sponsor {SPONSOR_REFERRAL_ID} not found")
+        sys.exit(1)
+
+    print(f"🚀 Registering {count} users in parallel on the {side} leg of {SPONSOR_REFERRAL_ID}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        results = list(pool.map(lambda i: register_one(i, run_id, side), range(count)))
+    wall = time.perf_counter() - start
+
+    new_ids = {user_id for user_id, _, _ in results if user_id}
+    errors = [error for _, _, error in results if error]
+    latencies = sorted(elapsed for _, elapsed, _ in results)
+
+    print(f"   Completed in {wall:.2f}s ({count / wall:.1f} signups/s)")
+    print(f"   Latency p50={latencies[len(latencies) // 2] * 1000:.0f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.0f}ms")
+
+    passed = True
+    if errors:
+        passed = False
+        print(f"❌ {len(errors)} registrations failed, e.g. {errors[0]}")
+    else:
+        print(f"✅ All {count} registrations succeeded")
+
+    # 1. No slot may be taken twice
+    duplicates = list(db.teams.aggregate([
+        {"$group": {"_id": {"sponsorId": "$sponsorId", "placement": "$placement"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}}
+    ]))
+    if duplicates:
+        passed = False
+        print(f"❌ {len(duplicates)} sponsor/side slots hold more than one member")
+    else:
+        print("✅ No duplicate sponsor/side slots")
+
+    # 2. New members must hang off each other as one chain on the chosen side
+    teams = {t["userId"]: t for t in db.teams.find({"userId": {"$in": list(new_ids)}})}
+    wrong_side = [uid for uid, t in teams.items() if t["placement"] != side]
+    heads = [uid for uid, t in teams.items() if t["sponsorId"] not in new_ids]
+    if wrong_side:
+        passed = False
+        print(f"❌ {len(wrong_side)} members placed on the wrong side")
+    if len(heads) != 1:
+        passed = False
+        print(f"❌ Expected one chain head, found {len(heads)}")
+    else:
+        children = {t["sponsorId"]: uid for uid, t in teams.items()}
+        length, current = 1, heads[0]
+        while current in children:
+            current = children[current]
+            length += 1
+        if length == len(new_ids):
+            print(f"✅ {length} new members form a single {side} chain")
+        else:
+            passed = False
+            print(f"❌ Chain covers {length} of {len(new_ids)} new members")
+
+    print("🎉 PASSED" if passed else "💥 FAILED")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()